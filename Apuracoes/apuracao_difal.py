@@ -1,86 +1,96 @@
+import numpy as np
 import pandas as pd
+from instrumentacao import etapa
 
 UFS_BRASIL = ['AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA', 'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO']
 
-def gerar_resumo_uf(df_saida, writer, df_entrada=None):
+_INDICE_UFS = pd.Index(UFS_BRASIL)
+
+CABECALHO_RESUMO = ['UF', 'IEST (SUBST)', 'ST TOTAL', 'DIFAL TOTAL', 'FCP TOTAL', 'FCP-ST TOTAL']
+
+COLUNAS_VALOR = ['VAL-ICMS-ST', 'VAL-DIFAL', 'VAL-FCP-DEST', 'VAL-FCP-ST']
+COLUNAS_RESUMO = ['CFOP', 'UF_EMIT', 'UF_DEST', 'IE_SUBST', 'Situação Nota'] + COLUNAS_VALOR
+COLUNAS_SALDO = [
+    ('VAL-ICMS-ST', 'ST LÍQUIDO'),
+    ('DIFAL_PURO', 'DIFAL LÍQUIDO'),
+    ('VAL-FCP-DEST', 'FCP LÍQUIDO'),
+    ('VAL-FCP-ST', 'FCP-ST LÍQUIDO')
+]
+
+def _codigos_uf(ufs):
+    """Posição de cada UF em UFS_BRASIL (-1 para UF fora da lista, como 'EX')."""
+    return _INDICE_UFS.get_indexer(pd.Series(ufs).astype(object))
+
+def _tabela_uf(df, uf):
+    """Soma por UF (27 linhas, ordem de UFS_BRASIL) e a 1ª IE_SUBST preenchida de cada UF."""
+    codigos = _codigos_uf(uf)
+    valido = codigos >= 0
+    somas = df.loc[valido, COLUNAS_VALOR].groupby(codigos[valido]).sum().reindex(range(len(UFS_BRASIL)), fill_value=0.0)
+
+    ie = np.full(len(UFS_BRASIL), "", dtype=object)
+    com_ie = valido & (df['IE_SUBST'] != "").to_numpy() & df['IE_SUBST'].notna().to_numpy()
+    ufs_ie, primeira = np.unique(codigos[com_ie], return_index=True)
+    ie[ufs_ie] = df['IE_SUBST'].to_numpy(dtype=object)[com_ie][primeira].astype(str)
+
+    return pd.DataFrame({
+        'UF_DEST': UFS_BRASIL, 'IE_SUBST': ie,
+        'VAL-ICMS-ST': somas['VAL-ICMS-ST'].to_numpy(dtype=float),
+        # Subtraímos o FCP Destino do DIFAL Total (DIFAL + FCP) para ter o valor puro em colunas separadas
+        'DIFAL_PURO': (somas['VAL-DIFAL'] - somas['VAL-FCP-DEST']).to_numpy(dtype=float),
+        'VAL-FCP-DEST': somas['VAL-FCP-DEST'].to_numpy(dtype=float),
+        'VAL-FCP-ST': somas['VAL-FCP-ST'].to_numpy(dtype=float),
+    })
+
+def calcular_resumo_uf(df_saida, df_entrada=None):
+    """Tabelas por UF de SAÍDAS, ENTRADAS e SALDO (27 linhas cada, na ordem de UFS_BRASIL)."""
     if df_entrada is None: df_entrada = pd.DataFrame()
-    
-    # Une saídas e entradas para capturar devoluções de emissão própria
-    df_total = pd.concat([df_saida, df_entrada], ignore_index=True)
-    
+    colunas = [c for c in COLUNAS_RESUMO if c in df_saida.columns]
+
+    # Une saídas e entradas para capturar devoluções de emissão própria (só as colunas usadas)
+    df_total = pd.concat([df_saida[colunas], df_entrada[[c for c in colunas if c in df_entrada.columns]]], ignore_index=True)
+    for c in COLUNAS_VALOR:
+        if c not in df_total.columns: df_total[c] = 0.0
+    if 'IE_SUBST' not in df_total.columns: df_total['IE_SUBST'] = ""
+
     # FILTRO: Somente notas autorizadas
     if 'Situação Nota' in df_total.columns:
         df_total = df_total[df_total['Situação Nota'].astype(str).str.upper().str.contains('AUTORIZAD', na=False)]
 
-    def preparar_tabela(tipo):
-        base = pd.DataFrame({'UF_DEST': UFS_BRASIL})
-        df_temp = df_total.copy()
-        df_temp['PREFIXO'] = df_temp['CFOP'].astype(str).str.strip().str[0]
-        
-        if tipo == 'saida':
-            df_filtro = df_temp[df_temp['PREFIXO'].isin(['5', '6', '7'])]
-            col_uf_final = 'UF_DEST'
-        else:
-            df_filtro = df_temp[df_temp['PREFIXO'].isin(['1', '2', '3'])]
-            # Lógica de Devolução Própria: Se Emitente for SP, olha Destinatário
-            df_filtro['UF_AGRUPAR'] = df_filtro.apply(
-                lambda x: x['UF_DEST'] if x['UF_EMIT'] == 'SP' else x['UF_EMIT'], axis=1
-            )
-            col_uf_final = 'UF_AGRUPAR'
-
-        if df_filtro.empty:
-            for c in ['VAL-ICMS-ST', 'DIFAL_PURO', 'VAL-FCP-DEST', 'VAL-FCP-ST']: base[c] = 0.0
-            base['IE_SUBST'] = ""
-            return base
-
-        agrupado = df_filtro.groupby([col_uf_final]).agg({
-            'VAL-ICMS-ST': 'sum', 
-            'VAL-DIFAL': 'sum',      # Valor consolidado (DIFAL + FCP)
-            'VAL-FCP-DEST': 'sum',   # Valor do FCP Destino isolado
-            'VAL-FCP': 'sum', 
-            'VAL-FCP-ST': 'sum'
-        }).reset_index().rename(columns={col_uf_final: 'UF_DEST'})
-        
-        # --- LÓGICA DE SUBTRAÇÃO SOLICITADA ---
-        # Subtraímos o FCP Destino do DIFAL Total para ter o valor puro em colunas separadas
-        agrupado['DIFAL_PURO'] = agrupado['VAL-DIFAL'] - agrupado['VAL-FCP-DEST']
-        
-        final = pd.merge(base, agrupado, on='UF_DEST', how='left').fillna(0)
-        
-        # Mapeamento de IE para o destaque laranja e trava de saldo
-        ie_map = df_filtro[df_filtro['IE_SUBST'] != ""].groupby(col_uf_final)['IE_SUBST'].first().to_dict()
-        final['IE_SUBST'] = final['UF_DEST'].map(ie_map).fillna("").astype(str)
-        
-        return final[['UF_DEST', 'IE_SUBST', 'VAL-ICMS-ST', 'DIFAL_PURO', 'VAL-FCP-DEST', 'VAL-FCP-ST']]
-
-    res_s = preparar_tabela('saida')
-    res_e = preparar_tabela('entrada')
-
-    # SALDO (Regra: Só abate se houver IE_SUBST preenchida na Saída)
-    res_saldo = pd.DataFrame({'UF': UFS_BRASIL})
-    res_saldo['IE_SUBST'] = res_s['IE_SUBST']
-    
-    colunas_imposto = [
-        ('VAL-ICMS-ST', 'ST LÍQUIDO'), 
-        ('DIFAL_PURO', 'DIFAL LÍQUIDO'), 
-        ('VAL-FCP-DEST', 'FCP LÍQUIDO'), 
-        ('VAL-FCP-ST', 'FCP-ST LÍQUIDO')
-    ]
-
-    for c_xml, c_fin in colunas_imposto:
-        valores_saldo = []
-        for i in range(len(res_s)):
-            tem_ie = res_s.iloc[i]['IE_SUBST'] != ""
-            valor_saida = res_s.iloc[i][c_xml]
-            valor_entrada = res_e.iloc[i][c_xml]
-            
-            if tem_ie:
-                valores_saldo.append(valor_saida - valor_entrada)
-            else:
-                valores_saldo.append(valor_saida)
-        
-        res_saldo[c_fin] = valores_saldo
+    prefixo = df_total['CFOP'].astype(str).str.strip().str[0].to_numpy(dtype=object)
+    saida = np.isin(prefixo, ['5', '6', '7'])
+    entrada = np.isin(prefixo, ['1', '2', '3'])
+
+    res_s = _tabela_uf(df_total[saida], df_total['UF_DEST'][saida])
+    # Lógica de Devolução Própria: Se Emitente for SP, olha Destinatário
+    df_e = df_total[entrada]
+    uf_emit, uf_dest = df_e['UF_EMIT'].astype(object).to_numpy(), df_e['UF_DEST'].astype(object).to_numpy()
+    res_e = _tabela_uf(df_e, np.where(uf_emit == 'SP', uf_dest, uf_emit))
+
+    return res_s, res_e, calcular_saldo(res_s, res_e)
+
+def calcular_saldo(res_s, res_e):
+    """SALDO (Regra: Só abate se houver IE_SUBST preenchida na Saída)."""
+    tem_ie = res_s['IE_SUBST'].to_numpy() != ""
+    res_saldo = pd.DataFrame({'UF': UFS_BRASIL, 'IE_SUBST': res_s['IE_SUBST']})
+    for c_xml, c_fin in COLUNAS_SALDO:
+        s, e = res_s[c_xml].to_numpy(), res_e[c_xml].to_numpy()
+        res_saldo[c_fin] = np.where(tem_ie, s - e, s)
+    return res_saldo
 
+def tabela_resumo_uf(df_saida, df_entrada=None):
+    """As três tabelas do resumo empilhadas numa só (coluna TABELA), com o cabeçalho da aba DIFAL_ST_FECP."""
+    res_s, res_e, res_saldo = calcular_resumo_uf(df_saida, df_entrada)
+    return pd.concat([t.set_axis(CABECALHO_RESUMO, axis=1).assign(TABELA=nome)
+                      for t, nome in [(res_s, "SAIDAS"), (res_e, "ENTRADAS"), (res_saldo, "SALDO")]], ignore_index=True)
+
+def gerar_resumo_uf(df_saida, writer, df_entrada=None):
+    with etapa('apuracao_difal', linhas=len(df_saida) + (len(df_entrada) if df_entrada is not None else 0)):
+        resumo = calcular_resumo_uf(df_saida, df_entrada)
+    with etapa('excel:DIFAL_ST_FECP'):
+        escrever_resumo_uf(writer, *resumo)
+
+def escrever_resumo_uf(writer, res_s, res_e, res_saldo):
+    """Aba DIFAL_ST_FECP: SAÍDAS, ENTRADAS e SALDO lado a lado, com destaque das UFs com IE substituta."""
     # --- EXCEL ---
     workbook = writer.book
     worksheet = workbook.add_worksheet('DIFAL_ST_FECP')
@@ -95,24 +105,27 @@ def gerar_resumo_uf(df_saida, writer, df_entrada=None):
     f_orange_fill = workbook.add_format({'bg_color': '#FFDAB9', 'border': 1})
     f_total = workbook.add_format({'bold': True, 'bg_color': '#F2F2F2', 'border': 1, 'num_format': '#,##0.00'})
 
-    heads = ['UF', 'IEST (SUBST)', 'ST TOTAL', 'DIFAL TOTAL', 'FCP TOTAL', 'FCP-ST TOTAL']
+    heads = CABECALHO_RESUMO
 
-    for df_t, start_c, title in [(res_s, 0, "1. SAÍDAS"), (res_e, 7, "2. ENTRADAS"), (res_saldo, 14, "3. SALDO")]:
+    # As três tabelas ficam lado a lado e a aba é escrita em ordem de linha (relatório em constant_memory)
+    tabelas = [(res_s.values, 0, "1. SAÍDAS"), (res_e.values, 7, "2. ENTRADAS"), (res_saldo.values, 14, "3. SALDO")]
+    for _, start_c, title in tabelas:
         worksheet.merge_range(0, start_c, 0, start_c + 5, title, f_title)
+    for _, start_c, _ in tabelas:
         for i, h in enumerate(heads): worksheet.write(2, start_c + i, h, f_head)
-        
-        for r_idx, row in enumerate(df_t.values):
-            uf = str(row[0]).strip()
-            tem_ie = res_s.loc[res_s['UF_DEST'] == uf, 'IE_SUBST'].values[0] != ""
-            
-            for c_idx, val in enumerate(row):
-                fmt = f_orange_num if tem_ie and isinstance(val, (int, float)) else f_orange_fill if tem_ie else f_num if isinstance(val, (int, float)) else f_border
-                if c_idx == 1:
-                    worksheet.write_string(r_idx + 3, start_c + c_idx, str(val), fmt)
-                else:
-                    worksheet.write(r_idx + 3, start_c + c_idx, val, fmt)
-        
-        # Totais
+
+    # Destaque laranja: UF com IE_SUBST na saída (calculado uma vez, vale para as três tabelas)
+    tem_ie = res_s['IE_SUBST'].to_numpy() != ""
+    for r_idx in range(len(UFS_BRASIL)):
+        f_txt, f_val = (f_orange_fill, f_orange_num) if tem_ie[r_idx] else (f_border, f_num)
+        for valores, start_c, _ in tabelas:
+            row = valores[r_idx]
+            worksheet.write_string(r_idx + 3, start_c, str(row[0]), f_txt)
+            worksheet.write_string(r_idx + 3, start_c + 1, str(row[1]), f_txt)
+            worksheet.write_row(r_idx + 3, start_c + 2, [float(v) for v in row[2:]], f_val)
+
+    # Totais
+    for _, start_c, _ in tabelas:
         worksheet.write(30, start_c, "TOTAL GERAL", f_total)
         worksheet.write(30, start_c + 1, "", f_total)
         for i in range(2, 6):
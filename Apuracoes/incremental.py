@@ -0,0 +1,190 @@
+import os
+import pickle
+import sqlite3
+import hashlib
+import numpy as np
+import pandas as pd
+from cache_notas import PASTA_CACHE
+from exportacao_colunar import competencias
+from Auditorias.gabarito import caminho_gabarito
+from Auditorias.tipi import caminho_tipi
+from Auditorias.audit_icms import ncms_st_compra
+from Auditorias.auditoria_fundida import auditorias_saidas
+from Auditorias.motor_vetorial import gravar_aba
+from Apuracoes.apuracao_difal import UFS_BRASIL, calcular_resumo_uf, calcular_saldo, escrever_resumo_uf
+
+# --- APURAÇÃO INCREMENTAL (SÓ AS COMPETÊNCIAS QUE MUDARAM) ---
+# Por cliente e competência ficam gravados em disco: a impressão (hash) de cada nota que entrou na conta,
+# as tabelas por UF do resumo DIFAL/ST/FCP e as colunas de análise de cada aba de auditoria.
+# Numa nova rodada, só a competência com nota nova, removida ou alterada (itens, valores, situação)
+# é auditada de novo; as outras vêm do disco. As auditorias são linha a linha, então o resultado é o
+# mesmo de auditar tudo. Regime, gabarito, TIPI ou NCMs com ST nas compras diferentes invalidam o cliente todo.
+ARQUIVO_APURACAO = os.path.join(PASTA_CACHE, "apuracao.sqlite")
+VERSAO_APURACAO = 1
+ABAS_AUDITORIA = ['ICMS_AUDIT', 'IPI_AUDIT', 'PIS_COFINS_AUDIT', 'DIFAL_AUDIT']
+COLUNAS_TABELA_UF = ['UF_DEST', 'IE_SUBST', 'VAL-ICMS-ST', 'DIFAL_PURO', 'VAL-FCP-DEST', 'VAL-FCP-ST']
+
+_MISTURA = np.uint64(0x9E3779B97F4A7C15)
+
+def assinatura_contexto(cod_cliente, regime, df_xe):
+    """Tudo o que, fora a própria linha, muda o resultado das auditorias."""
+    arquivos = []
+    for caminho in (caminho_gabarito(cod_cliente), caminho_tipi()):
+        try: estado = os.stat(caminho); arquivos.append(f"{estado.st_mtime_ns}:{estado.st_size}")
+        except OSError: arquivos.append("-")
+    partes = [str(VERSAO_APURACAO), str(regime), *arquivos, ",".join(sorted(map(str, ncms_st_compra(df_xe))))]
+    return hashlib.blake2b("|".join(partes).encode(), digest_size=16).hexdigest()
+
+def identificar_itens(df):
+    """(chave, nº do item na nota) de cada linha: identifica o item entre uma rodada e outra."""
+    chave = df['CHAVE_ACESSO'].astype(str).to_numpy(dtype=object)
+    return chave, df.groupby('CHAVE_ACESSO', sort=False, observed=True).cumcount().to_numpy()
+
+def impressoes(df, comp, lado):
+    """Uma linha por nota: COMPETENCIA, CHAVE (com o lado, E/S) e o hash de todos os itens, na ordem."""
+    if df.empty: return pd.DataFrame({'COMPETENCIA': [], 'CHAVE': [], 'HASH': []})
+    chave, item = identificar_itens(df)
+    h = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    with np.errstate(over='ignore'):
+        h = pd.util.hash_array(h + item.astype(np.uint64) * _MISTURA)
+    codigos, notas = pd.factorize(chave)
+    ordem = np.argsort(codigos, kind='stable')
+    inicios = np.flatnonzero(np.r_[True, np.diff(codigos[ordem]) != 0])
+    with np.errstate(over='ignore'):
+        soma = np.add.reduceat(h[ordem], inicios) if len(ordem) else np.zeros(0, dtype=np.uint64)
+    comp_nota = comp.to_numpy(dtype=object)[ordem[inicios]]
+    return pd.DataFrame({'COMPETENCIA': comp_nota, 'CHAVE': lado + notas.astype(object)[codigos[ordem[inicios]]],
+                         'HASH': soma.view(np.int64)})
+
+class ApuracaoIncremental:
+    """
+    Agregados por (cliente, competência, UF), notas que os compõem e análises das abas, em SQLite.
+    Contexto (assinatura) diferente do gravado apaga tudo daquele cliente.
+    """
+    def __init__(self, cod_cliente, assinatura, caminho=ARQUIVO_APURACAO):
+        self.cliente = str(cod_cliente)
+        pasta = os.path.dirname(caminho)
+        if pasta: os.makedirs(pasta, exist_ok=True)
+        self.con = sqlite3.connect(caminho, timeout=30)
+        self.con.execute("PRAGMA journal_mode = WAL")
+        self.con.execute("CREATE TABLE IF NOT EXISTS contexto (cliente TEXT PRIMARY KEY, assinatura TEXT)")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS chaves (
+            cliente TEXT, competencia TEXT, chave TEXT, hash INTEGER, PRIMARY KEY (cliente, competencia, chave))""")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS resumo (
+            cliente TEXT, competencia TEXT, tabela TEXT, uf TEXT, ie TEXT, st REAL, difal REAL, fcp REAL, fcp_st REAL,
+            PRIMARY KEY (cliente, competencia, tabela, uf))""")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS auditorias (
+            cliente TEXT, competencia TEXT, aba TEXT, dados BLOB, PRIMARY KEY (cliente, competencia, aba))""")
+
+        gravada = self.con.execute("SELECT assinatura FROM contexto WHERE cliente = ?", (self.cliente,)).fetchone()
+        if gravada is None or gravada[0] != assinatura:
+            for tabela in ('chaves', 'resumo', 'auditorias'):
+                self.con.execute(f"DELETE FROM {tabela} WHERE cliente = ?", (self.cliente,))
+            self.con.execute("INSERT OR REPLACE INTO contexto VALUES (?, ?)", (self.cliente, assinatura))
+        self.con.commit()
+
+    def alteradas(self, atuais):
+        """Competências de `atuais` (saída de impressoes) cujo conjunto de notas/hashes difere do gravado."""
+        gravadas = pd.read_sql_query("SELECT competencia AS COMPETENCIA, chave AS CHAVE, hash AS HASH FROM chaves WHERE cliente = ?",
+                                     self.con, params=(self.cliente,))
+        gravadas = gravadas[gravadas['COMPETENCIA'].isin(atuais['COMPETENCIA'].unique())]
+        cruzado = atuais.merge(gravadas, on=['COMPETENCIA', 'CHAVE'], how='outer', suffixes=('', '_GRAVADO'), indicator=True)
+        mudou = (cruzado['_merge'] != 'both') | (cruzado['HASH'] != cruzado['HASH_GRAVADO'])
+        return set(cruzado.loc[mudou, 'COMPETENCIA'])
+
+    def gravar_competencia(self, competencia, notas, res_s, res_e, analises):
+        """
+        Substitui tudo o que estava gravado da competência numa transação própria: cada mês fica salvo inteiro
+        e a trava de escrita do banco não passa para as auditorias do mês seguinte.
+        """
+        args = (self.cliente, competencia)
+        # linhas montadas (e análises serializadas) antes de abrir a transação
+        chaves = [args + (c, int(h)) for c, h in zip(notas['CHAVE'], notas['HASH'])]
+        resumo = [args + (nome,) + tuple(l) for nome, tabela in (('SAIDAS', res_s), ('ENTRADAS', res_e))
+                  for l in tabela[COLUNAS_TABELA_UF].itertuples(index=False)]
+        auditorias = [args + (aba, pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)) for aba, df in analises.items()]
+        with self.con:
+            for tabela in ('chaves', 'resumo', 'auditorias'):
+                self.con.execute(f"DELETE FROM {tabela} WHERE cliente = ? AND competencia = ?", args)
+            self.con.executemany("INSERT INTO chaves VALUES (?, ?, ?, ?)", chaves)
+            self.con.executemany("INSERT INTO resumo VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", resumo)
+            self.con.executemany("INSERT INTO auditorias VALUES (?, ?, ?, ?)", auditorias)
+
+    def analises(self, aba, competencias_lidas):
+        for comp in competencias_lidas:
+            linha = self.con.execute("SELECT dados FROM auditorias WHERE cliente = ? AND competencia = ? AND aba = ?",
+                                     (self.cliente, comp, aba)).fetchone()
+            if linha: yield pickle.loads(linha[0])
+
+    def resumo(self, competencias_lidas):
+        """(res_s, res_e) somando as competências; a IE_SUBST de cada UF é a 1ª preenchida, na ordem das competências."""
+        marcas = ",".join("?" * len(competencias_lidas))
+        df = pd.read_sql_query(f"SELECT * FROM resumo WHERE cliente = ? AND competencia IN ({marcas}) ORDER BY competencia",
+                               self.con, params=(self.cliente, *competencias_lidas))
+        tabelas = []
+        for nome in ('SAIDAS', 'ENTRADAS'):
+            parte = df[df['tabela'] == nome]
+            somas = parte.groupby('uf')[['st', 'difal', 'fcp', 'fcp_st']].sum().reindex(UFS_BRASIL, fill_value=0.0)
+            ie = parte[parte['ie'] != ""].groupby('uf')['ie'].first().reindex(UFS_BRASIL).fillna("")
+            tabelas.append(pd.DataFrame({'UF_DEST': UFS_BRASIL, 'IE_SUBST': ie.to_numpy(dtype=object),
+                                         'VAL-ICMS-ST': somas['st'].to_numpy(), 'DIFAL_PURO': somas['difal'].to_numpy(),
+                                         'VAL-FCP-DEST': somas['fcp'].to_numpy(), 'VAL-FCP-ST': somas['fcp_st'].to_numpy()}))
+        return tuple(tabelas)
+
+    def salvar(self):
+        self.con.commit()
+
+    def fechar(self):
+        self.con.commit()
+        self.con.close()
+
+def _alinhar(partes, chave, item, linhas):
+    """Junta as análises gravadas (com _CHAVE/_ITEM) nas posições das `linhas` atuais."""
+    analise = pd.concat(partes, ignore_index=True)
+    destino = pd.MultiIndex.from_arrays([chave[linhas], item[linhas]])
+    posicoes = pd.MultiIndex.from_arrays([analise.pop('_CHAVE'), analise.pop('_ITEM')]).get_indexer(destino)
+    if (posicoes < 0).any(): raise RuntimeError("Apuração incremental inconsistente: apague o arquivo da apuração e rode de novo.")
+    return analise.iloc[posicoes].reset_index(drop=True)
+
+def processar_incremental(df_xs, writer, cod_cliente, regime="Lucro Real", df_xe=pd.DataFrame(), caminho=ARQUIVO_APURACAO,
+                          exportacao=None):
+    """
+    Mesmas abas de processar_auditorias + gerar_resumo_uf, auditando só as competências alteradas desde a
+    última rodada do cliente; com `exportacao`, as abas montadas também vão para o Parquet/Arrow.
+    Devolve {'recalculadas': [...], 'reaproveitadas': [...]}.
+    """
+    apuracao = ApuracaoIncremental(cod_cliente, assinatura_contexto(cod_cliente, regime, df_xe), caminho)
+    try:
+        comp_s, comp_e = competencias(df_xs), competencias(df_xe)
+        notas = pd.concat([impressoes(df_xs, comp_s, 'S'), impressoes(df_xe, comp_e, 'E')], ignore_index=True)
+        todas = sorted(notas['COMPETENCIA'].unique())
+        alteradas = apuracao.alteradas(notas)
+        chave, item = identificar_itens(df_xs)
+
+        for comp in sorted(alteradas):
+            no_mes = (comp_s == comp).to_numpy()
+            df_mes = df_xs[no_mes]
+            analises = {}
+            for aba, linhas, analise in auditorias_saidas(df_mes, cod_cliente, regime, df_xe):
+                pos = df_xs.index.get_indexer(linhas.index)
+                analises[aba] = analise.reset_index(drop=True).assign(_CHAVE=chave[pos], _ITEM=item[pos])
+            res_s, res_e, _ = calcular_resumo_uf(df_mes, df_xe[(comp_e == comp).to_numpy()] if not df_xe.empty else None)
+            apuracao.gravar_competencia(comp, notas[notas['COMPETENCIA'] == comp], res_s, res_e, analises)
+        apuracao.salvar()   # cada competência já foi gravada; aqui só a descarga final
+
+        # Abas completas: análises de todas as competências, na ordem das linhas atuais
+        comps_saida = sorted(comp_s.unique())
+        interestadual = (df_xs['UF_EMIT'] != df_xs['UF_DEST']).to_numpy()
+        for aba in ABAS_AUDITORIA:
+            linhas = interestadual if aba == 'DIFAL_AUDIT' else np.ones(len(df_xs), dtype=bool)
+            analise = _alinhar(list(apuracao.analises(aba, comps_saida)), chave, item, linhas)
+            analise = analise.set_axis(df_xs.index[linhas])
+            gravar_aba(writer, aba, df_xs[linhas], analise)
+            if exportacao is not None: exportacao.gravar_aba(aba, df_xs[linhas], analise)
+            del analise
+
+        res_s, res_e = apuracao.resumo(todas)
+        escrever_resumo_uf(writer, res_s, res_e, calcular_saldo(res_s, res_e))
+    finally:
+        apuracao.fechar()
+    return {'recalculadas': sorted(alteradas), 'reaproveitadas': [c for c in todas if c not in alteradas]}
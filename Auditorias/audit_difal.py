@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+from Auditorias.motor_vetorial import coluna, como_float, como_texto, arredondar, maximo_zero, montar_texto, gravar_aba
 
 # Tabela de Alíquotas Internas Atualizada (Base 2025/2026)
 ALIQUOTAS_INTERNAS = {
@@ -8,87 +10,84 @@ ALIQUOTAS_INTERNAS = {
     'SE': 19.0, 'SP': 18.0, 'TO': 20.0
 }
 
-def processar_difal(df, writer):
-    df_d = df.copy()
+# Mesma tabela como vetor: posição da UF -> alíquota (a última posição, 18%, vale para UF fora da tabela)
+_UFS_INTERNAS = pd.Index(list(ALIQUOTAS_INTERNAS))
+_VETOR_INTERNAS = np.array(list(ALIQUOTAS_INTERNAS.values()) + [18.0])
 
-    def audit_difal_detalhada(r):
-        # --- Dados do XML ---
-        uf_orig = str(r.get('UF_EMIT', '')).strip().upper()
-        uf_dest = str(r.get('UF_DEST', '')).strip().upper()
-        bc_icms = float(r.get('BC-ICMS', 0.0))
-        vlr_difal_xml = float(r.get('VAL-DIFAL', 0.0))
-        alq_inter_xml = float(r.get('ALQ-ICMS', 0.0))
-        
-        # O indicador de Inscrição Estadual (9 = Não Contribuinte)
-        # O Core precisa extrair essa tag, se não existir, usamos a lógica de UF
-        ind_ie_dest = str(r.get('INDIEDEST', '1')).strip() 
+# --- LISTA DE COLUNAS DE ANÁLISE ---
+ANALISES_DIFAL = [
+    'DIFAL_ALQ_INTERNA_DEST',
+    'DIFAL_%_ESPERADO',
+    'DIFAL_STATUS_DESTAQUE',
+    'DIFAL_DIAG_VALOR',
+    'DIFAL_VALOR_COMPLEMENTAR',
+    'DIFAL_AÇÃO_CORRETIVA',
+    'DIFAL_FUNDAMENTAÇÃO'
+]
 
-        # --- TRAVA DE SEGURANÇA (O CORAÇÃO DA MUDANÇA) ---
-        # Só há DIFAL se: For interestadual E Destinatário for Não Contribuinte (9)
-        e_interestadual = (uf_orig != uf_dest) and (uf_orig != "") and (uf_dest != "")
-        e_nao_contribuinte = (ind_ie_dest == '9')
+def aliquotas_internas(ufs):
+    """ALIQUOTAS_INTERNAS.get(uf, 18.0) para um vetor de UFs, via índice (sem dict por linha)."""
+    return _VETOR_INTERNAS[_UFS_INTERNAS.get_indexer(np.asarray(ufs, dtype=object))]
 
-        if not e_interestadual:
-            return pd.Series([0.0, 0.0, "✅ N/A", "✅ OK", 0.0, "Nenhuma", "Operação Interna."])
-        
-        if not e_nao_contribuinte:
-            return pd.Series([0.0, 0.0, "✅ N/A", "✅ OK", 0.0, "Nenhuma", "Destinatário Contribuinte (Isento de DIFAL EC 87/15)."])
+def auditar_difal(df):
+    """Colunas de análise do DIFAL para cada item de df (mesmo índice); só interestaduais para não contribuinte fazem conta."""
+    n = len(df)
+    # --- Dados do XML ---
+    uf_orig = pd.Series(como_texto(coluna(df, 'UF_EMIT', ''))).str.strip().str.upper().to_numpy(dtype=object)
+    uf_dest = pd.Series(como_texto(coluna(df, 'UF_DEST', ''))).str.strip().str.upper().to_numpy(dtype=object)
 
-        # --- Cálculos de Auditoria (Só chega aqui se for Não Contribuinte) ---
-        alq_interna_dest = ALIQUOTAS_INTERNAS.get(uf_dest, 18.0)
-        p_difal_esperado = max(0.0, alq_interna_dest - alq_inter_xml)
-        vlr_difal_esperado = round(bc_icms * (p_difal_esperado / 100), 2)
-        
-        # --- DIAGNÓSTICOS ---
-        status_destaque = "✅ OK"
-        if vlr_difal_xml <= 0 and vlr_difal_esperado > 0.01:
-            status_destaque = "❌ Falta Destaque DIFAL"
+    # O indicador de Inscrição Estadual (9 = Não Contribuinte)
+    # O Core precisa extrair essa tag, se não existir, usamos a lógica de UF
+    ind_ie_dest = pd.Series(como_texto(coluna(df, 'INDIEDEST', '1'))).str.strip().to_numpy(dtype=object)
 
-        dif_centavos = abs(vlr_difal_xml - vlr_difal_esperado)
-        if dif_centavos < 0.11: 
-            diag_difal = "✅ OK"
-            vlr_comp = 0.0
-        else:
-            diag_difal = "❌ Erro"
-            vlr_comp = max(0.0, round(vlr_difal_esperado - vlr_difal_xml, 2))
+    # --- TRAVA DE SEGURANÇA (O CORAÇÃO DA MUDANÇA) ---
+    # Só há DIFAL se: For interestadual E Destinatário for Não Contribuinte (9)
+    e_interestadual = (uf_orig != uf_dest) & (uf_orig != "") & (uf_dest != "")
+    calcula = e_interestadual & (ind_ie_dest == '9')
 
-        # --- AÇÃO CORRETIVA ---
-        acao = "Nenhuma"
-        motivo = f"DIFAL em conformidade para consumidor final em {uf_dest}."
+    alq_interna_dest = np.zeros(n); p_difal_esperado = np.zeros(n); vlr_comp = np.zeros(n)
+    status_destaque = np.full(n, "✅ N/A", dtype=object); diag_difal = np.full(n, "✅ OK", dtype=object)
+    acao = np.full(n, "Nenhuma", dtype=object)
+    motivo = np.where(e_interestadual, "Destinatário Contribuinte (Isento de DIFAL EC 87/15).", "Operação Interna.").astype(object)
+
+    if calcula.any():
+        # --- Cálculos de Auditoria (Só para Não Contribuinte) ---
+        linhas = df[calcula]
+        uf = uf_dest[calcula]
+        bc_icms = como_float(linhas, 'BC-ICMS')
+        vlr_difal_xml = como_float(linhas, 'VAL-DIFAL')
+        alq_inter_xml = como_float(linhas, 'ALQ-ICMS')
 
-        if vlr_comp > 0:
-            acao = "Gerar Guia GNRE / NF Complementar"
-            motivo = f"Diferença de R$ {vlr_comp} para a UF {uf_dest}. Alíquota interna de {alq_interna_dest}%."
-        elif status_destaque == "❌ Falta Destaque DIFAL":
-            acao = "Emitir NF Complementar"
-            motivo = f"Consumidor Final em {uf_dest} exige DIFAL."
+        alq = aliquotas_internas(uf)
+        p_esp = maximo_zero(alq - alq_inter_xml)
+        vlr_difal_esperado = arredondar(bc_icms * (p_esp / 100), 2)
 
-        return pd.Series([
-            alq_interna_dest, p_difal_esperado, status_destaque, 
-            diag_difal, vlr_comp, acao, motivo
-        ])
+        # --- DIAGNÓSTICOS ---
+        with np.errstate(invalid='ignore'):
+            falta_destaque = (vlr_difal_xml <= 0) & (vlr_difal_esperado > 0.01)
+            dentro_tolerancia = np.abs(vlr_difal_xml - vlr_difal_esperado) < 0.11
+        comp = np.where(dentro_tolerancia, 0.0, maximo_zero(arredondar(vlr_difal_esperado - vlr_difal_xml, 2)))
+
+        # --- AÇÃO CORRETIVA ---
+        condicoes = [comp > 0, falta_destaque]
+        alq_interna_dest[calcula] = alq; p_difal_esperado[calcula] = p_esp; vlr_comp[calcula] = comp
+        status_destaque[calcula] = np.where(falta_destaque, "❌ Falta Destaque DIFAL", "✅ OK")
+        diag_difal[calcula] = np.where(dentro_tolerancia, "✅ OK", "❌ Erro")
+        acao[calcula] = np.select(condicoes, ["Gerar Guia GNRE / NF Complementar", "Emitir NF Complementar"], default="Nenhuma")
+        motivo[calcula] = np.select(condicoes, [
+            montar_texto("Diferença de R$ ", como_texto(comp), " para a UF ", uf, ". Alíquota interna de ", como_texto(alq), "%."),
+            montar_texto("Consumidor Final em ", uf, " exige DIFAL."),
+        ], default=montar_texto("DIFAL em conformidade para consumidor final em ", uf, "."))
 
-    # --- LISTA DE COLUNAS DE ANÁLISE ---
-    analises_nomes = [
-        'DIFAL_ALQ_INTERNA_DEST',
-        'DIFAL_%_ESPERADO',
-        'DIFAL_STATUS_DESTAQUE', 
-        'DIFAL_DIAG_VALOR', 
-        'DIFAL_VALOR_COMPLEMENTAR', 
-        'DIFAL_AÇÃO_CORRETIVA', 
-        'DIFAL_FUNDAMENTAÇÃO'
-    ]
-    
-    df_d[analises_nomes] = df_d.apply(audit_difal_detalhada, axis=1)
+    return pd.DataFrame({
+        'DIFAL_ALQ_INTERNA_DEST': alq_interna_dest, 'DIFAL_%_ESPERADO': p_difal_esperado,
+        'DIFAL_STATUS_DESTAQUE': status_destaque, 'DIFAL_DIAG_VALOR': diag_difal,
+        'DIFAL_VALOR_COMPLEMENTAR': vlr_comp, 'DIFAL_AÇÃO_CORRETIVA': acao, 'DIFAL_FUNDAMENTAÇÃO': motivo,
+    }, index=df.index, columns=ANALISES_DIFAL)
 
-    # --- REORGANIZAÇÃO ---
-    df_final = df_d[df_d['UF_EMIT'] != df_d['UF_DEST']].copy()
-    
-    if not df_final.empty:
-        cols_xml = [c for c in df_final.columns if c != 'Situação Nota' and c not in analises_nomes]
-        col_status = ['Situação Nota'] if 'Situação Nota' in df_final.columns else []
-        df_export = pd.concat([df_final[cols_xml], df_final[col_status], df_final[analises_nomes]], axis=1)
-    else:
-        df_export = pd.DataFrame(columns=list(df.columns) + analises_nomes)
+def processar_difal(df, writer):
+    # --- FILTRO PRIMEIRO: só as operações interestaduais vão para a aba ---
+    df_inter = df[df['UF_EMIT'] != df['UF_DEST']]
 
-    df_export.to_excel(writer, sheet_name='DIFAL_AUDIT', index=False)
+    # --- REORGANIZAÇÃO: [XML] + [SITUAÇÃO] + [ANÁLISES] (sem interestaduais, só o cabeçalho) ---
+    gravar_aba(writer, 'DIFAL_AUDIT', df_inter, auditar_difal(df_inter))
@@ -1,101 +1,90 @@
+import numpy as np
 import pandas as pd
-import os
+from Auditorias.gabarito import carregar_gabarito, chaves_ncm
+from Auditorias.tipi import carregar_tipi
+from Auditorias.motor_vetorial import coluna, como_float, como_texto, arredondar, montar_texto, gravar_aba
 
-def processar_ipi(df, writer, cod_cliente=None):
-    df_ipi = df.copy()
+# --- LISTA DE COLUNAS DE ANÁLISE ---
+ANALISES_IPI = [
+    'IPI_CST_ESPERADA', 'IPI_ALQUOTA_ESPERADA', 'IPI_STATUS_DESTAQUE',
+    'IPI_DIAG_ALQUOTA', 'VALOR_IPI_COMPLEMENTAR', 'IPI_DIAG_CST',
+    'AÇÃO_CORRETIVA_IPI', 'FUNDAMENTAÇÃO_IPI'
+]
 
-    # --- 1. CARREGAMENTO DA BASE TRIBUTÁRIA (GABARITO) ---
-    caminho_base = f"Bases_Tributárias/{cod_cliente}-Bases_Tributarias.xlsx"
-    base_gabarito = pd.DataFrame()
-    
-    if cod_cliente and os.path.exists(caminho_base):
-        try:
-            # Lemos como string para não perder zeros à esquerda no match do NCM
-            base_gabarito = pd.read_excel(caminho_base, dtype=str)
-            base_gabarito.columns = [str(c).strip().upper() for c in base_gabarito.columns]
-            if 'NCM' in base_gabarito.columns:
-                base_gabarito['NCM'] = base_gabarito['NCM'].str.replace(r'\D', '', regex=True).str.strip().str.zfill(8)
-        except:
-            pass
+def _cst_gabarito(v):
+    return str(v).strip().split('.')[0].zfill(2)
 
-    def audit_ipi_completa(r):
-        # --- Dados do XML ---
-        ncm = str(r.get('NCM', '')).strip().zfill(8)
-        cst_xml = str(r.get('CST-IPI', '')).strip().zfill(2)
-        alq_xml = float(r.get('ALQ-IPI', 0.0))
-        vlr_ipi_xml = float(r.get('VLR-IPI', 0.0))
-        vprod = float(r.get('VPROD', 0.0))
-        
-        # --- Gabarito e Regras de Esperado (O Cérebro do IPI) ---
-        cst_esp = "50" # Saída Tributada (Padrão)
-        alq_esp = 0.0
-        
-        # PASSO 1: CONSULTA À BASE DE DADOS (PRIORIDADE)
-        if not base_gabarito.empty and ncm in base_gabarito['NCM'].values:
-            g = base_gabarito[base_gabarito['NCM'] == ncm].iloc[0]
-            
-            # Mapeamento dinâmico para CST IPI
-            col_cst_gab = [c for c in base_gabarito.columns if 'CST' in c and 'IPI' in c]
-            if col_cst_gab:
-                cst_esp = str(g[col_cst_gab[0]]).strip().split('.')[0].zfill(2)
-                
-            # Mapeamento dinâmico para ALIQ IPI
-            col_alq_gab = [c for c in base_gabarito.columns if 'ALQ' in c and 'IPI' in c]
-            if col_alq_gab:
-                alq_esp = float(g[col_alq_gab[0]])
+def auditar_ipi(df, cod_cliente=None):
+    """Calcula as colunas de análise do IPI para todos os itens de uma vez (mesmo índice de df)."""
+    # --- 1. BASE TRIBUTÁRIA (GABARITO) - MESMA LEITURA COMPARTILHADA COM AS DEMAIS AUDITORIAS ---
+    gabarito = carregar_gabarito(cod_cliente)
+    col_cst_gab = [c for c in gabarito.colunas if 'CST' in c and 'IPI' in c]
+    col_alq_gab = [c for c in gabarito.colunas if 'ALQ' in c and 'IPI' in c]
 
-        # --- CÁLCULOS DE AUDITORIA ---
-        vlr_ipi_devido = round(vprod * (alq_esp / 100), 2)
-        vlr_complementar = round(vlr_ipi_devido - vlr_ipi_xml, 2)
-        vlr_comp_final = vlr_complementar if vlr_complementar > 0.01 else 0.0
+    # --- Dados do XML ---
+    ncm_xml = coluna(df, 'NCM', '')
+    ncm = pd.Series(como_texto(ncm_xml)).str.strip().str.zfill(8).to_numpy(dtype=object)
+    cst_xml = pd.Series(como_texto(coluna(df, 'CST-IPI', ''))).str.strip().str.zfill(2).to_numpy(dtype=object)
+    alq_xml = como_float(df, 'ALQ-IPI')
+    vlr_ipi_xml = como_float(df, 'VLR-IPI')
+    vprod = como_float(df, 'VPROD')
 
-        # --- DIAGNÓSTICOS ---
-        diag_alq = "✅ OK" if abs(alq_xml - alq_esp) < 0.01 else f"❌ Erro (XML: {alq_xml}% | Esp: {alq_esp}%)"
-        diag_cst = "✅ OK" if cst_xml == cst_esp else f"❌ Divergente (XML: {cst_xml} | Esp: {cst_esp})"
+    # --- Gabarito e Regras de Esperado (O Cérebro do IPI) ---
+    # PASSO 1: CONSULTA À BASE DE DADOS (PRIORIDADE) - UM ÚNICO JOIN PELO NCM
+    posicoes = gabarito.posicoes(ncm_xml)
+    cst_esp = np.full(len(df), "50", dtype=object)   # Saída Tributada (Padrão)
+    alq_esp = np.zeros(len(df))
+    if col_cst_gab:
+        do_gabarito = gabarito.valores(col_cst_gab[0], posicoes, _cst_gabarito)
+        cst_esp[posicoes >= 0] = do_gabarito[posicoes >= 0]
+    if col_alq_gab:
+        do_gabarito = gabarito.valores(col_alq_gab[0], posicoes, float)
+        alq_esp[posicoes >= 0] = do_gabarito[posicoes >= 0].astype(float)
 
-        status_destaque = "✅ OK"
-        if cst_esp in ['50'] and vlr_ipi_xml <= 0 and alq_esp > 0: 
-            status_destaque = "❌ Falta Destaque IPI"
-        elif cst_esp in ['52', '53'] and vlr_ipi_xml > 0: 
-            status_destaque = "⚠️ Destaque Indevido IPI"
+    # PASSO 2: NCM SEM ALÍQUOTA NO GABARITO (FORA DELE OU CÉLULA EM BRANCO) - VALE A TIPI (NT OU FORA DA TABELA CONTINUA 0%)
+    sem_gabarito = ((posicoes < 0) | np.isnan(alq_esp)) if col_alq_gab else np.ones(len(df), dtype=bool)
+    if sem_gabarito.any():
+        ncm_tipi = chaves_ncm(pd.Series(np.asarray(ncm_xml, dtype=object)[sem_gabarito]))
+        alq_esp[sem_gabarito] = np.nan_to_num(carregar_tipi().aliquota(ncm_tipi), nan=0.0)
 
-        # --- AÇÃO CORRETIVA ---
-        acao = "Nenhuma"
-        fundamentacao = f"IPI em conformidade com as regras do NCM {ncm}."
+    # --- CÁLCULOS DE AUDITORIA ---
+    vlr_ipi_devido = arredondar(vprod * (alq_esp / 100), 2)
+    vlr_complementar = arredondar(vlr_ipi_devido - vlr_ipi_xml, 2)
+    with np.errstate(invalid='ignore'):
+        vlr_comp_final = np.where(vlr_complementar > 0.01, vlr_complementar, 0.0)
+        alq_ok = np.abs(alq_xml - alq_esp) < 0.01
+        alq_superior = (alq_xml > alq_esp) & (alq_esp > 0)
 
-        if vlr_comp_final > 0:
-            acao = "Emitir NF Complementar"
-            fundamentacao = f"Detectada insuficiência de IPI: R$ {vlr_comp_final}."
-        elif alq_xml > alq_esp and alq_esp > 0:
-            acao = "Recuperar Imposto"
-            fundamentacao = f"Alíquota XML ({alq_xml}%) superior à legal ({alq_esp}%)."
-        elif "❌" in diag_cst:
-            acao = "Registrar CC-e"
-            fundamentacao = f"A CST {cst_xml} informada não condiz com a operação esperada {cst_esp}."
+    # --- DIAGNÓSTICOS ---
+    alq_xml_txt, alq_esp_txt = como_texto(alq_xml), como_texto(alq_esp)
+    cst_esp_txt = como_texto(pd.Series(cst_esp, dtype=object))
+    cst_ok = cst_xml == cst_esp
+    diag_alq = np.where(alq_ok, "✅ OK", montar_texto("❌ Erro (XML: ", alq_xml_txt, "% | Esp: ", alq_esp_txt, "%)"))
+    diag_cst = np.where(cst_ok, "✅ OK", montar_texto("❌ Divergente (XML: ", cst_xml, " | Esp: ", cst_esp_txt, ")"))
 
-        return pd.Series([
-            cst_esp, alq_esp, status_destaque, diag_alq, vlr_comp_final, diag_cst, acao, fundamentacao
-        ])
+    with np.errstate(invalid='ignore'):
+        status_destaque = np.select(
+            [(cst_esp == '50') & (vlr_ipi_xml <= 0) & (alq_esp > 0), np.isin(cst_esp, ['52', '53']) & (vlr_ipi_xml > 0)],
+            ["❌ Falta Destaque IPI", "⚠️ Destaque Indevido IPI"], default="✅ OK")
 
-    # --- LISTA DE COLUNAS DE ANÁLISE ---
-    analises_nomes = [
-        'IPI_CST_ESPERADA', 'IPI_ALQUOTA_ESPERADA', 'IPI_STATUS_DESTAQUE', 
-        'IPI_DIAG_ALQUOTA', 'VALOR_IPI_COMPLEMENTAR', 'IPI_DIAG_CST', 
-        'AÇÃO_CORRETIVA_IPI', 'FUNDAMENTAÇÃO_IPI'
-    ]
-    
-    # Aplica a inteligência
-    df_ipi[analises_nomes] = df_ipi.apply(audit_ipi_completa, axis=1)
+    # --- AÇÃO CORRETIVA ---
+    condicoes = [vlr_comp_final > 0, alq_superior, ~cst_ok]
+    acao = np.select(condicoes, ["Emitir NF Complementar", "Recuperar Imposto", "Registrar CC-e"], default="Nenhuma")
+    fundamentacao = np.select(condicoes, [
+        montar_texto("Detectada insuficiência de IPI: R$ ", como_texto(vlr_comp_final), "."),
+        montar_texto("Alíquota XML (", alq_xml_txt, "%) superior à legal (", alq_esp_txt, "%)."),
+        montar_texto("A CST ", cst_xml, " informada não condiz com a operação esperada ", cst_esp_txt, "."),
+    ], default=montar_texto("IPI em conformidade com as regras do NCM ", ncm, "."))
+
+    return pd.DataFrame({
+        'IPI_CST_ESPERADA': cst_esp, 'IPI_ALQUOTA_ESPERADA': alq_esp, 'IPI_STATUS_DESTAQUE': status_destaque,
+        'IPI_DIAG_ALQUOTA': diag_alq, 'VALOR_IPI_COMPLEMENTAR': vlr_comp_final, 'IPI_DIAG_CST': diag_cst,
+        'AÇÃO_CORRETIVA_IPI': acao, 'FUNDAMENTAÇÃO_IPI': fundamentacao,
+    }, index=df.index, columns=ANALISES_IPI)
 
-    # --- REORGANIZAÇÃO RIGOROSA DAS COLUNAS ---
-    # 1. Identificamos as tags originais do XML (removendo a situação para não duplicar)
-    cols_originais = [c for c in df.columns if c != 'Situação Nota']
-    
-    # 2. Identificamos o Status de Autenticidade
-    cols_status = ['Situação Nota'] if 'Situação Nota' in df.columns else []
-    
-    # 3. Montamos o DataFrame final: [XML] + [SITUAÇÃO] + [ANÁLISES]
-    df_final = pd.concat([df_ipi[cols_originais], df_ipi[cols_status], df_ipi[analises_nomes]], axis=1)
+def processar_ipi(df, writer, cod_cliente=None):
+    # Aplica a inteligência
+    df_analise = auditar_ipi(df, cod_cliente)
 
-    # Gravação no Excel
-    df_final.to_excel(writer, sheet_name='IPI_AUDIT', index=False)
+    # --- REORGANIZAÇÃO RIGOROSA DAS COLUNAS: [XML] + [SITUAÇÃO] + [ANÁLISES] ---
+    gravar_aba(writer, 'IPI_AUDIT', df, df_analise)
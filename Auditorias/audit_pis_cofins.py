@@ -1,106 +1,113 @@
+import numpy as np
 import pandas as pd
-import os
+from Auditorias.gabarito import carregar_gabarito
+from Auditorias.motor_vetorial import coluna, como_float, como_texto, arredondar, maximo_zero, montar_texto, gravar_aba
+
+# --- DEFINIÇÃO DE ALÍQUOTA POR REGIME (PIS, COFINS, CST) ---
+ALIQUOTAS_REGIME = {"Presumido": (0.65, 3.0, "01"), "Real": (1.65, 7.6, "01")}
+
+# --- LISTA DE COLUNAS DE ANÁLISE ---
+ANALISES_PC = [
+    'CST_PC_ESPERADA', 'ALQ_PIS_ESP', 'ALQ_COF_ESP',
+    'PIS_DIAG_CST', 'PIS_DIAG_VALOR',
+    'COFINS_DIAG_CST', 'COFINS_DIAG_VALOR',
+    'AÇÃO_CORRETIVA_PC', 'FUNDAMENTAÇÃO_PC'
+]
+
+def _cst_gabarito(v):
+    return str(v).strip().split('.')[0].zfill(2)
+
+def aliquotas_regime(regime):
+    """(PIS, COFINS, CST) padrão do regime; qualquer coisa que não seja Presumido cai no Lucro Real."""
+    return ALIQUOTAS_REGIME["Presumido"] if "Presumido" in str(regime) else ALIQUOTAS_REGIME["Real"]
+
+def auditar_pc(df, cod_cliente=None, regime="Lucro Real"):
+    """
+    Calcula as colunas de análise de PIS/COFINS para todos os itens de uma vez (mesmo índice de df).
+    `regime` pode ser um texto único ou uma coluna alinhada a df (um regime por item).
+    """
+    n = len(df)
+    # --- 1. BASE TRIBUTÁRIA (GABARITO) - MESMA LEITURA COMPARTILHADA COM AS DEMAIS AUDITORIAS ---
+    gabarito = carregar_gabarito(cod_cliente)
+    # Busca dinâmica de colunas no seu Excel
+    col_cst = [c for c in gabarito.colunas if 'CST' in c and ('PC' in c or 'PIS' in c)]
+    col_pis = [c for c in gabarito.colunas if 'ALQ' in c and 'PIS' in c]
+    col_cof = [c for c in gabarito.colunas if 'ALQ' in c and 'COF' in c]
+
+    # --- Dados do XML ---
+    ncm_xml = coluna(df, 'NCM', '')
+    ncm = pd.Series(como_texto(ncm_xml)).str.strip().str.zfill(8).to_numpy(dtype=object)
+    cst_pis_xml = pd.Series(como_texto(coluna(df, 'CST-PIS', ''))).str.strip().str.zfill(2).to_numpy(dtype=object)
+    cst_cof_xml = pd.Series(como_texto(coluna(df, 'CST-COFINS', ''))).str.strip().str.zfill(2).to_numpy(dtype=object)
+    vlr_pis_xml = como_float(df, 'VLR-PIS')
+    vlr_cof_xml = como_float(df, 'VLR-COFINS')
+    vprod = como_float(df, 'VPROD')
+
+    # --- DEFINIÇÃO DE ALÍQUOTA POR REGIME (UMA VEZ POR REGIME DISTINTO) ---
+    if isinstance(regime, str) or np.ndim(regime) == 0:
+        regime_txt = np.full(n, str(regime), dtype=object)
+    else:
+        regime_txt = como_texto(pd.Series(np.asarray(regime, dtype=object)))
+    codigos, regimes = pd.factorize(regime_txt)
+    padroes = [aliquotas_regime(r) for r in regimes]
+    alq_pis_esp = np.array([p[0] for p in padroes], dtype=float)[codigos]
+    alq_cof_esp = np.array([p[1] for p in padroes], dtype=float)[codigos]
+    cst_pc_esp = np.array([p[2] for p in padroes], dtype=object)[codigos]
+
+    # SOBREPOSIÇÃO PELO GABARITO (Monofásicos, Alíquota Zero, etc.) - UM ÚNICO JOIN PELO NCM
+    posicoes = gabarito.posicoes(ncm_xml)
+    achou = posicoes >= 0
+    if col_cst: cst_pc_esp[achou] = gabarito.valores(col_cst[0], posicoes, _cst_gabarito)[achou]
+    if col_pis: alq_pis_esp[achou] = gabarito.valores(col_pis[0], posicoes, float)[achou].astype(float)
+    if col_cof: alq_cof_esp[achou] = gabarito.valores(col_cof[0], posicoes, float)[achou].astype(float)
+
+    # --- CÁLCULOS DE CONFERÊNCIA ---
+    vlr_pis_dev = arredondar(vprod * (alq_pis_esp / 100), 2)
+    vlr_cof_dev = arredondar(vprod * (alq_cof_esp / 100), 2)
+
+    comp_pis = maximo_zero(arredondar(vlr_pis_dev - vlr_pis_xml, 2))
+    comp_cof = maximo_zero(arredondar(vlr_cof_dev - vlr_cof_xml, 2))
+
+    # --- DIAGNÓSTICOS ---
+    cst_esp_txt = como_texto(pd.Series(cst_pc_esp, dtype=object))
+    comp_pis_txt, comp_cof_txt = como_texto(comp_pis), como_texto(comp_cof)
+    cst_pis_ok, cst_cof_ok = cst_pis_xml == cst_pc_esp, cst_cof_xml == cst_pc_esp
+    falta_pis, falta_cof = comp_pis > 0.01, comp_cof > 0.01
+
+    diag_cst_pis = np.where(cst_pis_ok, "✅ OK", montar_texto("❌ Erro (XML: ", cst_pis_xml, " | Esp: ", cst_esp_txt, ")"))
+    diag_vlr_pis = np.where(falta_pis, montar_texto("❌ Faltou R$ ", comp_pis_txt), "✅ OK")
+
+    diag_cst_cof = np.where(cst_cof_ok, "✅ OK", montar_texto("❌ Erro (XML: ", cst_cof_xml, " | Esp: ", cst_esp_txt, ")"))
+    diag_vlr_cof = np.where(falta_cof, montar_texto("❌ Faltou R$ ", comp_cof_txt), "✅ OK")
+
+    # --- AÇÃO CORRETIVA ---
+    condicoes = [falta_pis | falta_cof, ~(cst_pis_ok & cst_cof_ok)]
+    acao = np.select(condicoes, ["NF Complementar / Guia de Ajuste", "Registrar CC-e"], default="Nenhuma")
+    motivo = np.select(condicoes, [
+        montar_texto("Recolhimento insuficiente no ", regime_txt, ". Dif PIS: ", comp_pis_txt, " | Dif COFINS: ", comp_cof_txt, "."),
+        montar_texto("CST informado difere do esperado (", cst_esp_txt, ") para este NCM."),
+    ], default=montar_texto("PIS/COFINS em conformidade para ", regime_txt, " e NCM ", ncm, "."))
+
+    return pd.DataFrame({
+        'CST_PC_ESPERADA': cst_pc_esp, 'ALQ_PIS_ESP': alq_pis_esp, 'ALQ_COF_ESP': alq_cof_esp,
+        'PIS_DIAG_CST': diag_cst_pis, 'PIS_DIAG_VALOR': diag_vlr_pis,
+        'COFINS_DIAG_CST': diag_cst_cof, 'COFINS_DIAG_VALOR': diag_vlr_cof,
+        'AÇÃO_CORRETIVA_PC': acao, 'FUNDAMENTAÇÃO_PC': motivo,
+    }, index=df.index, columns=ANALISES_PC)
+
+def auditar_pc_clientes(df, coluna_cliente, regimes):
+    """
+    Lote com vários clientes: cada cliente usa o próprio gabarito e o próprio regime
+    (`regimes` é um dict cliente -> regime). Devolve as análises no mesmo índice/ordem de df.
+    """
+    partes = [auditar_pc(grupo, cod, regimes.get(cod, "Lucro Real"))
+              for cod, grupo in df.groupby(coluna_cliente, sort=False, dropna=False)]
+    if not partes: return pd.DataFrame(columns=ANALISES_PC, index=df.index)
+    return pd.concat(partes).reindex(df.index)
 
 def processar_pc(df, writer, cod_cliente=None, regime="Lucro Real"):
-    df_pc = df.copy()
-
-    # --- 1. CARREGAMENTO DA BASE TRIBUTÁRIA (GABARITO) ---
-    caminho_base = f"Bases_Tributárias/{cod_cliente}-Bases_Tributarias.xlsx"
-    base_gabarito = pd.DataFrame()
-    if cod_cliente and os.path.exists(caminho_base):
-        try:
-            # Lemos como string para garantir match do NCM (texto puro)
-            base_gabarito = pd.read_excel(caminho_base, dtype=str)
-            base_gabarito.columns = [str(c).strip().upper() for c in base_gabarito.columns]
-            if 'NCM' in base_gabarito.columns:
-                base_gabarito['NCM'] = base_gabarito['NCM'].str.replace(r'\D', '', regex=True).str.strip().str.zfill(8)
-        except:
-            pass
-
-    def audit_pc_completa(r):
-        # --- Dados do XML ---
-        ncm = str(r.get('NCM', '')).strip().zfill(8)
-        cst_pis_xml = str(r.get('CST-PIS', '')).strip().zfill(2)
-        cst_cof_xml = str(r.get('CST-COFINS', '')).strip().zfill(2)
-        vlr_pis_xml = float(r.get('VLR-PIS', 0.0))
-        vlr_cof_xml = float(r.get('VLR-COFINS', 0.0))
-        vprod = float(r.get('VPROD', 0.0))
-        
-        # --- DEFINIÇÃO DE ALÍQUOTA POR REGIME ---
-        if "Presumido" in str(regime):
-            alq_pis_esp = 0.65
-            alq_cof_esp = 3.0
-            cst_pc_esp = "01"
-        else: # Lucro Real
-            alq_pis_esp = 1.65
-            alq_cof_esp = 7.6
-            cst_pc_esp = "01"
-        
-        # SOBREPOSIÇÃO PELO GABARITO (Monofásicos, Alíquota Zero, etc.)
-        if not base_gabarito.empty and ncm in base_gabarito['NCM'].values:
-            g = base_gabarito[base_gabarito['NCM'] == ncm].iloc[0]
-            
-            # Busca dinâmica de colunas no seu Excel
-            col_cst = [c for c in base_gabarito.columns if 'CST' in c and ('PC' in c or 'PIS' in c)]
-            col_pis = [c for c in base_gabarito.columns if 'ALQ' in c and 'PIS' in c]
-            col_cof = [c for c in base_gabarito.columns if 'ALQ' in c and 'COF' in c]
-
-            if col_cst: cst_pc_esp = str(g[col_cst[0]]).strip().split('.')[0].zfill(2)
-            if col_pis: alq_pis_esp = float(g[col_pis[0]])
-            if col_cof: alq_cof_esp = float(g[col_cof[0]])
-
-        # --- CÁLCULOS DE CONFERÊNCIA ---
-        vlr_pis_dev = round(vprod * (alq_pis_esp / 100), 2)
-        vlr_cof_dev = round(vprod * (alq_cof_esp / 100), 2)
-        
-        comp_pis = max(0.0, round(vlr_pis_dev - vlr_pis_xml, 2))
-        comp_cof = max(0.0, round(vlr_cof_dev - vlr_cof_xml, 2))
-
-        # --- DIAGNÓSTICOS ---
-        diag_cst_pis = "✅ OK" if cst_pis_xml == cst_pc_esp else f"❌ Erro (XML: {cst_pis_xml} | Esp: {cst_pc_esp})"
-        diag_vlr_pis = "✅ OK" if comp_pis <= 0.01 else f"❌ Faltou R$ {comp_pis}"
-        
-        diag_cst_cof = "✅ OK" if cst_cof_xml == cst_pc_esp else f"❌ Erro (XML: {cst_cof_xml} | Esp: {cst_pc_esp})"
-        diag_vlr_cof = "✅ OK" if comp_cof <= 0.01 else f"❌ Faltou R$ {comp_cof}"
-
-        # --- AÇÃO CORRETIVA ---
-        acao = "Nenhuma"
-        motivo = f"PIS/COFINS em conformidade para {regime} e NCM {ncm}."
-        
-        if comp_pis > 0.01 or comp_cof > 0.01:
-            acao = "NF Complementar / Guia de Ajuste"
-            motivo = f"Recolhimento insuficiente no {regime}. Dif PIS: {comp_pis} | Dif COFINS: {comp_cof}."
-        elif "❌" in diag_cst_pis or "❌" in diag_cst_cof:
-            acao = "Registrar CC-e"
-            motivo = f"CST informado difere do esperado ({cst_pc_esp}) para este NCM."
-
-        return pd.Series([
-            cst_pc_esp, alq_pis_esp, alq_cof_esp,
-            diag_cst_pis, diag_vlr_pis, 
-            diag_cst_cof, diag_vlr_cof, 
-            acao, motivo
-        ])
-
-    # --- LISTA DE COLUNAS DE ANÁLISE ---
-    analises_nomes = [
-        'CST_PC_ESPERADA', 'ALQ_PIS_ESP', 'ALQ_COF_ESP',
-        'PIS_DIAG_CST', 'PIS_DIAG_VALOR', 
-        'COFINS_DIAG_CST', 'COFINS_DIAG_VALOR', 
-        'AÇÃO_CORRETIVA_PC', 'FUNDAMENTAÇÃO_PC'
-    ]
-    
     # Aplica a auditoria
-    df_pc[analises_nomes] = df_pc.apply(audit_pc_completa, axis=1)
-    
-    # --- REORGANIZAÇÃO RIGOROSA DAS COLUNAS ---
-    # 1. Separamos as Tags do XML (dados brutos extraídos pelo Core)
-    cols_originais = [c for c in df.columns if c != 'Situação Nota']
-    
-    # 2. Separamos o Status de Autenticidade
-    cols_status = ['Situação Nota'] if 'Situação Nota' in df.columns else []
-    
-    # 3. Concatenamos na ordem: [XML] -> [STATUS] -> [ANÁLISES]
-    df_final = pd.concat([df_pc[cols_originais], df_pc[cols_status], df_pc[analises_nomes]], axis=1)
-    
-    # Gravação no Excel
-    df_final.to_excel(writer, sheet_name='PIS_COFINS_AUDIT', index=False)
+    df_analise = auditar_pc(df, cod_cliente, regime)
+
+    # --- REORGANIZAÇÃO RIGOROSA DAS COLUNAS: [XML] -> [STATUS] -> [ANÁLISES] ---
+    gravar_aba(writer, 'PIS_COFINS_AUDIT', df, df_analise)
@@ -0,0 +1,37 @@
+import pandas as pd
+from Auditorias.audit_icms import auditar_icms
+from Auditorias.audit_ipi import auditar_ipi
+from Auditorias.audit_pis_cofins import auditar_pc
+from Auditorias.audit_difal import auditar_difal
+from Auditorias.motor_vetorial import gravar_aba
+from instrumentacao import etapa
+
+# --- AUDITORIA FUNDIDA (ICMS, IPI, PIS/COFINS E DIFAL SOBRE O MESMO FRAME DE SAÍDAS) ---
+# Cada imposto produz só as próprias colunas de análise; as colunas do XML nunca são copiadas
+# nem concatenadas. Os grupos saem um por vez, então só um deles fica em memória de cada vez.
+
+def auditorias_saidas(df_xs, cod_cliente, regime="Lucro Real", df_xe=pd.DataFrame()):
+    """Gera (aba, linhas do XML, análises) na ordem das abas; `linhas` é df_xs ou um recorte dele."""
+    # cada cálculo fica numa etapa própria; o yield sai dela, para a gravação de quem consome não contar junto
+    with etapa('auditoria:icms', linhas=len(df_xs)): analise = auditar_icms(df_xs, cod_cliente, df_xe)
+    yield 'ICMS_AUDIT', df_xs, analise
+    with etapa('auditoria:ipi', linhas=len(df_xs)): analise = auditar_ipi(df_xs, cod_cliente)
+    yield 'IPI_AUDIT', df_xs, analise
+    with etapa('auditoria:pis_cofins', linhas=len(df_xs)): analise = auditar_pc(df_xs, cod_cliente, regime)
+    yield 'PIS_COFINS_AUDIT', df_xs, analise
+    # DIFAL: só as operações interestaduais vão para a aba
+    with etapa('auditoria:difal') as medida:
+        df_inter = df_xs[df_xs['UF_EMIT'] != df_xs['UF_DEST']]
+        analise = auditar_difal(df_inter); medida.linhas = len(df_inter)
+    yield 'DIFAL_AUDIT', df_inter, analise
+
+def processar_auditorias(df_xs, writer, cod_cliente, regime="Lucro Real", df_xe=pd.DataFrame(), exportacao=None):
+    """
+    Mesmas abas de processar_icms/ipi/pc/difal chamados em sequência, num único passe. Com `exportacao`
+    (exportacao_colunar.ExportacaoColunar), a mesma análise também vai para o Parquet/Arrow.
+    """
+    for aba, linhas, analise in auditorias_saidas(df_xs, cod_cliente, regime, df_xe):
+        gravar_aba(writer, aba, linhas, analise)
+        if exportacao is not None:
+            with etapa(f'colunar:{aba}', linhas=len(linhas)): exportacao.gravar_aba(aba, linhas, analise)
+        del analise
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import pandas as pd
+from Auditorias.indice_ncm import IndiceNCM, chaves_regra
+
+# --- GABARITO (BASES TRIBUTÁRIAS) COMPARTILHADO ENTRE AS AUDITORIAS ---
+PASTA_BASES = "Bases_Tributárias"
+_GABARITOS = {}   # caminho -> (mtime, Gabarito)
+
+def caminho_gabarito(cod_cliente):
+    return os.path.join(PASTA_BASES, f"{cod_cliente}-Bases_Tributarias.xlsx")
+
+def chaves_ncm(serie):
+    digitos = serie.astype(str).str.replace(r'\D', '', regex=True).str.strip()
+    return digitos.where(digitos == "", digitos.str.zfill(8))
+
+class Gabarito:
+    """
+    Gabarito de um cliente já normalizado: colunas em maiúsculas e índice único pela chave do NCM
+    (vale a 1ª linha de cada NCM, como o antigo `.iloc[0]`). A chave pode ser um NCM completo ou um
+    prefixo (capítulo, posição...): cada item usa a regra mais longa que casar (IndiceNCM).
+    """
+    def __init__(self, tabela=None, erro=None):
+        self.tabela = tabela if tabela is not None else pd.DataFrame()
+        self.erro = erro
+        self.indice = IndiceNCM(self.tabela.index)
+
+    @property
+    def vazio(self):
+        return self.tabela.empty
+
+    @property
+    def colunas(self):
+        return list(self.tabela.columns)
+
+    def linha(self, ncm):
+        """Linha do gabarito para o NCM (qualquer formato) ou None."""
+        pos = self.posicoes([ncm])[0]
+        return None if pos < 0 else self.tabela.iloc[pos]
+
+    def posicoes(self, ncms):
+        """Hash join pelo NCM: posição da linha do gabarito de cada item (-1 quando nenhuma regra casa)."""
+        if self.vazio: return np.full(len(ncms), -1, dtype=np.intp)
+        return self.indice.posicoes(chaves_ncm(pd.Series(np.asarray(ncms, dtype=object))))
+
+    def valores(self, coluna, posicoes, conversor):
+        """
+        Espalha a coluna do gabarito pelos itens (None onde o NCM não foi achado). O conversor roda uma vez
+        por linha do gabarito efetivamente usada, não por item.
+        """
+        resultado = np.full(len(posicoes), None, dtype=object)
+        achou = posicoes >= 0
+        if not achou.any(): return resultado
+        base = self.tabela[coluna].to_numpy(dtype=object)
+        convertidos = np.empty(len(base), dtype=object)
+        for p in np.unique(posicoes[achou]): convertidos[p] = conversor(base[p])
+        resultado[achou] = convertidos[posicoes[achou]]
+        return resultado
+
+def _ler_gabarito(caminho):
+    try:
+        # Lemos como texto puro para não perder zeros à esquerda
+        base = pd.read_excel(caminho, dtype=str)
+    except Exception as e:
+        return Gabarito(erro=e)
+
+    base.columns = [str(c).strip().upper() for c in base.columns]
+    col_ncm = 'NCM' if 'NCM' in base.columns else next((c for c in base.columns if 'NCM' in c), None)
+    if col_ncm is None: return Gabarito()
+
+    chaves = chaves_regra(base[col_ncm])
+    base = base[chaves != ""].set_axis(chaves[chaves != ""])
+    return Gabarito(base[~base.index.duplicated(keep='first')])
+
+def carregar_gabarito(cod_cliente):
+    """
+    Lê o gabarito do cliente uma única vez por versão do arquivo (mtime) e devolve sempre o mesmo objeto.
+    As auditorias só consultam: nunca alterar `tabela` no lugar.
+    """
+    if not cod_cliente: return Gabarito()
+    caminho = caminho_gabarito(cod_cliente)
+    try: mtime = os.path.getmtime(caminho)
+    except OSError: return Gabarito()
+
+    em_cache = _GABARITOS.get(caminho)
+    if em_cache and em_cache[0] == mtime: return em_cache[1]
+
+    gabarito = _ler_gabarito(caminho)
+    _GABARITOS[caminho] = (mtime, gabarito)
+    return gabarito
@@ -0,0 +1,61 @@
+import re
+import numpy as np
+import pandas as pd
+
+# --- ÍNDICE DE REGRAS POR PREFIXO DE NCM (CAPÍTULO, POSIÇÃO, SUBPOSIÇÃO, ITEM, SUBITEM) ---
+# Uma regra escrita para o capítulo (2 dígitos), a posição (4), a subposição (5/6) ou o item (7) vale para
+# todos os NCMs de 8 dígitos abaixo dela; a regra mais longa que casar ganha. Há um índice hash por
+# tamanho de regra (no máximo 6), então cada NCM custa O(dígitos) e a busca roda na coluna inteira.
+
+def chave_regra(texto):
+    """
+    NCM de uma regra (gabarito/TIPI) só com dígitos, no tamanho certo da hierarquia:
+    '01.01' -> '0101', '0101.2' -> '01012', '0102.21.10' -> '01022110'. Sem pontos, o Excel come o zero
+    à esquerda ('2013000', '201'): completa até o tamanho par seguinte ('02013000', '0201').
+    Textos que o Excel virou número com pontos ('3.03', '02.1', '103.9') voltam a '0303', '0210', '01039'.
+    """
+    if texto is None or (not isinstance(texto, str) and pd.isna(texto)): return ""
+    partes = [re.sub(r'\D', '', p) for p in str(texto).strip().split('.')]
+    if len(partes) > 1:
+        if len(partes[0]) <= 2:   # capítulo.posição
+            return partes[0].zfill(2) + partes[1].ljust(2, '0') + ''.join(partes[2:])
+        return partes[0].zfill(4) + ''.join(partes[1:])
+    digitos = partes[0]
+    return digitos.zfill(len(digitos) + len(digitos) % 2) if digitos else ""
+
+def chaves_regra(serie):
+    """chave_regra na coluna inteira, calculada uma vez por texto distinto."""
+    codigos, unicos = pd.factorize(pd.Series(serie).astype(object), use_na_sentinel=True)
+    return np.append(np.array([chave_regra(u) for u in unicos], dtype=object), "")[codigos]
+
+class IndiceNCM:
+    """
+    Índice das regras (na ordem da tabela de origem) por tamanho de prefixo. Em regra repetida vale a 1ª.
+    `posicoes` devolve, para cada NCM, a linha da regra de prefixo mais longo que casa (-1 se nenhuma).
+    """
+    def __init__(self, chaves):
+        chaves = pd.Series(np.asarray(chaves, dtype=object))
+        tamanhos = chaves.str.len().fillna(0).astype(int).to_numpy()
+        self.niveis = []
+        for tamanho in sorted(set(tamanhos[tamanhos > 0]), reverse=True):
+            linhas = np.flatnonzero(tamanhos == tamanho)
+            prefixos = pd.Index(chaves.to_numpy()[linhas])
+            primeira = ~prefixos.duplicated(keep='first')
+            self.niveis.append((tamanho, prefixos[primeira], linhas[primeira]))
+
+    @property
+    def vazio(self):
+        return not self.niveis
+
+    def posicoes(self, ncms):
+        """Busca em lote: `ncms` já normalizados (8 dígitos); cada NCM distinto é resolvido uma vez."""
+        codigos, unicos = pd.factorize(pd.Series(np.asarray(ncms, dtype=object)).astype(object), use_na_sentinel=True)
+        achado = np.full(len(unicos), -1, dtype=np.intp)
+        unicos = pd.Series(unicos, dtype=object).astype(str)
+        for tamanho, prefixos, linhas in self.niveis:
+            pendentes = np.flatnonzero(achado < 0)
+            if not len(pendentes): break
+            pos = prefixos.get_indexer(unicos.iloc[pendentes].str[:tamanho])
+            casou = pos >= 0
+            achado[pendentes[casou]] = linhas[pos[casou]]
+        return np.append(achado, -1)[codigos]   # o sentinela -1 do factorize cai no -1 do fim
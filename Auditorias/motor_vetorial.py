@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from relatorio_excel import gravar_tabela
+
+# --- PEÇAS COMUNS DAS AUDITORIAS VETORIZADAS ---
+# Reproduzem, coluna inteira de uma vez, exatamente o que o antigo `apply` linha a linha fazia
+# (round() do Python, str() de float e r.get(coluna, padrão)), para manter as abas idênticas.
+
+def coluna(df, nome, padrao):
+    """Equivalente vetorial de r.get(nome, padrao)."""
+    if nome in df.columns: return df[nome]
+    return pd.Series([padrao] * len(df), index=df.index, dtype=object)
+
+def como_float(df, nome, padrao=0.0):
+    return coluna(df, nome, padrao).astype(float).to_numpy()
+
+def como_texto(valores):
+    """str() elemento a elemento; floats saem com o mesmo repr do Python (calculado só uma vez por valor distinto)."""
+    valores = pd.Series(valores) if not isinstance(valores, pd.Series) else valores
+    if pd.api.types.is_float_dtype(valores.dtype):
+        unicos = pd.unique(valores.to_numpy())
+        return valores.map({v: str(float(v)) for v in unicos if v == v}).fillna('nan').to_numpy(dtype=object)
+    return valores.astype(object).map(str).to_numpy(dtype=object) if len(valores) else np.array([], dtype=object)
+
+def arredondar(valores, casas=2):
+    """round(x, casas) do Python em lote: o np.round escala por 10**casas e pode divergir bem no meio (x,xx5)."""
+    valores = np.asarray(valores, dtype=float)
+    resultado = np.round(valores, casas)
+    escala = valores * (10.0 ** casas)
+    with np.errstate(invalid='ignore'):
+        duvidosos = (np.abs(escala - np.floor(escala) - 0.5) < 1e-6) | (np.abs(escala) > 1e12)
+    for i in np.flatnonzero(duvidosos):
+        resultado[i] = round(float(valores[i]), casas)
+    return resultado
+
+def maximo_zero(valores):
+    """max(0.0, x) do Python: NaN e -0.0 viram 0.0."""
+    valores = np.asarray(valores, dtype=float)
+    with np.errstate(invalid='ignore'):
+        return np.where(valores > 0.0, valores, 0.0)
+
+def montar_texto(*partes):
+    """Concatena pedaços (strings fixas ou arrays de strings) elemento a elemento."""
+    tamanho = max((len(p) for p in partes if not isinstance(p, str)), default=0)
+    resultado = np.full(tamanho, "", dtype=object)
+    for p in partes:
+        resultado = resultado + (p if isinstance(p, str) else np.asarray(p, dtype=object))
+    return resultado
+
+def gravar_aba(writer, nome_aba, df, analise):
+    """
+    Grava [XML] + [Situação Nota] + [análises] sem montar um DataFrame concatenado: a base sai de df
+    como está e as análises entram ao lado, linha a linha (serve ao relatório em constant_memory).
+    """
+    if df.empty:   # aba vazia: só o cabeçalho, na ordem original das colunas
+        return gravar_tabela(writer, nome_aba, pd.DataFrame(columns=list(df.columns) + list(analise.columns)))
+    cols_xml = [c for c in df.columns if c != 'Situação Nota' and c not in analise.columns]
+    cols_status = ['Situação Nota'] if 'Situação Nota' in df.columns else []
+    base = df if cols_xml + cols_status == list(df.columns) else df[cols_xml + cols_status]
+    return gravar_tabela(writer, nome_aba, base, analise)
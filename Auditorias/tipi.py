@@ -0,0 +1,84 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from cache_notas import PASTA_CACHE
+from Auditorias import gabarito
+from Auditorias.indice_ncm import IndiceNCM, chaves_regra
+
+# --- TIPI (ALÍQUOTAS DE IPI POR NCM) COM CACHE BINÁRIO ---
+# Ler a TIPI.xlsx pelo openpyxl leva mais que a auditoria de IPI inteira: a planilha é convertida uma vez
+# num .npz (NCM -> alíquota) em PASTA_CACHE. O cache guarda o mtime/tamanho da planilha e é refeito quando
+# ela muda; como fica em disco, os processos do lote e as próximas execuções aproveitam o mesmo arquivo.
+ARQUIVO_TIPI = "TIPI.xlsx"
+CACHE_TIPI = os.path.join(PASTA_CACHE, "tipi.npz")
+VERSAO_CACHE_TIPI = 1
+_TIPI = {}   # caminho -> (assinatura, TabelaTIPI)
+
+class TabelaTIPI:
+    """Alíquota de IPI por regra de NCM (sem os destaques EX). 'NT' (não tributado) fica como NaN."""
+    def __init__(self, chaves, aliquotas):
+        self.chaves = np.asarray(chaves, dtype=object)
+        self.aliquotas = np.asarray(aliquotas, dtype=float)
+        self.indice = IndiceNCM(self.chaves)
+
+    def __len__(self):
+        return len(self.chaves)
+
+    def aliquota(self, ncms):
+        """Alíquota de cada NCM já normalizado pela regra mais longa da TIPI; NaN para NT ou NCM fora da tabela."""
+        pos = self.indice.posicoes(ncms)
+        return np.where(pos >= 0, self.aliquotas[np.maximum(pos, 0)] if len(self) else np.nan, np.nan)
+
+def caminho_tipi():
+    return os.path.join(gabarito.PASTA_BASES, ARQUIVO_TIPI)
+
+def _assinatura(caminho):
+    estado = os.stat(caminho)
+    return np.array([VERSAO_CACHE_TIPI, estado.st_mtime_ns, estado.st_size], dtype=np.int64)
+
+def _ler_planilha(caminho):
+    base = pd.read_excel(caminho, dtype=str)
+    base.columns = [str(c).strip().upper() for c in base.columns]
+    col_ncm = next(c for c in base.columns if 'NCM' in c)
+    col_alq = next(c for c in base.columns if 'AL' in c and 'QUOTA' in c)
+    if 'EX' in base.columns: base = base[base['EX'].isna() | (base['EX'].str.strip() == "")]
+    texto = base[col_alq].str.strip().str.upper()
+    base = base[texto.notna() & (texto != "")]
+    chaves = chaves_regra(base[col_ncm])
+    aliquotas = pd.to_numeric(base[col_alq].str.replace(',', '.', regex=False), errors='coerce').to_numpy()
+    validas = chaves != ""
+    return TabelaTIPI(chaves[validas], aliquotas[validas])
+
+def _gravar_cache(caminho_cache, assinatura, tabela):
+    pasta = os.path.dirname(caminho_cache)
+    if pasta: os.makedirs(pasta, exist_ok=True)
+    # grava ao lado e troca de uma vez: outro processo nunca lê um .npz pela metade
+    fd, temporario = tempfile.mkstemp(dir=pasta or ".", suffix=".npz")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, assinatura=assinatura, chaves=tabela.chaves.astype(str), aliquotas=tabela.aliquotas)
+    os.replace(temporario, caminho_cache)
+
+def carregar_tipi(caminho=None, caminho_cache=CACHE_TIPI):
+    """TabelaTIPI da planilha: memória do processo -> cache .npz -> xlsx (e grava o cache). Sem planilha, tabela vazia."""
+    caminho = caminho or caminho_tipi()
+    try: assinatura = _assinatura(caminho)
+    except OSError: return TabelaTIPI([], [])
+
+    em_memoria = _TIPI.get(caminho)
+    if em_memoria and np.array_equal(em_memoria[0], assinatura): return em_memoria[1]
+
+    tabela = None
+    try:
+        with np.load(caminho_cache, allow_pickle=False) as cache:
+            if np.array_equal(cache['assinatura'], assinatura):
+                tabela = TabelaTIPI(cache['chaves'].astype(object), cache['aliquotas'])
+    except (OSError, KeyError, ValueError):
+        pass
+    if tabela is None:
+        tabela = _ler_planilha(caminho)
+        try: _gravar_cache(caminho_cache, assinatura, tabela)
+        except OSError: pass
+
+    _TIPI[caminho] = (assinatura, tabela)
+    return tabela
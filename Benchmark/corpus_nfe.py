@@ -0,0 +1,260 @@
+import os
+import json
+import random
+import zipfile
+
+# --- CORPUS SINTÉTICO DE NF-e (LEIAUTE 4.00) PARA O BENCHMARK ---
+# Notas na ordem de grupos do XSD da NF-e 4.00, com chave de 44 dígitos e DV módulo 11, cobrindo os caminhos
+# do extrator: com e sem nfeProc, namespace padrão, prefixado ou ausente, saídas e entradas, UFs/CFOPs variados,
+# ICMS normal (CST) e Simples (CSOSN), ST com FCP-ST, ST retido e DIFAL com FCP (ICMSUFDest). Os mesmos itens
+# saem também nos gerenciais de entradas e saídas (TXT ';' do ERP, no leiaute de Gerenciais/audit_gerencial.py).
+# A mesma semente gera sempre o mesmo corpus: dá para comparar execuções de commits diferentes.
+NS_NFE = "http://www.portalfiscal.inf.br/nfe"
+CNPJ_AUDITADO = "11222333000181"
+UF_AUDITADA = "SP"
+CODIGOS_UF = {'RO': '11', 'AC': '12', 'AM': '13', 'RR': '14', 'PA': '15', 'AP': '16', 'TO': '17', 'MA': '21', 'PI': '22',
+              'CE': '23', 'RN': '24', 'PB': '25', 'PE': '26', 'AL': '27', 'SE': '28', 'BA': '29', 'MG': '31', 'ES': '32',
+              'RJ': '33', 'SP': '35', 'PR': '41', 'SC': '42', 'RS': '43', 'MS': '50', 'MT': '51', 'GO': '52', 'DF': '53'}
+UFS_SUL_SUDESTE = {'SP', 'MG', 'RJ', 'PR', 'SC', 'RS'}
+NCMS_PADRAO = ['02013000', '02023000', '04021010', '10063021', '17019900', '22021000', '22030000', '27101259',
+               '30049099', '33049910', '34022000', '39269090', '40111000', '61091000', '64039990', '73181500',
+               '84713012', '85171231', '85287200', '87089990', '94036000', '95030099']
+CFOPS_SAIDA_INTERNA = ['5102', '5102', '5101', '5405', '5403', '5910', '5949']
+CFOPS_SAIDA_INTER = ['6102', '6102', '6108', '6404', '6403', '6949']
+CFOPS_DEVOLUCAO = ['1202', '2202', '1411']
+CSTS_ICMS = ['00', '00', '00', '10', '20', '40', '41', '60', '70', '90']
+CSOSNS = ['101', '102', '102', '103', '201', '202', '300', '400', '500', '900']
+VARIANTES_NS = ['padrao'] * 7 + ['prefixo', 'sem_ns']
+FRACAO_SAIDAS = 0.7
+FRACAO_NFEPROC = 0.8
+FRACAO_SIMPLES = 0.15
+NOTAS_POR_ZIP = 2000
+XML_SOLTOS = 20   # arquivos .xml fora dos zips, como no upload
+
+def digito_chave(chave43):
+    """DV módulo 11 da chave de acesso (pesos 2..9 da direita para a esquerda)."""
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(chave43)))
+    dv = 11 - soma % 11
+    return '0' if dv >= 10 else str(dv)
+
+def _v(x):
+    return f"{x:.2f}"
+
+def _br(x):
+    return f"{x:.2f}".replace('.', ',')
+
+def _prefixar(xml):
+    """Mesmo namespace com prefixo nfe: em todas as tags."""
+    return xml.replace('</', '\0').replace('<', '<nfe:').replace('\0', '</nfe:')
+
+def _aliquota_inter(uf_orig, uf_dest, origem):
+    if origem in ('1', '2', '3', '8'): return 4.0
+    return 7.0 if uf_orig in UFS_SUL_SUDESTE and uf_dest not in UFS_SUL_SUDESTE | {'ES'} else 12.0
+
+def _grupo_icms(rnd, simples, origem, vbc, aliq, tot):
+    """Grupo ICMSxx/ICMSSNxxx do item; acumula os totais da nota em `tot`."""
+    vicms = round(vbc * aliq / 100, 2)
+    vbcst = round(vbc * rnd.choice((1.3, 1.4, 1.6)), 2); pst = rnd.choice((18.0, 19.0, 20.0))
+    vst = round(max(vbcst * pst / 100 - vicms, 0.0), 2); vfcpst = round(vbcst * 0.02, 2)
+    st = (f"<modBCST>4</modBCST><pMVAST>40.00</pMVAST><vBCST>{_v(vbcst)}</vBCST><pICMSST>{_v(pst)}</pICMSST>"
+          f"<vICMSST>{_v(vst)}</vICMSST><vBCFCPST>{_v(vbcst)}</vBCFCPST><pFCPST>2.00</pFCPST><vFCPST>{_v(vfcpst)}</vFCPST>")
+    retido = f"<vBCSTRet>{_v(vbcst)}</vBCSTRet><pST>{_v(pst)}</pST><vICMSSTRet>{_v(vst)}</vICMSSTRet>"
+    if simples:
+        csosn = rnd.choice(CSOSNS)
+        grupo = {'101': 'ICMSSN101', '201': 'ICMSSN201', '202': 'ICMSSN202', '500': 'ICMSSN500', '900': 'ICMSSN900'}.get(csosn, 'ICMSSN102')
+        corpo = f"<orig>{origem}</orig><CSOSN>{csosn}</CSOSN>"
+        if csosn in ('101', '201'): corpo += f"<pCredSN>2.56</pCredSN><vCredICMSSN>{_v(vbc * 0.0256)}</vCredICMSSN>"
+        if csosn in ('201', '202'):
+            corpo += st; tot['vBCST'] += vbcst; tot['vST'] += vst; tot['vFCPST'] += vfcpst
+        elif csosn == '500':
+            corpo += retido
+        elif csosn == '900':
+            corpo += f"<modBC>3</modBC><vBC>{_v(vbc)}</vBC><pICMS>{_v(aliq)}</pICMS><vICMS>{_v(vicms)}</vICMS>"
+            tot['vBC'] += vbc; tot['vICMS'] += vicms
+        return f"<{grupo}>{corpo}</{grupo}>"
+
+    cst = rnd.choice(CSTS_ICMS)
+    grupo = 'ICMS40' if cst in ('40', '41') else f'ICMS{cst}'
+    corpo = f"<orig>{origem}</orig><CST>{cst}</CST>"
+    if cst in ('00', '10', '20', '70', '90'):
+        reducao = "<pRedBC>33.33</pRedBC>" if cst in ('20', '70') else ""
+        fcp = f"<pFCP>2.00</pFCP><vFCP>{_v(vbc * 0.02)}</vFCP>" if cst == '00' and rnd.random() < 0.2 else ""
+        corpo += f"<modBC>3</modBC>{reducao}<vBC>{_v(vbc)}</vBC><pICMS>{rnd.choice((f'{aliq:.2f}', f'{aliq:.4f}'))}</pICMS><vICMS>{_v(vicms)}</vICMS>{fcp}"
+        tot['vBC'] += vbc; tot['vICMS'] += vicms
+        if cst in ('10', '70') or (cst == '90' and rnd.random() < 0.5):
+            corpo += st; tot['vBCST'] += vbcst; tot['vST'] += vst; tot['vFCPST'] += vfcpst
+    elif cst == '60':
+        corpo += retido
+    return f"<{grupo}>{corpo}</{grupo}>"
+
+def _item(rnd, n, ncms, cfop, simples, uf_orig, uf_dest, difal, tot):
+    qtd = rnd.randint(1, 20); unit = round(rnd.uniform(1, 800), 2); vprod = round(qtd * unit, 2)
+    origem = rnd.choice('0000012')
+    aliq = 18.0 if uf_orig == uf_dest else _aliquota_inter(uf_orig, uf_dest, origem)
+    icms = _grupo_icms(rnd, simples, origem, vprod, aliq, tot)
+    if rnd.random() < 0.3:
+        vipi = round(vprod * 0.05, 2); tot['vIPI'] += vipi
+        ipi = f"<IPI><cEnq>999</cEnq><IPITrib><CST>50</CST><vBC>{_v(vprod)}</vBC><pIPI>5.00</pIPI><vIPI>{_v(vipi)}</vIPI></IPITrib></IPI>"
+    else:
+        ipi = "<IPI><cEnq>999</cEnq><IPINT><CST>53</CST></IPINT></IPI>"
+    vpis = round(vprod * 0.0165, 2); vcof = round(vprod * 0.076, 2); tot['vPIS'] += vpis; tot['vCOFINS'] += vcof
+    pis = f"<PIS><PISAliq><CST>01</CST><vBC>{_v(vprod)}</vBC><pPIS>1.65</pPIS><vPIS>{_v(vpis)}</vPIS></PISAliq></PIS>"
+    cofins = f"<COFINS><COFINSAliq><CST>01</CST><vBC>{_v(vprod)}</vBC><pCOFINS>7.60</pCOFINS><vCOFINS>{_v(vcof)}</vCOFINS></COFINSAliq></COFINS>"
+    uf_dest_grupo = ""
+    if difal:
+        interna = rnd.choice((17.0, 18.0, 19.0, 20.0)); inter = _aliquota_inter(uf_orig, uf_dest, origem)
+        vdifal = round(vprod * max(interna - inter, 0.0) / 100, 2); vfcp = round(vprod * 0.02, 2)
+        tot['vICMSUFDest'] += vdifal; tot['vFCPUFDest'] += vfcp
+        uf_dest_grupo = (f"<ICMSUFDest><vBCUFDest>{_v(vprod)}</vBCUFDest><vBCFCPUFDest>{_v(vprod)}</vBCFCPUFDest><pFCPUFDest>2.00</pFCPUFDest>"
+                         f"<pICMSUFDest>{_v(interna)}</pICMSUFDest><pICMSInter>{_v(inter)}</pICMSInter><pICMSInterPart>100.00</pICMSInterPart>"
+                         f"<vFCPUFDest>{_v(vfcp)}</vFCPUFDest><vICMSUFDest>{_v(vdifal)}</vICMSUFDest><vICMSUFRemet>0.00</vICMSUFRemet></ICMSUFDest>")
+    tot['vProd'] += vprod
+    cprod = f"P{rnd.randint(1, 99999):05d}"; ncm = rnd.choice(ncms)
+    xml = (f'<det nItem="{n}"><prod><cProd>{cprod}</cProd><cEAN>SEM GTIN</cEAN><xProd>PRODUTO {n}</xProd>'
+           f'<NCM>{ncm}</NCM><CFOP>{cfop}</CFOP><uCom>UN</uCom><qCom>{qtd}.0000</qCom><vUnCom>{unit:.10f}</vUnCom>'
+           f'<vProd>{_v(vprod)}</vProd><cEANTrib>SEM GTIN</cEANTrib><uTrib>UN</uTrib><qTrib>{qtd}.0000</qTrib><vUnTrib>{unit:.10f}</vUnTrib>'
+           f'<indTot>1</indTot></prod><imposto><vTotTrib>0.00</vTotTrib><ICMS>{icms}</ICMS>{ipi}{pis}{cofins}{uf_dest_grupo}</imposto></det>')
+    return xml, (cprod, ncm, qtd, unit, vprod)
+
+def _linha_gerencial(saida, numero, data, cnpj, uf, vnf, n, cfop, produto, valores):
+    """Linha do TXT gerencial de um item; os impostos são o que o item somou aos totais da nota."""
+    cprod, ncm, qtd, unit, vprod = produto
+    v = {k: _br(x) for k, x in valores.items()}
+    aliq = _br(valores['vICMS'] / valores['vBC'] * 100) if valores['vBC'] else '0,00'
+    comum = [str(numero), data, cnpj, uf, _br(vnf), '', cfop, cprod, f'PRODUTO {n}', ncm, 'UN', _br(unit), str(qtd), _br(vprod)]
+    if saida:
+        campos = comum + ['0,00'] * 4 + [_br(vprod), '', v['vBC'], aliq, v['vICMS'], v['vBCST'], v['vST'], v['vIPI'],
+                                         '01', _br(vprod), v['vPIS'], '01', _br(vprod), v['vCOFINS']]
+    else:
+        campos = comum + ['0,00', _br(vprod), '', v['vBC'], v['vICMS'], v['vBCST'], v['vST'], v['vIPI'],
+                          '01', _br(vprod), v['vPIS'], '01', _br(vprod), v['vCOFINS']]
+    return ';'.join(campos)
+
+def gerar_nota(rnd, numero, itens, saida, ncms=NCMS_PADRAO, cnpj_auditado=CNPJ_AUDITADO, ano=2025, gerencial=None):
+    """
+    Uma NF-e com `itens` itens. Devolve (bytes do XML, chave, competência AAAA-MM). Com a lista `gerencial`,
+    acrescenta nela a linha do TXT gerencial de cada item (sem sortear nada a mais: o XML não muda).
+    """
+    uf_aud = UF_AUDITADA
+    terceiro = f"{rnd.randint(10**12, 10**13 - 1):013d}{rnd.randint(0, 9)}"
+    uf_terceiro = rnd.choice(list(CODIGOS_UF))
+    devolucao = not saida and rnd.random() < 0.1   # entrada emitida pela própria empresa (tpNF=0)
+    if saida or devolucao:
+        cnpj_emit, uf_emit, cnpj_dest, uf_dest = cnpj_auditado, uf_aud, terceiro, uf_terceiro
+    else:
+        cnpj_emit, uf_emit, cnpj_dest, uf_dest = terceiro, uf_terceiro, cnpj_auditado, uf_aud
+    interestadual = uf_emit != uf_dest
+    contribuinte = rnd.random() < 0.6
+    simples = rnd.random() < FRACAO_SIMPLES
+    if devolucao: cfops = [c for c in CFOPS_DEVOLUCAO if (c[0] == '2') == interestadual] or CFOPS_DEVOLUCAO
+    else: cfops = CFOPS_SAIDA_INTER if interestadual else CFOPS_SAIDA_INTERNA
+    difal = interestadual and not contribuinte and not devolucao
+
+    mes = rnd.randint(1, 12); dia = rnd.randint(1, 28)
+    cnf = f"{rnd.randint(0, 10**8 - 1):08d}"; serie = f"{rnd.randint(1, 3):03d}"
+    base = f"{CODIGOS_UF[uf_emit]}{ano % 100:02d}{mes:02d}{cnpj_emit}55{serie}{numero:09d}1{cnf}"
+    chave = base + digito_chave(base)
+
+    tot = dict.fromkeys(('vBC', 'vICMS', 'vFCPUFDest', 'vICMSUFDest', 'vBCST', 'vST', 'vFCPST', 'vProd', 'vIPI', 'vPIS', 'vCOFINS'), 0.0)
+    dets, detalhes = [], []
+    for n in range(1, itens + 1):
+        cfop = rnd.choice(cfops); antes = dict(tot)
+        xml_item, produto = _item(rnd, n, ncms, cfop, simples, uf_emit, uf_dest, difal, tot)
+        dets.append(xml_item); detalhes.append((n, cfop, produto, {k: tot[k] - antes[k] for k in tot}))
+    dets = ''.join(dets)
+    vnf = tot['vProd'] + tot['vST'] + tot['vFCPST'] + tot['vIPI']
+    if gerencial is not None:
+        # saída: o terceiro é o destinatário; entrada: o emitente (como nas chaves da conciliação)
+        cnpj, uf = (cnpj_dest, uf_dest) if saida else (cnpj_emit, uf_emit)
+        gerencial += [_linha_gerencial(saida, numero, f"{dia:02d}/{mes:02d}/{ano}", cnpj, uf, vnf, *d) for d in detalhes]
+    ie_dest = f"<IE>{rnd.randint(10**8, 10**12 - 1)}</IE>" if contribuinte else ""
+    dh = f"<dhEmi>{ano}-{mes:02d}-{dia:02d}T{rnd.randint(7, 20):02d}:{rnd.randint(0, 59):02d}:00-03:00</dhEmi>"
+
+    inf = (f'<infNFe versao="4.00" Id="NFe{chave}"><ide><cUF>{CODIGOS_UF[uf_emit]}</cUF><cNF>{cnf}</cNF><natOp>VENDA</natOp><mod>55</mod>'
+           f'<serie>{int(serie)}</serie><nNF>{numero}</nNF>{dh}<tpNF>{0 if devolucao else 1}</tpNF><idDest>{2 if interestadual else 1}</idDest>'
+           f'<cMunFG>3550308</cMunFG><tpImp>1</tpImp><tpEmis>1</tpEmis><cDV>{chave[-1]}</cDV><tpAmb>1</tpAmb><finNFe>{4 if devolucao else 1}</finNFe>'
+           f'<indFinal>{0 if contribuinte else 1}</indFinal><indPres>1</indPres><procEmi>0</procEmi><verProc>1.0</verProc></ide>'
+           f'<emit><CNPJ>{cnpj_emit}</CNPJ><xNome>EMITENTE {cnpj_emit[:8]}</xNome><enderEmit><xLgr>RUA A</xLgr><nro>1</nro><xBairro>CENTRO</xBairro>'
+           f'<cMun>3550308</cMun><xMun>MUNICIPIO</xMun><UF>{uf_emit}</UF><CEP>01000000</CEP></enderEmit><IE>{rnd.randint(10**8, 10**12 - 1)}</IE>'
+           f'<CRT>{1 if simples else 3}</CRT></emit>'
+           f'<dest><CNPJ>{cnpj_dest}</CNPJ><xNome>DESTINATARIO {cnpj_dest[:8]}</xNome><enderDest><xLgr>RUA B</xLgr><nro>2</nro><xBairro>CENTRO</xBairro>'
+           f'<cMun>3550308</cMun><xMun>MUNICIPIO</xMun><UF>{uf_dest}</UF></enderDest><indIEDest>{1 if contribuinte else 9}</indIEDest>{ie_dest}</dest>'
+           f'{dets}<total><ICMSTot><vBC>{_v(tot["vBC"])}</vBC><vICMS>{_v(tot["vICMS"])}</vICMS><vICMSDeson>0.00</vICMSDeson>'
+           f'<vFCPUFDest>{_v(tot["vFCPUFDest"])}</vFCPUFDest><vICMSUFDest>{_v(tot["vICMSUFDest"])}</vICMSUFDest><vICMSUFRemet>0.00</vICMSUFRemet>'
+           f'<vFCP>0.00</vFCP><vBCST>{_v(tot["vBCST"])}</vBCST><vST>{_v(tot["vST"])}</vST><vFCPST>{_v(tot["vFCPST"])}</vFCPST><vFCPSTRet>0.00</vFCPSTRet>'
+           f'<vProd>{_v(tot["vProd"])}</vProd><vFrete>0.00</vFrete><vSeg>0.00</vSeg><vDesc>0.00</vDesc><vII>0.00</vII><vIPI>{_v(tot["vIPI"])}</vIPI>'
+           f'<vIPIDevol>0.00</vIPIDevol><vPIS>{_v(tot["vPIS"])}</vPIS><vCOFINS>{_v(tot["vCOFINS"])}</vCOFINS><vOutro>0.00</vOutro><vNF>{_v(vnf)}</vNF>'
+           f'</ICMSTot></total><transp><modFrete>9</modFrete></transp><pag><detPag><tPag>01</tPag><vPag>{_v(vnf)}</vPag></detPag></pag></infNFe>')
+    assinatura = '<Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignedInfo/><SignatureValue/></Signature>'
+    protocolo = (f'<protNFe versao="4.00"><infProt><tpAmb>1</tpAmb><verAplic>SP_NFE_PL009</verAplic><chNFe>{chave}</chNFe>'
+                 f'<dhRecbto>{ano}-{mes:02d}-{dia:02d}T21:00:00-03:00</dhRecbto><nProt>1{rnd.randint(10**13, 10**14 - 1)}</nProt>'
+                 f'<cStat>100</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe>')
+    proc = rnd.random() < FRACAO_NFEPROC
+    variante = rnd.choice(VARIANTES_NS)
+    if variante == 'prefixo':
+        doc = f'<nfe:NFe xmlns:nfe="{NS_NFE}">{_prefixar(inf)}{assinatura}</nfe:NFe>'   # a assinatura fica no namespace dela
+        if proc: doc = f'<nfe:nfeProc xmlns:nfe="{NS_NFE}" versao="4.00">{doc}{_prefixar(protocolo)}</nfe:nfeProc>'
+    else:
+        xmlns = f' xmlns="{NS_NFE}"' if variante == 'padrao' else ''
+        doc = f'<NFe{xmlns}>{inf}{assinatura}</NFe>'
+        if proc: doc = f'<nfeProc{xmlns} versao="4.00">{doc}{protocolo}</nfeProc>'
+    return ('<?xml version="1.0" encoding="UTF-8"?>' + doc).encode('utf-8'), chave, f"{ano}-{mes:02d}"
+
+def gerar_corpus(pasta, itens, semente=42, ncms=None, cnpj_auditado=CNPJ_AUDITADO, max_itens_nota=10,
+                 notas_por_zip=NOTAS_POR_ZIP, xml_soltos=XML_SOLTOS):
+    """
+    Grava em `pasta` notas até somar `itens` itens: a maioria em .zip (`notas_por_zip` por arquivo), algumas .xml soltas,
+    um relatório de autenticidade (autenticidade.csv, ';') com situações variadas e ~3% das chaves faltando, e os
+    gerenciais dos mesmos itens (gerencial_saidas.txt, gerencial_entradas.txt).
+    Devolve o resumo (também salvo em corpus.json); com o mesmo resumo já na pasta, reaproveita o corpus.
+    """
+    parametros = {'itens': itens, 'semente': semente, 'cnpj_auditado': cnpj_auditado, 'max_itens_nota': max_itens_nota,
+                  'notas_por_zip': notas_por_zip, 'xml_soltos': xml_soltos, 'ncms': sorted(ncms or NCMS_PADRAO)}
+    caminho_resumo = os.path.join(pasta, "corpus.json")
+    try:
+        with open(caminho_resumo, encoding='utf-8') as f: resumo = json.load(f)
+        if resumo.get('parametros') == parametros and all(os.path.exists(a) for a in resumo['arquivos']) \
+                and all(os.path.exists(resumo.get(k, '')) for k in ('gerencial_saidas', 'gerencial_entradas')): return resumo
+    except (OSError, ValueError, KeyError):
+        pass
+
+    os.makedirs(pasta, exist_ok=True)
+    rnd = random.Random(semente)
+    ncms = list(ncms or NCMS_PADRAO)
+    arquivos, zip_atual, notas_no_zip = [], None, 0
+    resumo = {'parametros': parametros, 'notas': 0, 'itens': 0, 'saidas': 0, 'entradas': 0, 'bytes_xml': 0, 'competencias': {}}
+    gerenciais = {'gerencial_saidas': os.path.join(pasta, "gerencial_saidas.txt"), 'gerencial_entradas': os.path.join(pasta, "gerencial_entradas.txt")}
+    with open(os.path.join(pasta, "autenticidade.csv"), "w", encoding="utf-8") as aut, \
+            open(gerenciais['gerencial_saidas'], "w", encoding="latin-1") as ger_saidas, \
+            open(gerenciais['gerencial_entradas'], "w", encoding="latin-1") as ger_entradas:
+        try:
+            while resumo['itens'] < itens:
+                qtd = min(rnd.randint(1, max_itens_nota), itens - resumo['itens'])
+                saida = rnd.random() < FRACAO_SAIDAS
+                linhas = []
+                xml, chave, competencia = gerar_nota(rnd, resumo['notas'] + 1, qtd, saida, ncms, cnpj_auditado, gerencial=linhas)
+                (ger_saidas if saida else ger_entradas).write(''.join(f"{linha}\n" for linha in linhas))
+                resumo['notas'] += 1; resumo['itens'] += qtd; resumo['bytes_xml'] += len(xml)
+                resumo['saidas' if saida else 'entradas'] += 1
+                resumo['competencias'][competencia] = resumo['competencias'].get(competencia, 0) + 1
+
+                if resumo['notas'] <= xml_soltos:
+                    arquivos.append(os.path.join(pasta, f"{chave}.xml"))
+                    with open(arquivos[-1], "wb") as f: f.write(xml)
+                else:
+                    if zip_atual is None or notas_no_zip >= notas_por_zip:
+                        if zip_atual: zip_atual.close()
+                        arquivos.append(os.path.join(pasta, f"lote_{len(arquivos):05d}.zip"))
+                        zip_atual, notas_no_zip = zipfile.ZipFile(arquivos[-1], "w", zipfile.ZIP_DEFLATED, compresslevel=1), 0
+                    zip_atual.writestr(f"{competencia}/{chave}-nfe.xml", xml); notas_no_zip += 1
+
+                sorteio = rnd.random()
+                if sorteio < 0.97:
+                    situacao = 'Autorizada' if sorteio < 0.95 else 'Cancelada'
+                    aut.write(f"NFe{chave};{competencia}-01;{cnpj_auditado};{rnd.randint(1, 99999)},{rnd.randint(0, 99):02d};55;{situacao}\n")
+        finally:
+            if zip_atual: zip_atual.close()
+
+    resumo.update(arquivos=arquivos, autenticidade=os.path.join(pasta, "autenticidade.csv"), **gerenciais)
+    with open(caminho_resumo, "w", encoding="utf-8") as f: json.dump(resumo, f, ensure_ascii=False, indent=2)
+    return resumo
@@ -1,59 +1,93 @@
+import pickle
+import tempfile
+import numpy as np
 import pandas as pd
-import streamlit as st
-import io
+from avisos import erro
+from instrumentacao import etapa, registrar_excecao, tamanho_arquivos
+from numeros import numeros_br
+from relatorio_excel import gravar_lotes
+from Gerenciais.conciliacao import COLUNAS_GERENCIAL_ENTRADA, COLUNAS_GERENCIAL_SAIDA
 
-def gerar_abas_gerenciais(writer, ge, gs):
+# Cabeçalho exato das ENTRADAS
+COLS_ENT = [
+    "NUM_NF", "DATA_EMISSAO", "CNPJ", "UF", "VLR_NF", "codi_acu",
+    "CFOP", "COD_PROD", "nome_acu", "NCM", "UNID", "VUNIT",
+    "QTDE", "VPROD", "DESP", "vlr_cont", "CST-ICMS", "base_icms",
+    "vlr_icms", "BC-ICMS-ST", "ICMS-ST", "vlr_ipi", "CST_PIS",
+    "BC_PIS", "VLR_PIS", "CST_COF", "BC_COF", "VLR_COF"
+]
+
+# Cabeçalho exato das SAÍDAS
+COLS_SAI = [
+    "NF", "DATA_EMISSAO", "CNPJ", "Ufp", "VC_TOTAL", "codi_acu",
+    "CFOP", "COD_ITEM", "nome_acu", "NCM", "UND", "VUNIT",
+    "QTDE", "VITEM", "DESC", "FRETE", "SEG", "OUTRAS",
+    "vlr_cont", "CST", "base_icms", "ALIQ_ICMS", "vlr_icms",
+    "BC_ICMSST", "ICMSST", "vlr_ipi", "CST_PIS", "BC_PIS",
+    "PIS", "CST_COF", "BC_COF", "COF"
+]
+
+# Colunas de valor: saem como float64; o resto (NF, CNPJ, CFOP, NCM, CSTs...) continua texto, com zeros à esquerda
+NUM_ENT = ["VLR_NF", "VUNIT", "QTDE", "VPROD", "DESP", "vlr_cont", "base_icms", "vlr_icms", "BC-ICMS-ST",
+           "ICMS-ST", "vlr_ipi", "BC_PIS", "VLR_PIS", "BC_COF", "VLR_COF"]
+NUM_SAI = ["VC_TOTAL", "VUNIT", "QTDE", "VITEM", "DESC", "FRETE", "SEG", "OUTRAS", "vlr_cont", "base_icms",
+           "ALIQ_ICMS", "vlr_icms", "BC_ICMSST", "ICMSST", "vlr_ipi", "BC_PIS", "PIS", "BC_COF", "COF"]
+
+LINHAS_POR_CHUNK = 100000
+
+def _tipar(df, numericas):
+    # 'R$ 1.234,56' / '1234,56' / '18%' -> float; NT/ISENTO -> 0.0; vazio ou texto que não é número -> NaN
+    for c in numericas: df[c] = numeros_br(df[c], padrao=np.nan)
+    return df
+
+def ler_gerencial(arquivo, colunas, numericas, linhas_por_chunk=LINHAS_POR_CHUNK):
+    """Gera o arquivo gerencial (TXT/CSV ';' em latin-1, ou .xlsx) em DataFrames de até `linhas_por_chunk` linhas já tipados."""
+    arquivo.seek(0)
+    if getattr(arquivo, 'name', '').lower().endswith('.xlsx'):
+        yield _tipar(pd.read_excel(arquivo, header=None, names=colunas, dtype=str), numericas)
+        return
+    leitor = pd.read_csv(arquivo, sep=';', header=None, names=colunas, engine='c', encoding='latin-1',
+                         dtype=str, chunksize=linhas_por_chunk)
+    with leitor:
+        for chunk in leitor: yield _tipar(chunk, numericas)
+
+def _lotes(arquivos, colunas, numericas, rotulo, partes, manter):
     """
-    Replica os dados do CSV no Excel inserindo o cabeçalho fornecido e garantindo a gravação dos dados.
+    Chunks de todos os arquivos, um arquivo por vez. Cada arquivo é lido até o fim num temporário em disco
+    antes de ir para a aba: um arquivo que falha no meio não deixa linhas pela metade no relatório.
+    De cada chunk só as colunas `manter` (as da conciliação) ficam em `partes`, e só se o arquivo inteiro leu.
     """
-    # Cabeçalho exato das ENTRADAS
-    cols_ent = [
-        "NUM_NF", "DATA_EMISSAO", "CNPJ", "UF", "VLR_NF", "codi_acu", 
-        "CFOP", "COD_PROD", "nome_acu", "NCM", "UNID", "VUNIT", 
-        "QTDE", "VPROD", "DESP", "vlr_cont", "CST-ICMS", "base_icms", 
-        "vlr_icms", "BC-ICMS-ST", "ICMS-ST", "vlr_ipi", "CST_PIS", 
-        "BC_PIS", "VLR_PIS", "CST_COF", "BC_COF", "VLR_COF"
-    ]
-
-    # Cabeçalho exato das SAÍDAS
-    cols_sai = [
-        "NF", "DATA_EMISSAO", "CNPJ", "Ufp", "VC_TOTAL", "codi_acu", 
-        "CFOP", "COD_ITEM", "nome_acu", "NCM", "UND", "VUNIT", 
-        "QTDE", "VITEM", "DESC", "FRETE", "SEG", "OUTRAS", 
-        "vlr_cont", "CST", "base_icms", "ALIQ_ICMS", "vlr_icms", 
-        "BC_ICMSST", "ICMSST", "vlr_ipi", "CST_PIS", "BC_PIS", 
-        "PIS", "CST_COF", "BC_COF", "COF"
-    ]
-
-    # --- PROCESSAMENTO ENTRADA ---
-    if ge:
-        arquivos_ge = ge if isinstance(ge, list) else [ge]
-        dfs_e = []
-        for f in arquivos_ge:
+    for f in arquivos:
+        with tempfile.TemporaryFile() as espera:
+            reduzidas = []
             try:
-                f.seek(0)
-                # Lê forçando todos como string e usando engine python para maior compatibilidade
-                df = pd.read_csv(f, sep=';', header=None, names=cols_ent, engine='python', encoding='latin-1', dtype=str)
-                dfs_e.append(df)
+                for chunk in ler_gerencial(f, colunas, numericas):
+                    pickle.dump(chunk, espera, protocol=pickle.HIGHEST_PROTOCOL)
+                    reduzidas.append(chunk[manter])
             except Exception as e:
-                st.error(f"Erro ao processar arquivo de Entrada {f.name}: {e}")
-        
-        if dfs_e:
-            df_final_e = pd.concat(dfs_e, ignore_index=True)
-            df_final_e.to_excel(writer, sheet_name='GERENCIAL_ENTRADAS', index=False)
-
-    # --- PROCESSAMENTO SAÍDA ---
-    if gs:
-        arquivos_gs = gs if isinstance(gs, list) else [gs]
-        dfs_s = []
-        for f in arquivos_gs:
-            try:
-                f.seek(0)
-                df = pd.read_csv(f, sep=';', header=None, names=cols_sai, engine='python', encoding='latin-1', dtype=str)
-                dfs_s.append(df)
-            except Exception as e:
-                st.error(f"Erro ao processar arquivo de Saída {f.name}: {e}")
-        
-        if dfs_s:
-            df_final_s = pd.concat(dfs_s, ignore_index=True)
-            df_final_s.to_excel(writer, sheet_name='GERENCIAL_SAIDAS', index=False)
+                registrar_excecao(e)
+                erro(f"Erro ao processar arquivo de {rotulo} {getattr(f, 'name', f)}: {e}")
+                continue
+            partes.extend(reduzidas)
+            espera.seek(0)
+            for _ in reduzidas: yield pickle.load(espera)
+
+def _gravar_gerencial(writer, arquivos, nome_aba, colunas, numericas, rotulo, manter):
+    if not arquivos: return pd.DataFrame(columns=manter)
+    arquivos = arquivos if isinstance(arquivos, list) else [arquivos]
+    partes = []
+    with etapa(f'gerencial:{rotulo.lower()}') as medida:
+        medida.bytes = tamanho_arquivos(arquivos)
+        gravar_lotes(writer, nome_aba, colunas, _lotes(arquivos, colunas, numericas, rotulo, partes, manter))
+        df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=manter)
+        medida.linhas = len(df)
+    return df
+
+def gerar_abas_gerenciais(writer, ge, gs):
+    """
+    Replica os dados do CSV no Excel com o cabeçalho fornecido, chunk a chunk (parser C, valores numéricos).
+    Devolve (df_ge, df_gs) já tipados, só com as colunas que o cruzamento com os XMLs usa.
+    """
+    df_ge = _gravar_gerencial(writer, ge, 'GERENCIAL_ENTRADAS', COLS_ENT, NUM_ENT, 'Entrada', COLUNAS_GERENCIAL_ENTRADA)
+    df_gs = _gravar_gerencial(writer, gs, 'GERENCIAL_SAIDAS', COLS_SAI, NUM_SAI, 'Saída', COLUNAS_GERENCIAL_SAIDA)
+    return df_ge, df_gs
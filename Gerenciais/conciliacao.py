@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from relatorio_excel import gravar_tabela
+
+# --- CONCILIAÇÃO XML x GERENCIAL ---
+# Os dois lados são somados por chave (NF, CNPJ do participante, CFOP, NCM) e cruzados num merge
+# (hash join): tempo quase linear no número de itens, sem laço de item contra item.
+# Nas entradas o CFOP escriturado é o de entrada (1xxx/2xxx) e o do XML é o do fornecedor (5xxx/6xxx):
+# a chave das entradas fica sem CFOP.
+CHAVES_SAIDA = ['NF', 'CNPJ', 'CFOP', 'NCM']
+CHAVES_ENTRADA = ['NF', 'CNPJ', 'NCM']
+
+# chave -> (coluna do XML, coluna do gerencial)
+MAPA_CHAVES_SAIDA = {'NF': ('NUM_NF', 'NF'), 'CNPJ': ('CNPJ_DEST', 'CNPJ'), 'CFOP': ('CFOP', 'CFOP'), 'NCM': ('NCM', 'NCM')}
+MAPA_CHAVES_ENTRADA = {'NF': ('NUM_NF', 'NUM_NF'), 'CNPJ': ('CNPJ_EMIT', 'CNPJ'), 'NCM': ('NCM', 'NCM')}
+
+# valor comparado -> (coluna do XML, coluna do gerencial)
+VALORES_SAIDA = {'VPROD': ('VPROD', 'VITEM'), 'BC_ICMS': ('BC-ICMS', 'base_icms'),
+                 'ICMS': ('VLR-ICMS', 'vlr_icms'), 'ICMS_ST': ('VAL-ICMS-ST', 'ICMSST')}
+VALORES_ENTRADA = {'VPROD': ('VPROD', 'VPROD'), 'BC_ICMS': ('BC-ICMS', 'base_icms'),
+                   'ICMS': ('VLR-ICMS', 'vlr_icms'), 'ICMS_ST': ('VAL-ICMS-ST', 'ICMS-ST')}
+
+# Só estas colunas do gerencial são guardadas para a conciliação (a aba GERENCIAL_* recebe todas)
+COLUNAS_GERENCIAL_SAIDA = [g for _, g in MAPA_CHAVES_SAIDA.values()] + [g for _, g in VALORES_SAIDA.values()]
+COLUNAS_GERENCIAL_ENTRADA = [g for _, g in MAPA_CHAVES_ENTRADA.values()] + [g for _, g in VALORES_ENTRADA.values()]
+
+TOLERANCIA_CENTAVOS = 1   # diferença aceita por valor (em centavos); aceita também {valor: centavos}
+
+_ZEROS = {'NF': 0, 'CNPJ': 14, 'CFOP': 4, 'NCM': 8}
+
+def _normalizar(serie, chave):
+    """Só dígitos; NF sem zeros à esquerda, CNPJ/CFOP/NCM completados com zeros. Feito uma vez por valor distinto."""
+    codigos, unicos = pd.factorize(serie.astype(object), use_na_sentinel=True)
+    texto = pd.Series(unicos, dtype=object).astype(str).str.replace(r'\D', '', regex=True)
+    texto = texto.str.lstrip('0') if chave == 'NF' else texto.str.zfill(_ZEROS[chave]).where(texto != '', '')
+    texto = np.append(texto.to_numpy(dtype=object), '')
+    return texto[codigos]   # o sentinela -1 cai no '' do fim
+
+def _agrupar(df, mapa_chaves, valores, lado):
+    """Soma os valores e conta os itens por chave normalizada. `lado` 0 = XML, 1 = gerencial."""
+    vazia = pd.Series('', index=df.index, dtype=object)
+    chaves = {k: _normalizar(df[cols[lado]] if cols[lado] in df.columns else vazia, k) for k, cols in mapa_chaves.items()}
+    base = pd.DataFrame(chaves, index=df.index)
+    for nome, cols in valores.items():
+        base[nome] = pd.to_numeric(df[cols[lado]], errors='coerce').fillna(0.0) if cols[lado] in df.columns else 0.0
+    base = base[base['NF'] != '']   # linhas de total/rodapé do gerencial não têm NF
+    grupos = base.groupby(list(mapa_chaves), sort=False)
+    agregado = grupos[list(valores)].sum()
+    agregado.insert(0, 'ITENS', grupos.size())
+    return agregado
+
+def conciliar(df_xml, df_ger, chaves, mapa_chaves, valores, tolerancia_centavos=TOLERANCIA_CENTAVOS):
+    """
+    Cruza XML e gerencial pela chave. Uma linha por chave, com os totais dos dois lados, as diferenças
+    e o diagnóstico: falta no gerencial, falta no XML, valores divergentes (acima da tolerância) ou OK.
+    """
+    mapa = {k: mapa_chaves[k] for k in chaves}
+    xml = _agrupar(df_xml, mapa, valores, 0).add_suffix('_XML')
+    ger = _agrupar(df_ger, mapa, valores, 1).add_suffix('_GER')
+    res = xml.join(ger, how='outer').reset_index()
+
+    so_xml = res['ITENS_GER'].isna().to_numpy()
+    so_ger = res['ITENS_XML'].isna().to_numpy()
+    res[['ITENS_XML', 'ITENS_GER']] = res[['ITENS_XML', 'ITENS_GER']].fillna(0).astype(np.int64)
+
+    divergentes = np.full(len(res), "", dtype=object)
+    for nome in valores:
+        tol = tolerancia_centavos.get(nome, TOLERANCIA_CENTAVOS) if isinstance(tolerancia_centavos, dict) else tolerancia_centavos
+        # comparação em centavos inteiros: 0,1 + 0,2 não vira divergência
+        dif = np.rint(res[f'{nome}_XML'].fillna(0.0).to_numpy() * 100) - np.rint(res[f'{nome}_GER'].fillna(0.0).to_numpy() * 100)
+        res[f'DIF_{nome}'] = dif / 100
+        divergentes = np.where(np.abs(dif) > tol, divergentes + (np.where(divergentes == "", "", " | ")) + nome, divergentes)
+
+    res['DIAGNÓSTICO'] = np.select(
+        [so_xml, so_ger, divergentes != ""],
+        ["❌ Falta no Gerencial", "❌ Falta no XML", "❌ Divergente (" + divergentes + ")"], default="✅ OK")
+    ordem = chaves + ['ITENS_XML', 'ITENS_GER'] + [f'{nome}_{lado}' for nome in valores for lado in ('XML', 'GER')] \
+        + [f'DIF_{nome}' for nome in valores] + ['DIAGNÓSTICO']
+    return res[ordem]
+
+def conciliar_saidas(df_xs, df_gs, tolerancia_centavos=TOLERANCIA_CENTAVOS):
+    return conciliar(df_xs, df_gs, CHAVES_SAIDA, MAPA_CHAVES_SAIDA, VALORES_SAIDA, tolerancia_centavos)
+
+def conciliar_entradas(df_xe, df_ge, tolerancia_centavos=TOLERANCIA_CENTAVOS):
+    return conciliar(df_xe, df_ge, CHAVES_ENTRADA, MAPA_CHAVES_ENTRADA, VALORES_ENTRADA, tolerancia_centavos)
+
+def gerar_abas_conciliacao(writer, df_xe, df_xs, df_ge, df_gs, tolerancia_centavos=TOLERANCIA_CENTAVOS):
+    """Grava CONCILIACAO_SAIDAS / CONCILIACAO_ENTRADAS para os lados que tiverem gerencial. Devolve {aba: DataFrame}."""
+    abas = {}
+    if df_gs is not None and not df_gs.empty:
+        abas['CONCILIACAO_SAIDAS'] = conciliar_saidas(df_xs, df_gs, tolerancia_centavos)
+    if df_ge is not None and not df_ge.empty:
+        abas['CONCILIACAO_ENTRADAS'] = conciliar_entradas(df_xe, df_ge, tolerancia_centavos)
+    for aba, df in abas.items(): gravar_tabela(writer, aba, df)
+    return abas
@@ -1,4 +1,6 @@
 import pandas as pd
+from relatorio_excel import gravar_tabela
+from instrumentacao import registrar_excecao
 
 def processar_ret_mg(df_xml_saida, df_xml_entrada, writer, df_gerencial_saida, df_gerencial_entrada):
     """
@@ -15,8 +17,8 @@ def processar_ret_mg(df_xml_saida, df_xml_entrada, writer, df_gerencial_saida, d
             # Aqui filtramos e organizamos as colunas conforme sua planilha AC
             # Exemplo: Notas de imobilizado, uso e consumo ou que geram estorno
             aba_ac = df_gerencial_entrada.copy()
-            aba_ac.to_excel(writer, sheet_name='ENTRADAS_AC', index=False)
-    except: pass
+            gravar_tabela(writer, 'ENTRADAS_AC', aba_ac)
+    except Exception as e: registrar_excecao(e, onde='ret_mg')
 
     # 2. ABA: APURAÇÃO ICMS (A MAIS COMPLEXA)
     # Objetivo: Calcular ICMS Normal, RET, ST MG e ST Outros Estados (IEST)
@@ -33,8 +35,8 @@ def processar_ret_mg(df_xml_saida, df_xml_entrada, writer, df_gerencial_saida, d
         # linha a linha para chegar no imposto a recolher por guia.
         
         df_apuracao = pd.DataFrame(resumo_apuracao)
-        df_apuracao.to_excel(writer, sheet_name='APURACAO_ICMS_RET', index=False)
-    except: pass
+        gravar_tabela(writer, 'APURACAO_ICMS_RET', df_apuracao)
+    except Exception as e: registrar_excecao(e, onde='ret_mg')
 
     # 3. ABA: MAPA RET (Placeholder para o PTA)
     # Como muda por cliente, criamos o espaço para os dados do PTA
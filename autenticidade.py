@@ -0,0 +1,117 @@
+import io
+import csv
+import numpy as np
+import pandas as pd
+from avisos import aviso
+from instrumentacao import registrar_excecao
+
+try:
+    import pyarrow  # noqa: F401  (só para escolher o parser do read_csv)
+    MOTOR_CSV = 'pyarrow'
+except ImportError:
+    MOTOR_CSV = 'c'
+
+# --- AUTENTICIDADE (SITUAÇÃO DA NOTA NOS PORTAIS DA SEFAZ) ---
+# Dos relatórios de autenticidade só interessam a coluna 0 (chave, às vezes com "NFe" na frente)
+# e a coluna 5 (situação). Os arquivos podem ter milhões de linhas: o separador é detectado numa
+# amostra, o parser é o C/pyarrow lendo só essas duas colunas e o índice guarda a chave em 44 bytes.
+COL_CHAVE, COL_SITUACAO = 0, 5
+SEPARADORES = ';,\t|'
+TAMANHO_AMOSTRA = 64 * 1024
+NAO_ENCONTRADA = '⚠️ N/Encontrada'
+
+def detectar_separador(amostra):
+    """
+    Separador mais provável numa amostra de texto: o que rende ao menos até a coluna da situação com a mesma
+    contagem na maioria das linhas (valores como '1,5' não enganam); sem candidato, Sniffer; por fim ';'.
+    """
+    linhas = [l for l in amostra.splitlines()[:50] if l.strip()]
+    if not linhas: return ';'
+    pontos = {}
+    for s in SEPARADORES:
+        contagens = pd.Series([l.count(s) for l in linhas])
+        moda = contagens.mode().iloc[0]
+        if moda >= COL_SITUACAO: pontos[s] = (contagens == moda).sum()
+    if pontos: return max(pontos, key=pontos.get)
+    try: return csv.Sniffer().sniff(amostra, delimiters=SEPARADORES).delimiter
+    except csv.Error: return ';'
+
+def _nome(arquivo):
+    return getattr(arquivo, 'name', str(arquivo))
+
+def _ler_csv(arquivo):
+    arquivo.seek(0)
+    amostra = arquivo.read(TAMANHO_AMOSTRA)
+    arquivo.seek(0)
+    if isinstance(amostra, bytes):
+        amostra = amostra.decode('utf-8', errors='ignore')
+    sep = detectar_separador(amostra)
+    opcoes = dict(sep=sep, header=None, usecols=[COL_CHAVE, COL_SITUACAO], dtype=str)
+    try:
+        return pd.read_csv(arquivo, engine=MOTOR_CSV, **opcoes)
+    except Exception:
+        # linhas irregulares (rodapés, totais) ou arquivo em latin-1: parser C pulando o que não fecha
+        arquivo.seek(0)
+        bruto = arquivo.read()
+        if isinstance(bruto, bytes):
+            try: bruto = bruto.decode('utf-8')
+            except UnicodeDecodeError: bruto = bruto.decode('latin-1')
+        return pd.read_csv(io.StringIO(bruto), engine='c', on_bad_lines='skip', **opcoes)
+
+def ler_autenticidade(arquivo):
+    """DataFrame (CHAVE, SITUACAO) de um relatório .xlsx/.csv/.txt; a chave sai só com os 44 dígitos."""
+    if _nome(arquivo).lower().endswith('.xlsx'):
+        arquivo.seek(0)
+        df = pd.read_excel(arquivo, header=None, usecols=[COL_CHAVE, COL_SITUACAO], dtype=str)
+    else:
+        df = _ler_csv(arquivo)
+    df.columns = ['CHAVE', 'SITUACAO']
+    df['CHAVE'] = df['CHAVE'].str.extract(r'(\d{44})', expand=False)
+    return df[df['CHAVE'].notna()]
+
+class IndiceAutenticidade:
+    """
+    Chave (44 bytes, ordenada) -> situação (código numa lista de situações distintas). Em chave repetida
+    vale a última lida, como no antigo dict.update. Montado uma vez e usado nas entradas e nas saídas.
+    """
+    def __init__(self, tabelas=()):
+        tabelas = [t for t in tabelas if not t.empty]
+        if tabelas:
+            tudo = pd.concat(tabelas, ignore_index=True)
+            codigos, self.situacoes = pd.factorize(tudo['SITUACAO'], use_na_sentinel=True)
+            chaves = tudo['CHAVE'].to_numpy(dtype='S44')
+            ordem = np.argsort(chaves, kind='stable')
+            chaves, codigos = chaves[ordem], codigos[ordem]
+            ultima = np.append(chaves[1:] != chaves[:-1], True)
+            self.chaves, self.codigos = chaves[ultima], codigos[ultima].astype(np.int32)
+        else:
+            self.situacoes = pd.Index([])
+            self.chaves, self.codigos = np.array([], dtype='S44'), np.array([], dtype=np.int32)
+
+    @classmethod
+    def de_arquivos(cls, *grupos):
+        """Aceita arquivos soltos ou listas de arquivos (uploads múltiplos); arquivo ilegível é avisado e ignorado."""
+        tabelas = []
+        for grupo in grupos:
+            for arquivo in (grupo if isinstance(grupo, (list, tuple)) else [grupo] if grupo else []):
+                try: tabelas.append(ler_autenticidade(arquivo))
+                except Exception as e:
+                    registrar_excecao(e)
+                    aviso(f"Autenticidade ignorada ({_nome(arquivo)}): {e}")
+        return cls(tabelas)
+
+    def __len__(self):
+        return len(self.chaves)
+
+    def situacao(self, chaves_xml):
+        """Situação de cada chave do XML (categórica); fora do índice (ou sem situação) vira '⚠️ N/Encontrada'."""
+        consulta = np.asarray(pd.Series(chaves_xml).astype(str).to_numpy(dtype=object), dtype='S44')
+        codigos = np.full(len(consulta), -1, dtype=np.int32)
+        if len(self.chaves):
+            pos = np.minimum(np.searchsorted(self.chaves, consulta), len(self.chaves) - 1)
+            achou = self.chaves[pos] == consulta
+            codigos[achou] = self.codigos[pos[achou]]
+        categorias = list(self.situacoes)
+        if NAO_ENCONTRADA not in categorias: categorias.append(NAO_ENCONTRADA)
+        codigos = np.where(codigos < 0, categorias.index(NAO_ENCONTRADA), codigos)
+        return pd.Categorical.from_codes(codigos, categories=categorias)
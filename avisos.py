@@ -0,0 +1,32 @@
+import sys
+import logging
+from progresso import progresso_atual
+
+# --- AVISOS AO USUÁRIO (STREAMLIT QUANDO O APP ESTÁ RODANDO, LOG NO MODO LOTE) ---
+# O core e as auditorias não importam o Streamlit: só usam a interface se o app já a carregou
+# e há uma sessão ativa; no lote (sentinela_batch.py) a mesma mensagem vai para o log. Na análise em
+# segundo plano do app (thread sem sessão) a mensagem também fica no Progresso, para o app mostrar no fim.
+log = logging.getLogger("sentinela")
+
+def _streamlit_ativo():
+    st = sys.modules.get("streamlit")
+    if st is None: return None
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return st if get_script_run_ctx() is not None else None
+    except Exception:
+        return None
+
+def _guardar(nivel, mensagem):
+    progresso = progresso_atual()
+    if progresso is not None: progresso.avisos.append((nivel, mensagem))
+
+def erro(mensagem):
+    st = _streamlit_ativo()
+    if st: st.error(mensagem); return
+    _guardar('erro', mensagem); log.error(mensagem)
+
+def aviso(mensagem):
+    st = _streamlit_ativo()
+    if st: st.warning(mensagem); return
+    _guardar('aviso', mensagem); log.warning(mensagem)
@@ -0,0 +1,92 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+
+# --- CACHE PERSISTENTE DE NOTAS JÁ EXTRAÍDAS (POR CNPJ AUDITADO) ---
+PASTA_CACHE = ".sentinela_cache"
+ARQUIVO_CACHE_NOTAS = os.path.join(PASTA_CACHE, "notas_xml.sqlite")
+LIMITE_CACHE_MB = 512
+
+_RE_CHAVE = re.compile(rb'Id=["\']NFe(\d{44})["\']')
+
+def chave_rapida(content):
+    """Localiza a chave de acesso direto nos bytes, sem parsear o XML."""
+    achado = _RE_CHAVE.search(content)
+    return achado.group(1).decode() if achado else None
+
+def hash_conteudo(content):
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+def serializar_nota(nota):
+    return json.dumps(nota, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def desserializar_nota(blob):
+    return json.loads(blob)
+
+class CacheNotas:
+    """
+    Guarda (cabeçalho, itens) de cada NF-e em SQLite, chaveado por CNPJ auditado + chave de acesso + hash do XML.
+    Uma versão de esquema diferente da gravada apaga o cache inteiro; acima do limite, saem as notas menos usadas.
+    """
+    def __init__(self, cnpj_auditado, versao, caminho=ARQUIVO_CACHE_NOTAS, limite_mb=LIMITE_CACHE_MB):
+        self.cnpj = re.sub(r'\D', '', str(cnpj_auditado))
+        self.limite = int(limite_mb * 1024 * 1024)
+        self._acessos = []
+
+        pasta = os.path.dirname(caminho)
+        if pasta: os.makedirs(pasta, exist_ok=True)
+        self.con = sqlite3.connect(caminho, timeout=30)
+        self.con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.con.execute("PRAGMA journal_mode = WAL")
+        self.con.execute("CREATE TABLE IF NOT EXISTS meta (nome TEXT PRIMARY KEY, valor TEXT)")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS notas (
+            cnpj TEXT, chave TEXT, hash TEXT, dados BLOB, tamanho INTEGER, acesso REAL,
+            PRIMARY KEY (cnpj, chave, hash))""")
+        self.con.execute("CREATE INDEX IF NOT EXISTS idx_notas_acesso ON notas (acesso)")
+
+        gravada = self.con.execute("SELECT valor FROM meta WHERE nome = 'versao'").fetchone()
+        if gravada is None or gravada[0] != str(versao):
+            self.con.execute("DELETE FROM notas")
+            self.con.execute("INSERT OR REPLACE INTO meta VALUES ('versao', ?)", (str(versao),))
+        self.con.commit()
+
+    def buscar(self, chave, hash_xml):
+        linha = self.con.execute("SELECT dados FROM notas WHERE cnpj = ? AND chave = ? AND hash = ?",
+                                 (self.cnpj, chave, hash_xml)).fetchone()
+        if linha is None: return None
+        self._acessos.append((chave, hash_xml))
+        return linha[0]
+
+    def guardar(self, novas):
+        """`novas` é uma lista de (chave, hash, blob serializado). Grava na hora: o banco fica travado só durante um lote."""
+        agora = time.time()
+        self.con.executemany("INSERT OR REPLACE INTO notas VALUES (?, ?, ?, ?, ?, ?)",
+                             [(self.cnpj, c, h, b, len(b), agora) for c, h, b in novas])
+        self.con.commit()
+
+    def salvar(self):
+        agora = time.time()
+        self.con.executemany("UPDATE notas SET acesso = ? WHERE cnpj = ? AND chave = ? AND hash = ?",
+                             [(agora, self.cnpj, c, h) for c, h in self._acessos])
+        self._acessos = []
+        self._despejar()
+        self.con.commit()
+
+    def _despejar(self):
+        total = self.con.execute("SELECT COALESCE(SUM(tamanho), 0) FROM notas").fetchone()[0]
+        if total <= self.limite: return
+        # Remove as notas menos acessadas (de qualquer CNPJ) até ficar em 90% do limite
+        excesso = total - int(self.limite * 0.9)
+        remover = []
+        for rowid, tamanho in self.con.execute("SELECT rowid, tamanho FROM notas ORDER BY acesso"):
+            remover.append((rowid,)); excesso -= tamanho
+            if excesso <= 0: break
+        self.con.executemany("DELETE FROM notas WHERE rowid = ?", remover)
+        self.con.execute("PRAGMA incremental_vacuum")
+
+    def fechar(self):
+        try: self.salvar()
+        finally: self.con.close()
@@ -0,0 +1,196 @@
+import os
+import pickle
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from cache_notas import PASTA_CACHE
+
+# --- MEMOIZAÇÃO DOS RESULTADOS DA ANÁLISE (ENTRE RERUNS DO APP) ---
+# Duas entradas por análise, endereçadas pelo conteúdo do que as produziu:
+#   xml:       bytes dos XMLs/ZIPs + CNPJ auditado + versão do código -> (df_xe, df_xs) recém-extraídos
+#   relatorio: chave xml + cliente + regime + RET + bytes de autenticidade/gerenciais + gabarito e TIPI
+#              (mtime/tamanho) + opções do relatório + versão do código -> bytes do .xlsx (só de rodadas
+#              limpas: sem cancelamento, sem exceção tratada no relatório e sem exportação Parquet/Arrow)
+# A mesma submissão devolve o relatório pronto; trocar só o regime reaproveita a extração.
+# Os valores ficam serializados (pickle) numa LRU em memória; o que sai dela vai para o disco
+# (PASTA_RESULTADOS), que também é limitado e perde primeiro os arquivos usados há mais tempo.
+# O .xlsx vai direto para o disco, de arquivo para arquivo (guardar_arquivo/buscar_arquivo), sem passar pela memória.
+PASTA_RESULTADOS = os.path.join(PASTA_CACHE, "resultados")
+LIMITE_MEMORIA_MB = 512
+LIMITE_DISCO_MB = 4096
+BLOCO_HASH = 1 << 20
+PASTA_CODIGO = os.path.dirname(os.path.abspath(__file__))
+PACOTES_CODIGO = ("Apuracoes", "Auditorias", "Gerenciais", "RET")
+
+def _hash_arquivo(h, arquivo):
+    """Alimenta `h` com o nome e os bytes de um arquivo (caminho ou aberto), sem mexer na posição de leitura."""
+    if isinstance(arquivo, (str, os.PathLike)):
+        h.update(os.path.basename(arquivo).encode())
+        with open(arquivo, 'rb') as f:
+            for bloco in iter(lambda: f.read(BLOCO_HASH), b""): h.update(bloco)
+        return
+    h.update(str(getattr(arquivo, 'name', '')).encode())
+    posicao = arquivo.tell(); arquivo.seek(0)
+    for bloco in iter(lambda: arquivo.read(BLOCO_HASH), b""): h.update(bloco)
+    arquivo.seek(posicao)
+
+def hash_arquivos(*grupos):
+    """Hash do conteúdo (e nome, que decide .xml ou .zip) dos arquivos, na ordem; listas e None aceitos."""
+    h = hashlib.blake2b(digest_size=16)
+    for grupo in grupos:
+        h.update(b"\x00grupo")
+        for arquivo in (grupo if isinstance(grupo, (list, tuple)) else [grupo]):
+            if arquivo is None: continue
+            h.update(b"\x00arquivo"); _hash_arquivo(h, arquivo)
+    return h.hexdigest()
+
+def assinatura_arquivo(caminho):
+    try: estado = os.stat(caminho); return f"{estado.st_mtime_ns}:{estado.st_size}"
+    except OSError: return "-"
+
+def versao_codigo(pasta=PASTA_CODIGO, pacotes=PACOTES_CODIGO):
+    """
+    Assinatura dos módulos do Sentinela (caminho, mtime, tamanho dos .py da raiz e dos pacotes): qualquer
+    mudança no código invalida o cache. Só esses: exportações, relatórios e ambientes virtuais ficam de fora.
+    """
+    partes = []
+    for pacote in ("",) + tuple(pacotes):
+        raiz = os.path.join(pasta, pacote)
+        try: nomes = sorted(os.listdir(raiz))
+        except OSError: continue
+        partes += [f"{os.path.join(pacote, a)}={assinatura_arquivo(os.path.join(raiz, a))}" for a in nomes if a.endswith('.py')]
+    return hashlib.blake2b("|".join(partes).encode(), digest_size=16).hexdigest()
+
+def chave_resultado(*partes):
+    return hashlib.blake2b("|".join(map(str, partes)).encode(), digest_size=16).hexdigest()
+
+class CacheResultados:
+    """LRU de blobs em memória com transbordo para o disco. Segura para as threads do app (um lock só)."""
+    def __init__(self, pasta=PASTA_RESULTADOS, limite_memoria_mb=LIMITE_MEMORIA_MB, limite_disco_mb=LIMITE_DISCO_MB):
+        self.pasta = pasta
+        self.limite_memoria = int(limite_memoria_mb * 1024 * 1024)
+        self.limite_disco = int(limite_disco_mb * 1024 * 1024)
+        self._memoria = OrderedDict()   # chave -> blob, do menos para o mais recente
+        self._tamanho = 0
+        self._lock = threading.Lock()
+
+    def _arquivo(self, chave):
+        return os.path.join(self.pasta, f"{chave}.bin")
+
+    # --- blobs ---
+    def buscar(self, chave):
+        with self._lock:
+            blob = self._memoria.get(chave)
+            if blob is not None:
+                self._memoria.move_to_end(chave); return blob
+            arquivo = self._arquivo(chave)
+            try:
+                with open(arquivo, 'rb') as f: blob = f.read()
+                os.utime(arquivo)   # mtime = último uso, para o despejo do disco
+            except OSError:
+                return None
+            self._guardar_memoria(chave, blob)
+            return blob
+
+    def guardar(self, chave, blob):
+        with self._lock:
+            self._guardar_memoria(chave, blob)
+
+    def _guardar_memoria(self, chave, blob):
+        if chave in self._memoria: self._tamanho -= len(self._memoria.pop(chave))
+        if len(blob) > self.limite_memoria: self._transbordar(chave, blob); return   # sozinho já estoura a memória
+        self._memoria[chave] = blob; self._tamanho += len(blob)
+        while self._tamanho > self.limite_memoria and len(self._memoria) > 1:
+            antiga, removido = self._memoria.popitem(last=False)
+            self._tamanho -= len(removido)
+            self._transbordar(antiga, removido)
+
+    def _transbordar(self, chave, blob):
+        """Grava no disco o que saiu da memória (se ainda não estiver lá) e mantém a pasta no limite."""
+        arquivo = self._arquivo(chave)
+        if os.path.exists(arquivo): return
+        if len(blob) > self.limite_disco: return
+        try:
+            os.makedirs(self.pasta, exist_ok=True)
+            # grava ao lado e troca de uma vez: ninguém lê um arquivo pela metade
+            fd, temporario = tempfile.mkstemp(dir=self.pasta, suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f: f.write(blob)
+            os.replace(temporario, arquivo)
+            self._despejar_disco()
+        except OSError:
+            pass   # o cache em disco é só um atalho: sem espaço, a entrada é simplesmente perdida
+
+    def _despejar_disco(self):
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            if not nome.endswith('.bin'): continue
+            try: estado = os.stat(os.path.join(self.pasta, nome))
+            except OSError: continue
+            arquivos.append((estado.st_mtime, estado.st_size, nome))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        if total <= self.limite_disco: return
+        # Remove os menos usados até ficar em 90% do limite
+        for _, tamanho, nome in sorted(arquivos):
+            if total <= self.limite_disco * 0.9: break
+            try: os.remove(os.path.join(self.pasta, nome)); total -= tamanho
+            except OSError: pass
+
+    # --- arquivos (só no disco) ---
+    def guardar_arquivo(self, chave, caminho):
+        """Copia o arquivo para o disco do cache sem lê-lo para a memória."""
+        with self._lock:
+            if chave in self._memoria: self._tamanho -= len(self._memoria.pop(chave))
+            try:
+                if os.path.getsize(caminho) > self.limite_disco: return
+                os.makedirs(self.pasta, exist_ok=True)
+                fd, temporario = tempfile.mkstemp(dir=self.pasta, suffix=".tmp"); os.close(fd)
+                shutil.copyfile(caminho, temporario)
+                os.replace(temporario, self._arquivo(chave))
+                self._despejar_disco()
+            except OSError:
+                pass
+
+    def buscar_arquivo(self, chave, destino):
+        """Copia a entrada para `destino` (arquivo a arquivo); False se ela não está no cache."""
+        with self._lock:
+            blob = self._memoria.get(chave)
+            try:
+                if blob is not None:
+                    with open(destino, 'wb') as f: f.write(blob)
+                    return True
+                arquivo = self._arquivo(chave)
+                shutil.copyfile(arquivo, destino)
+                os.utime(arquivo)
+                return True
+            except OSError:
+                return False
+
+    # --- objetos ---
+    def buscar_objeto(self, chave):
+        """Objeto novo a cada busca (desserializado): quem recebe pode alterá-lo à vontade."""
+        blob = self.buscar(chave)
+        return pickle.loads(blob) if blob is not None else None
+
+    def guardar_objeto(self, chave, objeto):
+        self.guardar(chave, pickle.dumps(objeto, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def limpar(self):
+        with self._lock:
+            self._memoria.clear(); self._tamanho = 0
+            if not os.path.isdir(self.pasta): return
+            for nome in os.listdir(self.pasta):
+                if nome.endswith('.bin'):
+                    try: os.remove(os.path.join(self.pasta, nome))
+                    except OSError: pass
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def cache_padrao():
+    """Cache único do processo (no app, compartilhado pelas sessões e preservado entre os reruns)."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None: _CACHE = CacheResultados()
+        return _CACHE
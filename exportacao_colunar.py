@@ -0,0 +1,106 @@
+import os
+import re
+import pandas as pd
+from Auditorias.auditoria_fundida import auditorias_saidas
+from Apuracoes.apuracao_difal import tabela_resumo_uf
+from avisos import aviso
+from instrumentacao import registrar_excecao
+
+# pyarrow é opcional: só a exportação colunar precisa dele
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = pc = ds = None
+PYARROW_DISPONIVEL = pa is not None
+
+# --- EXPORTAÇÃO COLUNAR (PARQUET / ARROW IPC) PARA O BI ---
+# Cada aba vira um dataset particionado no estilo hive:
+#   <pasta>/<ABA>/COD_CLIENTE=<cód>/COMPETENCIA=<AAAA-MM>/<ABA>-0.parquet
+# Reexportar o mesmo cliente/competência substitui só aquela partição.
+PASTA_EXPORTACAO = "Exportacao_BI"
+FORMATOS = {"parquet": "parquet", "arrow": "ipc"}
+LIMITE_DICIONARIO = 0.5     # texto com até 50% de valores distintos vira coluna dicionário
+SEM_DATA = "SEM_DATA"
+
+_RE_COMPETENCIA = re.compile(r'^\d{4}-\d{2}$')
+
+def competencias(df):
+    """AAAA-MM de cada item a partir da DATA_EMISSAO do XML (dhEmi/dEmi); sem data válida vira SEM_DATA."""
+    if 'DATA_EMISSAO' not in df.columns: return pd.Series(SEM_DATA, index=df.index)
+    comp = df['DATA_EMISSAO'].astype(str).str[:7]
+    return comp.where(comp.str.match(_RE_COMPETENCIA), SEM_DATA)
+
+def _codificar(coluna):
+    """Texto repetitivo (UF, CFOP, CST, diagnósticos...) vai como dicionário; o resto fica como está."""
+    if not (pa.types.is_string(coluna.type) or pa.types.is_large_string(coluna.type)) or len(coluna) == 0:
+        return coluna
+    if pc.count_distinct(coluna).as_py() > len(coluna) * LIMITE_DICIONARIO: return coluna
+    return pc.dictionary_encode(coluna)
+
+def _tabela_arrow(blocos, cod_cliente, competencia):
+    nomes, colunas = [], []
+    for bloco in blocos:
+        tabela = pa.Table.from_pandas(bloco, preserve_index=False)
+        nomes += tabela.column_names
+        colunas += [_codificar(c) for c in tabela.columns]
+    n = len(competencia)
+    nomes += ['COD_CLIENTE', 'COMPETENCIA']
+    colunas += [pa.array([str(cod_cliente)] * n, pa.string()), pa.array(competencia.to_numpy(dtype=object), pa.string())]
+    return pa.Table.from_arrays(colunas, names=nomes)
+
+def _gravar_dataset(tabela, pasta, aba, formato):
+    ds.write_dataset(
+        tabela, os.path.join(pasta, aba), format=FORMATOS[formato],
+        partitioning=ds.partitioning(pa.schema([('COD_CLIENTE', pa.string()), ('COMPETENCIA', pa.string())]), flavor='hive'),
+        basename_template=f"{aba}-{{i}}.{formato}", existing_data_behavior='delete_matching')
+
+def exigir_pyarrow():
+    if pa is None: raise ImportError("A exportação Parquet/Arrow precisa do pacote 'pyarrow' (pip install pyarrow).")
+
+class ExportacaoColunar:
+    """
+    Destino colunar das abas de auditoria ao lado do Excel: recebe as mesmas análises já calculadas para o
+    relatório (nada é auditado duas vezes). Sem pyarrow falha logo ao ser criada, antes de qualquer cálculo.
+    """
+    def __init__(self, cod_cliente, pasta=PASTA_EXPORTACAO, formato="parquet"):
+        exigir_pyarrow()
+        if formato not in FORMATOS: raise ValueError(f"Formato de exportação desconhecido: {formato}")
+        self.cod_cliente, self.pasta, self.formato = cod_cliente, pasta, formato
+        self.gravadas = {}   # {aba: linhas gravadas}
+
+    def gravar_aba(self, aba, linhas, analise):
+        if linhas.empty: return
+        _gravar_dataset(_tabela_arrow([linhas, analise], self.cod_cliente, competencias(linhas)), self.pasta, aba, self.formato)
+        self.gravadas[aba] = len(linhas)
+
+    def gravar_resumo_uf(self, df_xs, df_xe=pd.DataFrame()):
+        """DIFAL_ST_FECP: o resumo por UF é calculado dentro de cada competência."""
+        comp_xs, comp_xe = competencias(df_xs), competencias(df_xe)
+        resumos = []
+        for comp in comp_xs.unique():
+            try: resumo = tabela_resumo_uf(df_xs[comp_xs == comp], df_xe[comp_xe == comp] if not df_xe.empty else None)
+            except Exception as e:
+                registrar_excecao(e)
+                aviso(f"Resumo DIFAL/ST/FCP por UF de {comp} fora da exportação colunar: {e}")
+                continue
+            resumos.append(resumo.assign(COMPETENCIA=comp))
+        if not resumos: return
+        resumo = pd.concat(resumos, ignore_index=True)
+        _gravar_dataset(_tabela_arrow([resumo.drop(columns='COMPETENCIA')], self.cod_cliente, resumo['COMPETENCIA']),
+                        self.pasta, 'DIFAL_ST_FECP', self.formato)
+        self.gravadas['DIFAL_ST_FECP'] = len(resumo)
+
+def exportar_auditorias(df_xs, cod_cliente, regime="Lucro Real", df_xe=pd.DataFrame(), pasta=PASTA_EXPORTACAO, formato="parquet"):
+    """
+    Só a exportação (sem Excel): grava ICMS_AUDIT, IPI_AUDIT, PIS_COFINS_AUDIT, DIFAL_AUDIT e DIFAL_ST_FECP
+    como datasets colunares particionados por cliente e competência. Espera df_xs já com o Status de
+    autenticidade. Devolve {aba: linhas gravadas}.
+    """
+    exportacao = ExportacaoColunar(cod_cliente, pasta, formato)
+    if df_xs.empty: return exportacao.gravadas
+    for aba, linhas, analise in auditorias_saidas(df_xs, cod_cliente, regime, df_xe):
+        exportacao.gravar_aba(aba, linhas, analise)
+    exportacao.gravar_resumo_uf(df_xs, df_xe)
+    return exportacao.gravadas
@@ -0,0 +1,199 @@
+import os
+import io
+import json
+import time
+import pstats
+import logging
+import cProfile
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+from cache_notas import PASTA_CACHE
+from progresso import ao_iniciar_etapa
+
+# --- INSTRUMENTAÇÃO DAS ETAPAS (TEMPO, LINHAS, BYTES LIDOS, MEMÓRIA, EXCEÇÕES ENGOLIDAS) ---
+# `etapa(nome)` marca um trecho do processamento e só registra algo dentro de `medir_execucao()`, que junta
+# as etapas da rodada, liga o tracemalloc (pico de memória Python por etapa) e, se pedido, o cProfile.
+# Cada etapa encerrada vira uma linha JSON no logger "sentinela.performance". As exceções que o código
+# trata e segue adiante passam por `registrar_excecao` e ficam contadas na etapa em que aconteceram.
+log = logging.getLogger("sentinela.performance")
+PASTA_PERFIS = os.path.join(PASTA_CACHE, "perfis")
+MAX_EXCECOES_GUARDADAS = 50
+LINHAS_RESUMO_PERFIL = 30
+
+_MEDICAO = contextvars.ContextVar("medicao_sentinela", default=None)
+_CONTAGENS = contextvars.ContextVar("contagens_excecoes", default=())
+
+class Etapa:
+    """Um trecho medido. `linhas` e `bytes` são preenchidos por quem abre a etapa (ou por contar_bytes)."""
+    def __init__(self, nome, pai=None, nivel=0, linhas=None):
+        self.nome, self.pai, self.nivel = nome, pai, nivel
+        self.linhas = linhas
+        self.bytes = 0
+        self.segundos = 0.0
+        self.pico_mb = None      # pico de memória rastreada pelo tracemalloc durante a etapa
+        self.alocado_mb = None   # memória rastreada que ficou retida ao fim da etapa
+        self.excecoes = 0
+        self.erro = None
+        self._pico = 0
+        self._memoria_inicio = 0
+
+    def como_dict(self):
+        return {'etapa': self.nome, 'pai': self.pai, 'nivel': self.nivel, 'segundos': round(self.segundos, 4),
+                'linhas': self.linhas, 'bytes': self.bytes, 'pico_mb': self.pico_mb, 'alocado_mb': self.alocado_mb,
+                'excecoes': self.excecoes, 'erro': self.erro}
+
+class Medicao:
+    """Etapas de uma rodada, na ordem em que começaram, mais as exceções engolidas e o perfil (se houver)."""
+    def __init__(self, memoria=True):
+        self.memoria = memoria
+        self.etapas = []
+        self.excecoes = []          # (etapa, tipo, mensagem, quantidade), no máximo MAX_EXCECOES_GUARDADAS
+        self.total_excecoes = 0
+        self.segundos = 0.0
+        self.perfil = None          # caminho do .prof gravado
+        self.resumo_perfil = None   # funções mais caras (pstats, tempo acumulado)
+        self._pilha = []
+
+    @property
+    def atual(self):
+        return self._pilha[-1] if self._pilha else None
+
+    def tabela(self):
+        """Uma linha por etapa, indentada pelo nível, para o app."""
+        return pd.DataFrame({
+            'Etapa': ["   " * e.nivel + e.nome for e in self.etapas],
+            'Segundos': [round(e.segundos, 3) for e in self.etapas],
+            'Linhas': pd.array([e.linhas for e in self.etapas], dtype="Int64"),
+            'MB lidos': [round(e.bytes / 2**20, 2) if e.bytes else None for e in self.etapas],
+            'Pico MB': [e.pico_mb for e in self.etapas],
+            'Retido MB': [e.alocado_mb for e in self.etapas],
+            'Exceções': [e.excecoes for e in self.etapas],
+        })
+
+    def como_dict(self):
+        return {'segundos': round(self.segundos, 4), 'excecoes': self.total_excecoes, 'perfil': self.perfil,
+                'etapas': [e.como_dict() for e in self.etapas],
+                'detalhes_excecoes': [dict(zip(('etapa', 'tipo', 'mensagem', 'quantidade'), x)) for x in self.excecoes]}
+
+    def _gravar_perfil(self, perfilador, pasta):
+        os.makedirs(pasta, exist_ok=True)
+        self.perfil = os.path.join(pasta, f"sentinela_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}.prof")
+        perfilador.dump_stats(self.perfil)
+        texto = io.StringIO()
+        pstats.Stats(perfilador, stream=texto).sort_stats("cumulative").print_stats(LINHAS_RESUMO_PERFIL)
+        self.resumo_perfil = texto.getvalue()
+
+def _log_json(evento, nivel=logging.INFO, **campos):
+    if log.isEnabledFor(nivel): log.log(nivel, json.dumps({'evento': evento, **campos}, ensure_ascii=False, default=str))
+
+@contextmanager
+def medir_execucao(memoria=True, perfil=False, pasta_perfis=PASTA_PERFIS):
+    """
+    Abre uma rodada de medição: as etapas abertas dentro dela (inclusive nas funções chamadas) entram na Medicao
+    devolvida. `memoria` liga o tracemalloc (deixa o Python mais lento); `perfil` grava um .prof do cProfile.
+    """
+    medicao = Medicao(memoria)
+    token = _MEDICAO.set(medicao)
+    ligou_tracemalloc = memoria and not tracemalloc.is_tracing()
+    if ligou_tracemalloc: tracemalloc.start()
+    perfilador = cProfile.Profile() if perfil else None
+    inicio = time.perf_counter()
+    if perfilador: perfilador.enable()
+    try:
+        yield medicao
+    finally:
+        if perfilador:
+            perfilador.disable()
+            try: medicao._gravar_perfil(perfilador, pasta_perfis)
+            except OSError as e: registrar_excecao(e, medicao=medicao)
+        medicao.segundos = time.perf_counter() - inicio
+        if ligou_tracemalloc: tracemalloc.stop()
+        _MEDICAO.reset(token)
+        _log_json('execucao', segundos=round(medicao.segundos, 4), etapas=len(medicao.etapas),
+                  excecoes=medicao.total_excecoes, perfil=medicao.perfil)
+
+@contextmanager
+def etapa(nome, linhas=None):
+    """Mede o trecho como uma etapa da rodada atual. Fora de medir_execucao só devolve uma Etapa avulsa."""
+    ao_iniciar_etapa(nome)   # mensagem da barra de progresso e ponto de cancelamento (progresso.py)
+    medicao = _MEDICAO.get()
+    if medicao is None:
+        yield Etapa(nome, linhas=linhas)
+        return
+
+    pai = medicao.atual
+    e = Etapa(nome, pai.nome if pai else None, len(medicao._pilha), linhas)
+    medicao.etapas.append(e)
+    rastreando = medicao.memoria and tracemalloc.is_tracing()
+    if rastreando:
+        atual, pico = tracemalloc.get_traced_memory()
+        if pai: pai._pico = max(pai._pico, pico)   # o pico até aqui é do pai; a partir daqui, desta etapa
+        tracemalloc.reset_peak()
+        e._memoria_inicio = atual
+    medicao._pilha.append(e)
+    inicio = time.perf_counter()
+    try:
+        yield e
+    except BaseException as exc:
+        e.erro = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        e.segundos = time.perf_counter() - inicio
+        medicao._pilha.pop()
+        if rastreando and tracemalloc.is_tracing():
+            atual, pico = tracemalloc.get_traced_memory()
+            e._pico = max(e._pico, pico)
+            e.pico_mb = round(e._pico / 2**20, 1)
+            e.alocado_mb = round((atual - e._memoria_inicio) / 2**20, 1)
+            if pai: pai._pico = max(pai._pico, e._pico)
+        _log_json('etapa', **e.como_dict())
+
+def contar_bytes(quantidade):
+    """Soma bytes lidos na etapa aberta mais interna (nada fora de uma medição)."""
+    medicao = _MEDICAO.get()
+    if medicao is not None and medicao.atual is not None: medicao.atual.bytes += quantidade
+
+def registrar_excecao(exc, quantidade=1, onde=None, medicao=None):
+    """
+    Registra uma exceção tratada (o processamento seguiu sem aquele trecho): conta na etapa atual e vai para o
+    log como aviso JSON, com ou sem medição em curso. `quantidade` agrega falhas repetidas (ex.: XMLs ilegíveis).
+    """
+    if not quantidade: return
+    for contagem in _CONTAGENS.get(): contagem.total += quantidade
+    medicao = medicao or _MEDICAO.get()
+    atual = medicao.atual if medicao is not None else None
+    nome = onde or (atual.nome if atual else None)
+    tipo, mensagem = (type(exc).__name__, str(exc)) if isinstance(exc, BaseException) else ("", str(exc))
+    _log_json('excecao', logging.WARNING, etapa=nome, tipo=tipo, mensagem=mensagem, quantidade=quantidade)
+    if medicao is None: return
+    if atual is not None: atual.excecoes += quantidade
+    medicao.total_excecoes += quantidade
+    if len(medicao.excecoes) < MAX_EXCECOES_GUARDADAS: medicao.excecoes.append((nome, tipo, mensagem, quantidade))
+
+class ContagemExcecoes:
+    total = 0
+
+@contextmanager
+def contar_excecoes():
+    """Conta as exceções tratadas (registrar_excecao) dentro do bloco, com ou sem medição em curso."""
+    contagem = ContagemExcecoes()
+    token = _CONTAGENS.set(_CONTAGENS.get() + (contagem,))
+    try: yield contagem
+    finally: _CONTAGENS.reset(token)
+
+def tamanho_arquivos(*grupos):
+    """Bytes dos arquivos (caminhos ou abertos, soltos ou em listas), sem mexer na posição de leitura."""
+    total = 0
+    for grupo in grupos:
+        for arquivo in (grupo if isinstance(grupo, (list, tuple)) else [grupo]):
+            if arquivo is None: continue
+            try:
+                if isinstance(arquivo, (str, os.PathLike)): total += os.path.getsize(arquivo); continue
+                if getattr(arquivo, 'size', None) is not None: total += arquivo.size; continue   # UploadedFile
+                posicao = arquivo.tell(); total += arquivo.seek(0, os.SEEK_END); arquivo.seek(posicao)
+            except (OSError, AttributeError, ValueError):
+                pass
+    return total
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+from Auditorias.motor_vetorial import arredondar
+
+# --- NÚMEROS EM FORMATO BRASILEIRO, COLUNA INTEIRA DE UMA VEZ ---
+# Substitui o safe_float valor a valor: cada texto distinto é limpo uma vez com operações de string do
+# pandas ('R$', '%', espaços, ponto de milhar, vírgula decimal) e convertido em lote pelo float() do numpy.
+SENTINELAS_ZERO = ['NT', 'N/A', 'ISENTO', 'NULL', 'ZERO', '-']
+
+def _limpar(texto):
+    """'R$ 1.234,56' -> '1234.56', '18,00%' -> '18.00'; com vírgula o ponto é milhar, sem vírgula é decimal."""
+    texto = texto.str.replace('R$', '', regex=False).str.replace(' ', '', regex=False).str.replace('%', '', regex=False).str.strip()
+    virgula = texto.str.contains(',', regex=False)
+    texto = texto.where(~virgula, texto.str.replace('.', '', regex=False))
+    return texto.str.replace(',', '.', regex=False)
+
+def _float_ou(texto, padrao):
+    try: return float(texto)
+    except ValueError: return padrao
+
+def _para_float(limpo, padrao):
+    """
+    float() do Python em lote: o to_numeric separa os números, que o astype(float) converte com o mesmo
+    arredondamento do float(); só os textos recusados (ou aceitos só pelo pandas, como '1\\t5') passam um a um.
+    """
+    textos = limpo.to_numpy(dtype=object)
+    numeros = np.full(len(textos), padrao, dtype=float)
+    aceitos = pd.to_numeric(limpo, errors='coerce').notna().to_numpy()
+    try: numeros[aceitos] = textos[aceitos].astype(float)
+    except ValueError: numeros[aceitos] = [_float_ou(t, padrao) for t in textos[aceitos]]
+    # '1_000', 'inf': o pandas recusa e o float() aceita, como fazia o safe_float
+    numeros[~aceitos] = [_float_ou(t, padrao) for t in textos[~aceitos]]
+    return numeros
+
+def _numeros_textos(unicos, padrao):
+    """Caminho completo, um texto distinto por posição: maiúsculas, sentinelas, limpeza e conversão."""
+    texto = pd.Series(unicos, dtype=object).astype(str).str.strip().str.upper()
+    limpo = _limpar(texto)
+    zero = texto.isin(SENTINELAS_ZERO).to_numpy()
+    numeros = np.full(len(limpo), padrao, dtype=float)
+    numeros[zero] = 0.0
+    candidatos = ~zero & (limpo != "").to_numpy()
+    numeros[candidatos] = _para_float(limpo[candidatos], padrao)
+    return numeros
+
+def numeros_br(valores, padrao=0.0, casas=None):
+    """
+    Textos ('R$ 1.234,56', '18,00%', '1234.56', 'NT'...) -> array float64. NT/ISENTO/N/A/NULL/ZERO/'-' valem 0.0;
+    vazio, nulo ou texto que não é número vira `padrao`. Com `casas`, arredonda como o round() do Python:
+    numeros_br(valores, 0.0, 4) dá o mesmo que o antigo safe_float em cada valor.
+    """
+    codigos, unicos = pd.factorize(pd.Series(valores, dtype=object), use_na_sentinel=True)
+    unicos = np.asarray(unicos, dtype=object)
+    vazios = unicos == ""
+    try:
+        # caminho rápido (XML): só números '1234.56' e campos vazios, nada para limpar
+        numeros = np.full(len(unicos), padrao, dtype=float)
+        numeros[~vazios] = unicos[~vazios].astype(float)
+    except (ValueError, TypeError):
+        numeros = _numeros_textos(unicos, padrao)
+    if casas is not None: numeros = arredondar(numeros, casas)
+    return np.append(numeros, padrao)[codigos]   # o sentinela -1 do factorize (nulo) cai no `padrao` do fim
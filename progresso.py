@@ -0,0 +1,141 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# --- PROGRESSO E CANCELAMENTO COOPERATIVO DA ANÁLISE ---
+# A análise roda em fases com peso fixo no total (extração dos XMLs, relatório). Dentro de cada fase o
+# código avisa o quanto andou (`avancar`: um XML lido, um bloco de linhas gravado no Excel) e o começo de
+# cada etapa medida (instrumentacao.etapa chama `ao_iniciar_etapa`). Esses mesmos pontos conferem se o
+# cancelamento foi pedido: a análise para no próximo deles levantando AnaliseCancelada.
+# Fora de `acompanhar(progresso)` as funções deste módulo não fazem nada.
+_PROGRESSO = contextvars.ContextVar("progresso_sentinela", default=None)
+
+class AnaliseCancelada(BaseException):
+    """
+    O usuário cancelou a análise; levantada no próximo ponto de verificação. Não deriva de Exception para
+    atravessar os `except Exception` que só registram um erro e seguem (a análise não termina como sucesso).
+    """
+
+class Progresso:
+    """
+    Estado da análise para a barra de progresso: fração concluída (0 a 1), mensagem da etapa atual e ETA.
+    `callback(fracao, mensagem)`, se vier, é chamado a cada avanço (na thread que processa).
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.fracao = 0.0
+        self.mensagem = "Preparando..."
+        self.avisos = []            # (nível, mensagem) dos avisos dados durante a análise (avisos.py)
+        self.inicio = time.perf_counter()
+        self._cancelar = threading.Event()
+        self._base, self._peso, self._total, self._feito = 0.0, 0.0, 0, 0
+        self._fase = ""
+
+    # --- fases ---
+    def fase(self, mensagem, peso, total=0):
+        """Encerra a fase anterior e abre outra valendo `peso` do total, com `total` unidades (XMLs, linhas) previstas."""
+        self._base = min(1.0, self._base + self._peso)
+        self._peso, self._total, self._feito = peso, total, 0
+        self._fase = mensagem
+        self._atualizar(self._base, mensagem)
+
+    def avancar(self, quantidade=1, mensagem=None):
+        self.verificar()
+        self._feito += quantidade
+        # a previsão de unidades é estimativa: a fase só chega ao fim em `fase` seguinte ou `concluir`
+        parte = min(self._feito / self._total, 0.99) if self._total else 0.0
+        self._atualizar(self._base + self._peso * parte, mensagem)
+
+    def ao_iniciar_etapa(self, nome):
+        self.verificar()
+        self._atualizar(self.fracao, f"{self._fase} · {nome}" if self._fase else nome)
+
+    def concluir(self, mensagem="Concluído"):
+        self._base, self._peso = 1.0, 0.0
+        self._atualizar(1.0, mensagem)
+
+    def _atualizar(self, fracao, mensagem=None):
+        self.fracao = max(self.fracao, min(fracao, 1.0))
+        if mensagem: self.mensagem = mensagem
+        if self.callback: self.callback(self.fracao, self.mensagem)
+
+    # --- tempo ---
+    @property
+    def decorrido(self):
+        return time.perf_counter() - self.inicio
+
+    def eta(self):
+        """Segundos estimados até o fim (None enquanto não há avanço suficiente para estimar)."""
+        if self.fracao < 0.02 or self.fracao >= 1.0: return None
+        return self.decorrido * (1 - self.fracao) / self.fracao
+
+    # --- cancelamento ---
+    def cancelar(self):
+        """Pode ser chamado de outra thread (o botão do app); a análise para no próximo ponto de verificação."""
+        self._cancelar.set()
+
+    @property
+    def cancelado(self):
+        return self._cancelar.is_set()
+
+    def verificar(self):
+        # Levanta em todo ponto enquanto o cancelamento vale; a limpeza (fechar o Excel, o cache) não passa por eles
+        if self._cancelar.is_set(): raise AnaliseCancelada("Análise cancelada pelo usuário.")
+
+@contextmanager
+def acompanhar(progresso):
+    """Liga o `progresso` ao código chamado dentro do bloco (na thread atual)."""
+    token = _PROGRESSO.set(progresso)
+    try: yield progresso
+    finally: _PROGRESSO.reset(token)
+
+def progresso_atual():
+    return _PROGRESSO.get()
+
+def fase(mensagem, peso, total=0):
+    p = _PROGRESSO.get()
+    if p is not None: p.fase(mensagem, peso, total)
+
+def avancar(quantidade=1, mensagem=None):
+    p = _PROGRESSO.get()
+    if p is not None: p.avancar(quantidade, mensagem)
+
+def ao_iniciar_etapa(nome):
+    p = _PROGRESSO.get()
+    if p is not None: p.ao_iniciar_etapa(nome)
+
+# --- EXECUÇÃO EM SEGUNDO PLANO (APP) ---
+class TrabalhoEmSegundoPlano:
+    """
+    Roda `funcao(*args, **kwargs)` numa thread, acompanhada por um Progresso. O app guarda o objeto no
+    session_state e consulta `progresso`, `ativo`, `resultado` e `erro` a cada rerun, sem bloquear o script.
+    """
+    def __init__(self, funcao, *args, **kwargs):
+        self.progresso = Progresso()
+        self.resultado = None
+        self.erro = None
+        self.cancelado = False
+        self._thread = threading.Thread(target=self._rodar, args=(funcao, args, kwargs), daemon=True, name="sentinela-analise")
+        self._thread.start()
+
+    def _rodar(self, funcao, args, kwargs):
+        try:
+            with acompanhar(self.progresso):
+                self.resultado = funcao(*args, **kwargs)
+            self.progresso.concluir()
+        except AnaliseCancelada:
+            self.cancelado = True
+        except Exception as e:
+            self.erro = e
+
+    @property
+    def ativo(self):
+        return self._thread.is_alive()
+
+    def cancelar(self):
+        self.progresso.cancelar()
+
+    def aguardar(self, timeout=None):
+        self._thread.join(timeout)
+        return not self.ativo
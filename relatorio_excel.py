@@ -0,0 +1,90 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from instrumentacao import etapa
+from progresso import avancar
+
+# --- RELATÓRIO EXCEL EM STREAMING (XLSXWRITER CONSTANT_MEMORY, DIRETO EM DISCO) ---
+# Em constant_memory o xlsxwriter descarrega cada linha assim que a próxima começa, então toda aba
+# tem de ser escrita em ordem de linha. O DataFrame.to_excel escreve coluna por coluna e perderia
+# dados nesse modo: as tabelas grandes passam por gravar_tabela.
+LIMITE_LINHAS_EXCEL = 1048576      # linhas por aba no Excel (cabeçalho incluso)
+LINHAS_POR_BLOCO = 20000           # linhas convertidas para Python de cada vez
+FORMATO_DATA_HORA = 'YYYY-MM-DD HH:MM:SS'
+
+def abrir_relatorio(caminho=None):
+    """ExcelWriter em constant_memory gravando num arquivo (temporário, se não vier caminho). Devolve (writer, caminho)."""
+    if caminho is None:
+        fd, caminho = tempfile.mkstemp(prefix="Sentinela_", suffix=".xlsx")
+        os.close(fd)
+    writer = pd.ExcelWriter(caminho, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}})
+    return writer, caminho
+
+def _nome_aba(nome, parte):
+    if parte == 1: return nome
+    sufixo = f"_{parte}"
+    return nome[:31 - len(sufixo)] + sufixo
+
+def _valores_coluna(serie):
+    """Lista de valores Python prontos para o xlsxwriter, com as mesmas regras do to_excel (vazio -> célula vazia)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype): serie = serie.astype(object)
+    if pd.api.types.is_float_dtype(serie.dtype):
+        valores = serie.to_numpy(dtype=float)
+        lista = valores.tolist()
+        for i in np.flatnonzero(~np.isfinite(valores)):
+            v = valores[i]
+            lista[i] = None if np.isnan(v) else ('inf' if v > 0 else '-inf')
+        return lista
+    if pd.api.types.is_integer_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+        if not serie.hasnans: return serie.tolist()
+    lista = serie.astype(object).tolist()
+    for i in np.flatnonzero(serie.isna().to_numpy()): lista[i] = None
+    return lista
+
+def gravar_tabela(writer, nome_aba, *blocos, linhas_por_aba=LIMITE_LINHAS_EXCEL - 1):
+    """
+    Grava um ou mais DataFrames lado a lado (mesmo número de linhas) linha a linha, com cabeçalho.
+    Passando de `linhas_por_aba` linhas de dados, continua em NOME_2, NOME_3... repetindo o cabeçalho.
+    Devolve a lista de abas usadas.
+    """
+    cabecalho = [c for bloco in blocos for c in bloco.columns]
+    total = len(blocos[0]) if blocos else 0
+    lotes = ([bloco.iloc[inicio:inicio + LINHAS_POR_BLOCO] for bloco in blocos] for inicio in range(0, total, LINHAS_POR_BLOCO))
+    return gravar_lotes(writer, nome_aba, cabecalho, lotes, linhas_por_aba=linhas_por_aba)
+
+def gravar_lotes(writer, nome_aba, cabecalho, lotes, linhas_por_aba=LIMITE_LINHAS_EXCEL - 1):
+    """
+    Como gravar_tabela, mas os dados chegam aos poucos: `lotes` é um iterável (pode ser um gerador lendo
+    arquivo em chunks) de DataFrames, ou de listas de DataFrames lado a lado, com as colunas do cabeçalho.
+    Cada lote é gravado e descartado antes de o próximo ser pedido. Devolve a lista de abas usadas.
+    """
+    with etapa(f'excel:{nome_aba}', linhas=0) as medida:   # com lotes de um gerador, inclui a leitura deles
+        book = writer.book
+        formato_data = book.add_format({'num_format': FORMATO_DATA_HORA})
+
+        abas, ws, linha = [], None, 0
+        def nova_aba():
+            ws = book.add_worksheet(_nome_aba(nome_aba, len(abas) + 1)); abas.append(ws.name)
+            ws.write_row(0, 0, cabecalho)
+            return ws
+
+        for blocos in lotes:
+            if isinstance(blocos, pd.DataFrame): blocos = [blocos]
+            colunas_data = [i for i, t in enumerate(t for bloco in blocos for t in bloco.dtypes)
+                            if pd.api.types.is_datetime64_any_dtype(t)]
+            for inicio in range(0, len(blocos[0]), LINHAS_POR_BLOCO):
+                fim = min(inicio + LINHAS_POR_BLOCO, len(blocos[0]))
+                colunas = [_valores_coluna(bloco.iloc[inicio:fim, j]) for bloco in blocos for j in range(bloco.shape[1])]
+                datas = [colunas[j] for j in colunas_data]
+                for j in colunas_data: colunas[j] = [None] * (fim - inicio)
+                for k, valores in enumerate(zip(*colunas)):
+                    if ws is None or linha > linhas_por_aba: ws, linha = nova_aba(), 1
+                    ws.write_row(linha, 0, valores)
+                    for j, data in zip(colunas_data, datas):
+                        if data[k] is not None: ws.write_datetime(linha, j, data[k], formato_data)
+                    linha += 1
+                avancar(fim - inicio)   # progresso em linhas gravadas; também ponto de cancelamento
+            medida.linhas += len(blocos[0])
+        if not abas: nova_aba()
+        return abas
@@ -1,8 +1,16 @@
 import streamlit as st
-import os, io, pandas as pd
+import os, io, weakref, pandas as pd
 import requests
+import logging
 from style import aplicar_estilo_sentinela
-from sentinela_core import extrair_dados_xml_recursivo, gerar_excel_final
+from sentinela_core import executar_analise
+from exportacao_colunar import PASTA_EXPORTACAO, PYARROW_DISPONIVEL
+from instrumentacao import medir_execucao
+from progresso import TrabalhoEmSegundoPlano
+from cache_resultados import cache_padrao
+
+# Etapas medidas saem como linhas JSON no log "sentinela.performance"
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(page_title="Sentinela 2.0 | Auditoria Fiscal", page_icon="🧡", layout="wide")
@@ -35,6 +43,52 @@ def verificar_arquivo_github(caminho_relativo):
         return res.status_code == 200
     except: return False
 
+def analisar_em_segundo_plano(saida, xmls, cnpj_auditado, cod_cliente, regime, is_ret, ae, as_f, ge, gs,
+                              pasta_colunar, incremental, medir_memoria, gerar_perfil):
+    """
+    Roda na thread do TrabalhoEmSegundoPlano (sem st.*). O relatório fica no .xlsx temporário: em `saida` vão
+    só o caminho dele, a medição e a origem (cache de resultados: relatório pronto, extração reaproveitada ou nada).
+    """
+    with medir_execucao(memoria=medir_memoria, perfil=gerar_perfil) as saida['medicao']:
+        saida['caminho'], saida['origem'] = executar_analise(xmls, cnpj_auditado, cod_cliente, regime, is_ret, ae, as_f, ge, gs,
+                                                             pasta_colunar=pasta_colunar, incremental=incremental,
+                                                             cache=cache_padrao())
+    return saida['caminho']
+
+def apagar_relatorio(saida):
+    """Remove o .xlsx temporário da análise (substituída por outra ou descartada junto com a sessão)."""
+    caminho = saida.get('caminho')
+    if caminho and os.path.exists(caminho):
+        try: os.remove(caminho)
+        except OSError: pass
+
+def formatar_tempo(segundos):
+    return f"{int(segundos // 60)}min {int(segundos % 60):02d}s" if segundos >= 60 else f"{segundos:.0f}s"
+
+@st.fragment(run_every=1)
+def painel_progresso():
+    """Atualiza só a barra a cada segundo; quando a thread termina, roda o app inteiro para mostrar o resultado."""
+    trabalho = st.session_state.get('analise')
+    if trabalho is None: return
+    if not trabalho.ativo: st.rerun()
+    prog = trabalho.progresso
+    eta = prog.eta()
+    texto = f"{prog.mensagem} · {formatar_tempo(prog.decorrido)}" + (f" · faltam ~{formatar_tempo(eta)}" if eta else "")
+    st.progress(prog.fracao, text=texto)
+    if prog.cancelado: st.caption("⏳ Cancelando: a análise para no próximo ponto seguro...")
+    elif st.button("⛔ CANCELAR ANÁLISE", use_container_width=True): trabalho.cancelar(); st.rerun(scope="fragment")
+
+def painel_performance(medicao):
+    with st.expander(f"⏱️ Performance ({medicao.segundos:.1f}s)"):
+        st.dataframe(medicao.tabela(), hide_index=True, use_container_width=True)
+        if medicao.total_excecoes:
+            st.caption(f"⚠️ {medicao.total_excecoes} exceção(ões) tratada(s) durante o processamento:")
+            st.dataframe(pd.DataFrame(medicao.excecoes, columns=['Etapa', 'Tipo', 'Mensagem', 'Qtd']), hide_index=True)
+        if medicao.perfil:
+            st.text(medicao.resumo_perfil)
+            with open(medicao.perfil, 'rb') as prof:
+                st.download_button("📈 Baixar perfil (.prof)", prof, os.path.basename(medicao.perfil), use_container_width=True)
+
 df_clientes = carregar_base_clientes()
 
 # --- SIDEBAR ---
@@ -74,6 +128,12 @@ if selecao:
         st.markdown("### Passo 2: Seleção de Regime")
         regime = st.selectbox("Regime Fiscal", ["", "Lucro Real", "Lucro Presumido", "Simples Nacional", "MEI"], label_visibility="collapsed")
         is_ret = st.toggle("Habilitar MG (RET)")
+        exportar_bi = st.toggle("Exportar também em Parquet (BI)", disabled=not PYARROW_DISPONIVEL,
+                                help=None if PYARROW_DISPONIVEL else "Instale o pacote pyarrow para habilitar.")
+        incremental = st.toggle("Apuração incremental (só competências alteradas)")
+        with st.expander("⏱️ Medição de desempenho"):
+            medir_memoria = st.toggle("Medir memória por etapa (tracemalloc)", help="Deixa o processamento mais lento.")
+            gerar_perfil = st.toggle("Gerar perfil cProfile (.prof)")
 
     st.markdown(f"<div class='status-container'>📍 <b>Analisando:</b> {dados_empresa['RAZÃO SOCIAL']} | <b>CNPJ:</b> {cnpj_auditado}</div>", unsafe_allow_html=True)
     
@@ -111,29 +171,57 @@ if selecao:
         as_f = st.file_uploader("Autenticidade Saídas (Excel)", type=['xlsx', 'csv'], accept_multiple_files=True, key="as")
 
     st.markdown("<br>", unsafe_allow_html=True)
+    # A análise roda numa thread; o resultado fica no session_state e os reruns (download, toggles) só o exibem
+    trabalho = st.session_state.get('analise')
+    rodando = trabalho is not None and trabalho.ativo
     _, col_btn, _ = st.columns([1, 1, 1])
     with col_btn:
-        if st.button("🚀 INICIAR ANÁLISE"):
+        if st.button("🚀 INICIAR ANÁLISE", disabled=rodando):
             if xmls and regime:
-                with st.spinner("O Sentinela está auditando os dados..."):
-                    try:
-                        df_xe, df_xs = extrair_dados_xml_recursivo(xmls, cnpj_auditado)
-                        relat = gerar_excel_final(df_xe, df_xs, ae, as_f, ge, gs, cod_cliente, regime, is_ret)
-                        
-                        # SUBSTITUÍDO: Em vez de balões, um aviso de conformidade elegante
-                        st.markdown(f"""
-                            <div style="background-color: #ffffff; border-radius: 15px; padding: 25px; border-top: 5px solid #FF6F00; box-shadow: 0 10px 30px rgba(0,0,0,0.1); text-align: center; margin-top: 20px;">
-                                <div style="font-size: 3rem; margin-bottom: 10px;">📋</div>
-                                <h2 style="color: #FF6F00; margin: 0; font-weight: 800;">AUDITORIA CONCLUÍDA</h2>
-                                <p style="color: #555; font-size: 1.1rem; margin-top: 10px;">
-                                    Todos os cruzamentos entre XML e Gerencial foram validados para o regime <b>{regime}</b>.
-                                </p>
-                            </div>
-                        """, unsafe_allow_html=True)
-                        
-                        st.markdown("<br>", unsafe_allow_html=True)
-                        st.download_button("💾 BAIXAR RELATÓRIO FINAL", relat, f"Sentinela_{cod_cliente}.xlsx", use_container_width=True)
-                    except Exception as e:
-                        st.error(f"Erro no processamento: {e}")
+                if trabalho is not None: trabalho.descartar()   # o relatório anterior sai do disco junto com a análise
+                saida = {'cod_cliente': cod_cliente, 'regime': regime, 'exportar_bi': exportar_bi, 'medicao': None, 'origem': None,
+                         'caminho': None}
+                trabalho = TrabalhoEmSegundoPlano(analisar_em_segundo_plano, saida, xmls, cnpj_auditado, cod_cliente, regime,
+                                                  is_ret, ae, as_f, ge, gs, PASTA_EXPORTACAO if exportar_bi else None,
+                                                  incremental, medir_memoria, gerar_perfil)
+                trabalho.saida = saida
+                # também apagado se a sessão terminar com a análise no session_state
+                trabalho.descartar = weakref.finalize(trabalho, apagar_relatorio, saida)
+                st.session_state['analise'] = trabalho
+                rodando = True
             else:
                 st.warning("⚠️ Verifique os XMLs e o Regime Fiscal.")
+
+    if rodando:
+        with col_btn: painel_progresso()
+    elif trabalho is not None and trabalho.saida['cod_cliente'] == cod_cliente:
+        saida = trabalho.saida
+        with col_btn:
+            for nivel, mensagem in trabalho.progresso.avisos:
+                (st.error if nivel == 'erro' else st.warning)(mensagem)
+            if trabalho.cancelado:
+                st.info("⛔ Análise cancelada. Nenhum relatório foi gerado.")
+            elif trabalho.erro is not None:
+                st.error(f"Erro no processamento: {trabalho.erro}")
+            else:
+                # SUBSTITUÍDO: Em vez de balões, um aviso de conformidade elegante
+                st.markdown(f"""
+                    <div style="background-color: #ffffff; border-radius: 15px; padding: 25px; border-top: 5px solid #FF6F00; box-shadow: 0 10px 30px rgba(0,0,0,0.1); text-align: center; margin-top: 20px;">
+                        <div style="font-size: 3rem; margin-bottom: 10px;">📋</div>
+                        <h2 style="color: #FF6F00; margin: 0; font-weight: 800;">AUDITORIA CONCLUÍDA</h2>
+                        <p style="color: #555; font-size: 1.1rem; margin-top: 10px;">
+                            Todos os cruzamentos entre XML e Gerencial foram validados para o regime <b>{saida['regime']}</b>.
+                        </p>
+                    </div>
+                """, unsafe_allow_html=True)
+
+                st.markdown("<br>", unsafe_allow_html=True)
+                # o arquivo é aberto só para montar o botão: o relatório não fica guardado no session_state
+                if saida['caminho'] and os.path.exists(saida['caminho']):
+                    with open(saida['caminho'], 'rb') as relat:
+                        st.download_button("💾 BAIXAR RELATÓRIO FINAL", relat, f"Sentinela_{cod_cliente}.xlsx",
+                                           use_container_width=True, on_click="ignore")
+                if saida['origem'] == 'relatorio': st.caption("♻️ Mesmos arquivos e parâmetros de uma análise anterior: relatório reaproveitado do cache.")
+                elif saida['origem'] == 'xml': st.caption("♻️ Mesmos XMLs de uma análise anterior: extração reaproveitada do cache.")
+                if saida['exportar_bi']: st.caption(f"📦 Abas exportadas em Parquet na pasta {PASTA_EXPORTACAO}/ (por cliente e competência).")
+            if saida['medicao'] is not None: painel_performance(saida['medicao'])
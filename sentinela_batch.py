@@ -0,0 +1,165 @@
+"""
+Sentinela em lote (sem Streamlit): audita vários clientes numa única execução.
+
+    python sentinela_batch.py manifesto.csv --saida Relatorios --workers 4 [--parquet Exportacao_BI] [--incremental] [--medir [--memoria] [--perfil]]
+
+O manifesto (CSV com ';' ou ',' ou JSON com uma lista de objetos) traz uma linha por cliente:
+    cod_cliente, cnpj, regime, xmls, autenticidade_entradas, autenticidade_saidas,
+    gerencial_entradas, gerencial_saidas, ret
+`xmls` aceita arquivos .xml/.zip e pastas (varridas atrás de .xml e .zip); vários caminhos
+separados por '|' no CSV ou em lista no JSON. Caminhos relativos partem da pasta do manifesto.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+import sentinela_core as core
+from Auditorias import gabarito
+from exportacao_colunar import PASTA_EXPORTACAO
+from instrumentacao import medir_execucao, PASTA_PERFIS
+
+log = logging.getLogger("sentinela")
+
+CAMPOS_CAMINHO = ['xmls', 'autenticidade_entradas', 'autenticidade_saidas', 'gerencial_entradas', 'gerencial_saidas']
+
+# --- MANIFESTO ---
+def _caminhos(valor, pasta_base):
+    if valor is None or (not isinstance(valor, (list, tuple)) and pd.isna(valor)): return []
+    itens = valor if isinstance(valor, (list, tuple)) else str(valor).split('|')
+    return [os.path.normpath(os.path.join(pasta_base, p.strip())) for p in itens if str(p).strip()]
+
+def _expandir_xmls(caminhos):
+    arquivos = []
+    for c in caminhos:
+        if os.path.isdir(c):
+            for raiz, _, nomes in os.walk(c):
+                arquivos += [os.path.join(raiz, n) for n in sorted(nomes) if n.endswith(('.xml', '.zip'))]
+        else:
+            arquivos.append(c)
+    return arquivos
+
+def ler_manifesto(caminho):
+    """Lista de dicts (um por cliente) com os caminhos já resolvidos."""
+    pasta_base = os.path.dirname(os.path.abspath(caminho))
+    if caminho.lower().endswith('.json'):
+        with open(caminho, encoding='utf-8') as f: linhas = json.load(f)
+    else:
+        linhas = pd.read_csv(caminho, sep=None, engine='python', dtype=str).to_dict('records')
+
+    clientes = []
+    for linha in linhas:
+        item = {k.strip().lower(): v for k, v in linha.items()}
+        cod = str(item.get('cod_cliente', '')).strip()
+        if not cod or cod.lower() == 'nan': continue
+        for campo in CAMPOS_CAMINHO: item[campo] = _caminhos(item.get(campo), pasta_base)
+        item['xmls'] = _expandir_xmls(item['xmls'])
+        item['cod_cliente'] = cod
+        item['cnpj'] = str(item.get('cnpj', '')).strip()
+        regime = item.get('regime')
+        item['regime'] = "Lucro Real" if regime is None or pd.isna(regime) or not str(regime).strip() else str(regime).strip()
+        item['ret'] = str(item.get('ret', '')).strip().lower() in ('1', 'true', 'sim', 's', 'x')
+        clientes.append(item)
+    return clientes
+
+# --- UM CLIENTE ---
+def _abrir(caminhos, abertos):
+    """As auditorias recebem arquivos abertos, em lista como os uploads múltiplos do app; todos vão para `abertos`."""
+    arquivos = [open(c, 'rb') for c in caminhos]
+    abertos.extend(arquivos)
+    return arquivos or None
+
+def auditar_cliente(item, pasta_saida, pasta_colunar=None, formato_colunar="parquet", incremental=False,
+                    medir=False, memoria=False, perfil=False):
+    """Extrai os XMLs, roda as auditorias e grava Sentinela_<cód>.xlsx. Devolve um resumo da execução (com as etapas, se `medir`)."""
+    inicio = time.perf_counter()
+    cod = item['cod_cliente']
+    resumo = {'cod_cliente': cod, 'relatorio': None, 'itens_saida': 0, 'itens_entrada': 0, 'segundos': 0.0, 'erro': None}
+    abertos = []
+    medicao = None
+    try:
+        with (medir_execucao(memoria=memoria, perfil=perfil) if medir else nullcontext()) as medicao:
+            if not item['xmls']: raise ValueError("nenhum XML/ZIP encontrado")
+            # Os clientes já rodam em paralelo: a extração de cada um fica num processo só
+            df_xe, df_xs = core.extrair_xml(item['xmls'], item['cnpj'], workers=1)
+            ae, as_f, ge, gs = (_abrir(item[c], abertos) for c in CAMPOS_CAMINHO[1:])
+
+            caminho = os.path.join(pasta_saida, f"Sentinela_{cod}.xlsx")
+            core.gerar_relatorio(df_xe, df_xs, cod, item['regime'], item['ret'], ae, as_f, ge, gs, caminho=caminho,
+                                 pasta_colunar=pasta_colunar, formato_colunar=formato_colunar, incremental=incremental)
+            resumo.update(relatorio=caminho, itens_saida=len(df_xs), itens_entrada=len(df_xe))
+    except Exception as e:
+        resumo['erro'] = f"{type(e).__name__}: {e}"
+    finally:
+        for f in abertos: f.close()
+    resumo['segundos'] = round(time.perf_counter() - inicio, 2)
+    if medicao is not None: resumo['medicao'] = medicao.como_dict()
+    return resumo
+
+# --- LOTE ---
+def executar_lote(clientes, pasta_saida, workers=None, pasta_colunar=None, formato_colunar="parquet", incremental=False,
+                  medir=False, memoria=False, perfil=False):
+    """Audita todos os clientes com um pool de processos (um cliente por tarefa). Devolve os resumos na ordem do manifesto."""
+    os.makedirs(pasta_saida, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(clientes) or 1))
+    resumos = {}
+    if workers == 1:
+        for item in clientes:
+            resumos[item['cod_cliente']] = r = auditar_cliente(item, pasta_saida, pasta_colunar, formato_colunar, incremental, medir, memoria, perfil)
+            _registrar(r)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_configurar_processo, initargs=(gabarito.PASTA_BASES,)) as pool:
+            tarefas = {pool.submit(auditar_cliente, item, pasta_saida, pasta_colunar, formato_colunar, incremental, medir, memoria, perfil): item['cod_cliente']
+                       for item in clientes}
+            for tarefa in as_completed(tarefas):
+                resumos[tarefas[tarefa]] = r = tarefa.result()
+                _registrar(r)
+    return [resumos[item['cod_cliente']] for item in clientes]
+
+def _configurar_processo(pasta_bases):
+    gabarito.PASTA_BASES = pasta_bases
+
+def _registrar(r):
+    if r['erro']: log.error(f"[{r['cod_cliente']}] falhou em {r['segundos']}s: {r['erro']}")
+    else: log.info(f"[{r['cod_cliente']}] {r['itens_saida']} itens de saída, {r['itens_entrada']} de entrada em {r['segundos']}s -> {r['relatorio']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sentinela em lote: um relatório por cliente do manifesto, sem Streamlit.")
+    parser.add_argument("manifesto", help="CSV ou JSON com cod_cliente, cnpj, regime, xmls, autenticidade_*, gerencial_*, ret")
+    parser.add_argument("--saida", default="Relatorios", help="pasta dos relatórios .xlsx (padrão: Relatorios)")
+    parser.add_argument("--workers", type=int, default=None, help="clientes auditados em paralelo (padrão: nº de CPUs)")
+    parser.add_argument("--bases", default=None, help=f"pasta dos gabaritos (padrão: {gabarito.PASTA_BASES})")
+    parser.add_argument("--parquet", nargs='?', const=PASTA_EXPORTACAO, default=None,
+                        help=f"também exporta as auditorias em Parquet/Arrow (pasta padrão: {PASTA_EXPORTACAO})")
+    parser.add_argument("--formato", choices=["parquet", "arrow"], default="parquet", help="formato da exportação colunar")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reaudita só as competências com notas novas ou alteradas desde a última rodada de cada cliente")
+    parser.add_argument("--medir", action="store_true",
+                        help="mede tempo, linhas e bytes lidos por etapa (log JSON e 'medicao' no resumo_lote.json)")
+    parser.add_argument("--memoria", action="store_true", help="com --medir, também o pico de memória por etapa (tracemalloc; bem mais lento)")
+    parser.add_argument("--perfil", action="store_true", help=f"com --medir, grava também um .prof do cProfile por cliente em {PASTA_PERFIS}/")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.bases: gabarito.PASTA_BASES = args.bases
+
+    clientes = ler_manifesto(args.manifesto)
+    if not clientes:
+        log.error("Manifesto sem clientes."); return 1
+    log.info(f"{len(clientes)} cliente(s) no manifesto")
+
+    resumos = executar_lote(clientes, args.saida, args.workers, args.parquet, args.formato, args.incremental,
+                            args.medir, args.memoria, args.perfil)
+    with open(os.path.join(args.saida, "resumo_lote.json"), "w", encoding="utf-8") as f:
+        json.dump(resumos, f, ensure_ascii=False, indent=2)
+    falhas = sum(1 for r in resumos if r['erro'])
+    log.info(f"Concluído: {len(resumos) - falhas} ok, {falhas} com erro")
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Benchmark do Sentinela: gera um corpus sintético de NF-e e mede cada etapa do relatório, escala por escala.
+
+    python sentinela_benchmark.py --itens 1000 10000 100000 1000000 --saida benchmark.json [--comparar anterior.json]
+
+Cada escala roda num processo próprio (o pico de RSS é o do processo) sobre um corpus gerado por
+Benchmark/corpus_nfe.py, numa pasta temporária ou em --corpus (reaproveitado entre execuções).
+A escala roda o caminho do app: extrair_xml e gerar_relatorio com autenticidade, gerenciais, conciliação e a
+exportação Parquet (com pyarrow). Os tempos são as etapas de instrumentacao.etapa (extrair_xml, relatorio,
+auditoria:icms, excel:ICMS_AUDIT, colunar:ICMS_AUDIT, apuracao_difal, conciliacao...), somadas pelo nome.
+O resultado sai em JSON com o commit e o ambiente; --comparar aponta as etapas que ficaram mais lentas
+que a tolerância.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:   # Windows: sem getrusage, o RSS fica de fora
+    resource = None
+
+import sentinela_core as core
+from Auditorias import gabarito
+from Benchmark.corpus_nfe import gerar_corpus, CNPJ_AUDITADO, NCMS_PADRAO
+from exportacao_colunar import PYARROW_DISPONIVEL
+from instrumentacao import medir_execucao
+
+log = logging.getLogger("sentinela")
+
+ESCALAS_PADRAO = [1000, 10000, 100000]
+TOLERANCIA = 0.10        # etapa até 10% mais lenta que a referência não conta como regressão
+SEGUNDOS_MINIMOS = 0.05  # etapas mais curtas que isso são ruído e ficam fora da comparação
+VERSAO_RESULTADO = 2     # 2: etapas vindas dos spans do pipeline (aninhadas; `nivel`/`pai` dizem onde)
+
+# --- MEDIÇÃO ---
+def rss_pico_mb(quem="processo"):
+    """Pico de memória residente (MB) do processo ou dos filhos (pool do extrair_xml); None sem getrusage."""
+    if resource is None: return None
+    uso = resource.getrusage(resource.RUSAGE_SELF if quem == "processo" else resource.RUSAGE_CHILDREN)
+    return round(uso.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)   # macOS devolve bytes
+
+def ncms_do_gabarito(cod_cliente, limite=200):
+    """NCMs de 8 dígitos a partir das regras do gabarito (prefixos completados com zeros) mais os padrão, fora dele."""
+    regras = [str(c) for c in gabarito.carregar_gabarito(cod_cliente).tabela.index[:limite]]
+    return sorted({c.ljust(8, '0') for c in regras if c.isdigit()} | set(NCMS_PADRAO))
+
+def etapas_da_medicao(medicao):
+    """Tempo, chamadas e linhas por etapa, somados pelo nome (a mesma etapa pode rodar várias vezes)."""
+    etapas = {}
+    for e in medicao.etapas:
+        m = etapas.setdefault(e.nome, {'segundos': 0.0, 'chamadas': 0, 'linhas': 0, 'nivel': e.nivel, 'pai': e.pai})
+        m['segundos'] = round(m['segundos'] + e.segundos, 4); m['chamadas'] += 1; m['linhas'] += e.linhas or 0
+    return etapas
+
+def _tamanho_pasta(pasta):
+    return sum(os.path.getsize(os.path.join(raiz, a)) for raiz, _, arquivos in os.walk(pasta) for a in arquivos)
+
+def medir_escala(itens, pasta_corpus, cod_cliente="", regime="Lucro Real", workers=None, semente=42):
+    """Gera (ou reaproveita) o corpus de `itens` itens e roda a análise completa medindo cada etapa. Devolve o resultado da escala."""
+    inicio = time.perf_counter()
+    corpus = gerar_corpus(pasta_corpus, itens, semente, ncms_do_gabarito(cod_cliente))
+    segundos_corpus = round(time.perf_counter() - inicio, 4)
+    if not PYARROW_DISPONIVEL: log.warning("Sem pyarrow: a exportação Parquet fica fora da medição")
+
+    fd, caminho = tempfile.mkstemp(prefix="Sentinela_bench_", suffix=".xlsx"); os.close(fd)
+    pasta_bi = tempfile.mkdtemp(prefix="Sentinela_bench_bi_") if PYARROW_DISPONIVEL else None
+    abertos = [open(corpus[k], 'rb') for k in ('autenticidade', 'gerencial_entradas', 'gerencial_saidas')]
+    aut, ge, gs = abertos
+    try:
+        # o mesmo que o app faz (sentinela_core.executar_analise), sem cache e sem memória do tracemalloc
+        with medir_execucao(memoria=False) as medicao:
+            df_xe, df_xs = core.extrair_xml(corpus['arquivos'], CNPJ_AUDITADO, workers=workers, usar_cache=False)
+            core.gerar_relatorio(df_xe, df_xs, cod_cliente, regime, False, aut, None, [ge], [gs], caminho=caminho, pasta_colunar=pasta_bi)
+        tamanho_xlsx = os.path.getsize(caminho)
+        tamanho_bi = _tamanho_pasta(pasta_bi) if pasta_bi else 0
+    finally:
+        for f in abertos: f.close()
+        os.remove(caminho)
+        if pasta_bi: shutil.rmtree(pasta_bi, ignore_errors=True)
+
+    total = round(medicao.segundos, 4)
+    return {
+        'itens': corpus['itens'], 'notas': corpus['notas'], 'saidas': corpus['saidas'], 'entradas': corpus['entradas'],
+        'arquivos': len(corpus['arquivos']), 'mb_xml': round(corpus['bytes_xml'] / 2**20, 1),
+        'itens_saida': len(df_xs), 'itens_entrada': len(df_xe), 'mb_xlsx': round(tamanho_xlsx / 2**20, 1),
+        'mb_parquet': round(tamanho_bi / 2**20, 1) if pasta_bi else None,
+        'segundos_corpus': segundos_corpus, 'etapas': etapas_da_medicao(medicao), 'total_segundos': total,
+        'excecoes': medicao.total_excecoes, 'itens_por_segundo': round(corpus['itens'] / total, 1) if total else None,
+        'rss_pico_mb': rss_pico_mb(), 'rss_pico_workers_mb': rss_pico_mb("filhos"),
+    }
+
+# --- EXECUÇÃO POR ESCALA (UM PROCESSO CADA) ---
+def _commit():
+    try:
+        saida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+        return saida.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _ambiente():
+    return {'commit': _commit(), 'data': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'pandas': pd.__version__, 'numpy': np.__version__, 'plataforma': platform.platform(), 'cpus': os.cpu_count()}
+
+def _rodar_em_processo(itens, pasta_corpus, args):
+    """Roda medir_escala num interpretador novo e lê o resultado de um JSON temporário."""
+    fd, saida = tempfile.mkstemp(prefix="bench_", suffix=".json"); os.close(fd)
+    comando = [sys.executable, os.path.abspath(__file__), "--itens", str(itens), "--_escala", saida, "--_pasta", pasta_corpus,
+               "--cliente", args.cliente, "--regime", args.regime, "--semente", str(args.semente), "--bases", os.path.abspath(gabarito.PASTA_BASES)]
+    if args.workers: comando += ["--workers", str(args.workers)]
+    try:
+        subprocess.run(comando, check=True)
+        with open(saida, encoding="utf-8") as f: return json.load(f)
+    finally:
+        os.remove(saida)
+
+def executar_benchmark(escalas, args):
+    pasta_base = args.corpus or tempfile.mkdtemp(prefix="sentinela_corpus_")
+    resultado = dict(_ambiente(), sentinela_benchmark=VERSAO_RESULTADO,
+                     parametros={'cliente': args.cliente, 'regime': args.regime, 'workers': args.workers, 'semente': args.semente},
+                     escalas=[])
+    try:
+        for itens in escalas:
+            pasta = os.path.join(pasta_base, f"itens_{itens}_semente_{args.semente}")
+            log.info(f"Escala {itens} itens (corpus em {pasta})")
+            escala = _rodar_em_processo(itens, pasta, args)
+            resultado['escalas'].append(escala)
+            log.info(f"  {escala['total_segundos']}s, {escala['itens_por_segundo']} itens/s, pico {escala['rss_pico_mb']} MB: "
+                     + ", ".join(f"{k} {v['segundos']}s" for k, v in escala['etapas'].items() if v['nivel'] <= 1))
+            if not args.corpus: shutil.rmtree(pasta, ignore_errors=True)
+    finally:
+        if not args.corpus: shutil.rmtree(pasta_base, ignore_errors=True)
+    return resultado
+
+# --- COMPARAÇÃO ENTRE EXECUÇÕES ---
+def comparar(atual, referencia, tolerancia=TOLERANCIA):
+    """Lista (itens, etapa, s_referência, s_atual, razão) das etapas mais lentas que a referência além da tolerância."""
+    anteriores = {e['itens']: e for e in referencia.get('escalas', [])}
+    regressoes = []
+    for escala in atual['escalas']:
+        antes = anteriores.get(escala['itens'])
+        if not antes: continue
+        for etapa, medida in list(escala['etapas'].items()) + [('total', {'segundos': escala['total_segundos']})]:
+            ref = antes['etapas'].get(etapa, {}).get('segundos') if etapa != 'total' else antes['total_segundos']
+            if not ref or max(ref, medida['segundos']) < SEGUNDOS_MINIMOS: continue
+            razao = medida['segundos'] / ref
+            if razao > 1 + tolerancia: regressoes.append((escala['itens'], etapa, ref, medida['segundos'], round(razao, 2)))
+    return regressoes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do Sentinela sobre um corpus sintético de NF-e.")
+    parser.add_argument("--itens", type=int, nargs='+', default=ESCALAS_PADRAO, help=f"escalas em itens (padrão: {ESCALAS_PADRAO})")
+    parser.add_argument("--saida", default="benchmark.json", help="arquivo JSON do resultado (padrão: benchmark.json)")
+    parser.add_argument("--corpus", default=None, help="pasta onde guardar e reaproveitar os corpora (padrão: temporária, apagada no fim)")
+    parser.add_argument("--cliente", default="", help="código do cliente cujo gabarito as auditorias usam (padrão: nenhum)")
+    parser.add_argument("--regime", default="Lucro Real", help="regime do PIS/COFINS (padrão: Lucro Real)")
+    parser.add_argument("--workers", type=int, default=None, help="processos do extrair_xml (padrão: nº de CPUs)")
+    parser.add_argument("--semente", type=int, default=42, help="semente do gerador de notas")
+    parser.add_argument("--bases", default=None, help=f"pasta dos gabaritos (padrão: {gabarito.PASTA_BASES})")
+    parser.add_argument("--comparar", default=None, help="JSON de uma execução anterior: aponta as etapas que ficaram mais lentas")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help=f"folga na comparação (padrão: {TOLERANCIA})")
+    parser.add_argument("--_escala", help=argparse.SUPPRESS)
+    parser.add_argument("--_pasta", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.bases: gabarito.PASTA_BASES = args.bases
+
+    if args._escala:   # processo filho: uma escala só
+        escala = medir_escala(args.itens[0], args._pasta, args.cliente, args.regime, args.workers, args.semente)
+        with open(args._escala, "w", encoding="utf-8") as f: json.dump(escala, f)
+        return 0
+
+    resultado = executar_benchmark(args.itens, args)
+    with open(args.saida, "w", encoding="utf-8") as f: json.dump(resultado, f, ensure_ascii=False, indent=2)
+    log.info(f"Resultado em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f: referencia = json.load(f)
+        regressoes = comparar(resultado, referencia, args.tolerancia)
+        for itens, etapa, antes, agora, razao in regressoes:
+            log.warning(f"Regressão em {itens} itens, {etapa}: {antes}s -> {agora}s ({razao}x)")
+        log.info(f"Comparado com {referencia.get('commit')}: {len(regressoes)} regressão(ões) acima de {args.tolerancia:.0%}")
+        return 1 if regressoes else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,130 +1,462 @@
 import pandas as pd
+import numpy as np
 import io
 import zipfile
-import streamlit as st
 import xml.etree.ElementTree as ET
 import re
 import os
+import tempfile
+import sqlite3
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from avisos import erro
 
 # --- IMPORTAÇÃO DOS MÓDULOS ESPECIALISTAS ---
 try:
     from audit_resumo import gerar_aba_resumo
-    from Auditorias.audit_icms import processar_icms
-    from Auditorias.audit_ipi import processar_ipi
-    from Auditorias.audit_pis_cofins import processar_pc
-    from Auditorias.audit_difal import processar_difal
+    from Auditorias.auditoria_fundida import processar_auditorias
     from Apuracoes.apuracao_difal import gerar_resumo_uf
+    from Apuracoes.incremental import processar_incremental
     from Gerenciais.audit_gerencial import gerar_abas_gerenciais
+    from Gerenciais.conciliacao import gerar_abas_conciliacao
+    from relatorio_excel import abrir_relatorio
+    from autenticidade import IndiceAutenticidade
+    from exportacao_colunar import ExportacaoColunar, exportar_auditorias, PASTA_EXPORTACAO
+    from numeros import numeros_br
+    from instrumentacao import etapa, contar_bytes, contar_excecoes, registrar_excecao, tamanho_arquivos
+    from progresso import fase, avancar, progresso_atual
+    from cache_notas import CacheNotas, chave_rapida, hash_conteudo, serializar_nota, desserializar_nota
+    from cache_resultados import chave_resultado, hash_arquivos, assinatura_arquivo, versao_codigo
+    from Auditorias.gabarito import caminho_gabarito
+    from Auditorias.tipi import caminho_tipi
 except ImportError as e:
-    st.error(f"⚠️ Erro Crítico de Dependência: {e}")
+    erro(f"⚠️ Erro Crítico de Dependência: {e}")
 
 # --- UTILITÁRIOS ---
-def safe_float(v):
-    if v is None or pd.isna(v): return 0.0
-    txt = str(v).strip().upper()
-    if txt in ['NT', '', 'N/A', 'ISENTO', 'NULL', 'ZERO', '-', ' ']: return 0.0
-    try:
-        txt = txt.replace('R$', '').replace(' ', '').replace('%', '').strip()
-        if ',' in txt and '.' in txt: txt = txt.replace('.', '').replace(',', '.')
-        elif ',' in txt: txt = txt.replace(',', '.')
-        return round(float(txt), 4)
-    except: return 0.0
-
-def buscar_tag_recursiva(tag_alvo, no):
-    if no is None: return ""
-    for elemento in no.iter():
-        tag_nome = elemento.tag.split('}')[-1]
-        if tag_nome == tag_alvo: return elemento.text if elemento.text else ""
-    return ""
-
 def tratar_ncm_texto(ncm):
     if pd.isna(ncm) or ncm == "": return ""
     return re.sub(r'\D', '', str(ncm)).strip()
 
+# --- LEITURA DA NF-e EM PASSADA ÚNICA (BYTES, CIENTE DE NAMESPACE) ---
+CAMPOS_CABECALHO = {
+    'ide': ('nNF', 'dhEmi', 'dEmi', 'tpNF'),
+    'emit': ('CNPJ', 'UF'),
+    'dest': ('CNPJ', 'IE', 'UF'),
+}
+CAMPOS_ITEM = {
+    'prod': ('CFOP', 'NCM', 'vProd'),
+    'imposto': ('vICMSUFDest', 'vFCPUFDest'),
+    'ICMS': ('vBC', 'pICMS', 'vICMS', 'orig', 'CST', 'CSOSN', 'vICMSST', 'IEST', 'vFCPST'),
+}
+
+def _ler_campos(no, campos, ns):
+    # Element.iter(tag) filtra dentro do C: 1ª ocorrência do campo em ordem de documento, sem laço Python por nó
+    valores = {}
+    if no is None: return valores
+    for campo in campos:
+        achado = next(no.iter(ns + campo), None)
+        if achado is not None: valores[campo] = achado.text if achado.text else ""
+    return valores
+
+def varrer_nfe(content):
+    """
+    Lê a NF-e direto dos bytes e devolve (chave, cabecalho, itens), ou None se o documento não tiver infNFe.
+    O namespace vem do próprio infNFe: padrão, ausente ou prefixado (nfe:infNFe). Notas prefixadas eram
+    descartadas pelo extrator antigo (o regex tirava o xmlns:nfe e o parse falhava) e agora entram.
+    """
+    root = ET.fromstring(content)
+    inf = None
+    for no in root.iter():
+        if no is not root and no.tag.rpartition('}')[2] == 'infNFe': inf = no; break
+    if inf is None: return None
+    ns = inf.tag[:inf.tag.index('}') + 1] if inf.tag.startswith('{') else ''
+
+    cabecalho = {}
+    for bloco, campos in CAMPOS_CABECALHO.items():
+        no = next((n for n in root.iter(ns + bloco) if n is not root), None)
+        if no is not None: cabecalho[bloco] = _ler_campos(no, campos, ns)
+
+    itens = []
+    for det in root.iter(ns + 'det'):
+        if det is root: continue
+        itens.append({
+            'prod': _ler_campos(det.find(ns + 'prod'), CAMPOS_ITEM['prod'], ns),
+            'imposto': _ler_campos(det.find(ns + 'imposto'), CAMPOS_ITEM['imposto'], ns),
+            'ICMS': _ler_campos(next(det.iter(ns + 'ICMS'), None), CAMPOS_ITEM['ICMS'], ns),
+        })
+    return inf.attrib.get('Id', '')[3:], cabecalho, itens
+
+def _ler_nfe(content):
+    try:
+        return varrer_nfe(content)
+    except ET.ParseError:
+        # Bytes fora do encoding declarado: repete com a mesma decodificação tolerante de antes
+        return varrer_nfe(content.decode('utf-8', errors='replace').encode('utf-8'))
+
+# --- ACUMULADOR COLUNAR (SUBSTITUI A LISTA DE DICTS) ---
+COLUNAS_NOTA = ["TIPO_SISTEMA", "CHAVE_ACESSO", "NUM_NF", "DATA_EMISSAO", "CNPJ_EMIT", "UF_EMIT", "CNPJ_DEST", "IE_DEST", "UF_DEST"]
+COLUNAS_ITEM = ["CFOP", "NCM", "VPROD", "BC-ICMS", "ALQ-ICMS", "VLR-ICMS", "CST-ICMS", "VAL-ICMS-ST", "IE_SUBST", "VAL-DIFAL", "VAL-FCP-DEST", "VAL-FCP-ST"]
+COLUNAS_VALOR = ["VPROD", "BC-ICMS", "ALQ-ICMS", "VLR-ICMS", "VAL-ICMS-ST", "VAL-DIFAL", "VAL-FCP-DEST", "VAL-FCP-ST"]
+COLUNAS_XML = COLUNAS_NOTA + COLUNAS_ITEM + ["Status"]
+COLUNAS_CATEGORIA = ["UF_EMIT", "UF_DEST", "CFOP", "CST-ICMS"]
+STATUS_INICIAL = "AGUARDANDO AUTENTICIDADE"
+VERSAO_ESQUEMA_XML = 2   # suba ao mudar a extração: invalida o cache persistente de notas
+ESQUEMA_XML = f"{VERSAO_ESQUEMA_XML}|" + ",".join(COLUNAS_XML)
+
+class ColunasXML:
+    """
+    Acumula as notas por coluna: o cabeçalho é guardado uma vez por nota (repetido só no DataFrame final),
+    os valores monetários vão para arrays float64 e os textos repetidos (CFOP, NCM, CST) são reaproveitados.
+    Os valores chegam como o texto do XML e são convertidos juntos, lote a lote, por numeros_br.
+    """
+    def __init__(self):
+        self.notas = {c: [] for c in COLUNAS_NOTA}
+        self.qtd_itens = array('q')
+        self.itens = {c: (array('d') if c in COLUNAS_VALOR else []) for c in COLUNAS_ITEM}
+        self._brutos = {c: [] for c in COLUNAS_VALOR}
+        self._textos = {}
+        self.falhas = 0   # XMLs que não puderam ser lidos
+
+    def __len__(self):
+        return sum(self.qtd_itens)
+
+    def adicionar_nota(self, cabecalho, itens):
+        if not itens: return
+        for c, v in zip(COLUNAS_NOTA, cabecalho): self.notas[c].append(v)
+        self.qtd_itens.append(len(itens))
+        textos = self._textos
+        for c, valores in zip(COLUNAS_ITEM, zip(*itens)):
+            if c in COLUNAS_VALOR: self._brutos[c].extend(valores)
+            else: self.itens[c].extend(textos.setdefault(v, v) for v in valores)
+
+    def converter_valores(self):
+        """Textos pendentes -> float64 numa chamada só para todas as colunas de valor (mesmo resultado do safe_float)."""
+        tamanhos = [len(self._brutos[c]) for c in COLUNAS_VALOR]
+        if not any(tamanhos): return
+        numeros = numeros_br([v for c in COLUNAS_VALOR for v in self._brutos[c]], 0.0, 4)
+        partes = dict(zip(COLUNAS_VALOR, np.split(numeros, np.cumsum(tamanhos)[:-1])))
+        partes['VAL-DIFAL'] = partes['VAL-DIFAL'] + partes['VAL-FCP-DEST']   # vICMSUFDest + vFCPUFDest
+        for c in COLUNAS_VALOR:
+            self.itens[c].frombytes(partes[c].tobytes())
+            self._brutos[c] = []
+
+    def estender(self, outro):
+        self.converter_valores(); outro.converter_valores()
+        self.falhas += outro.falhas
+        for c in COLUNAS_NOTA: self.notas[c].extend(outro.notas[c])
+        self.qtd_itens.extend(outro.qtd_itens)
+        for c in COLUNAS_ITEM: self.itens[c].extend(outro.itens[c])
+
+    def para_dataframe(self):
+        self.converter_valores()
+        repeticoes = np.frombuffer(self.qtd_itens, dtype=np.int64) if self.qtd_itens else np.zeros(0, dtype=np.int64)
+        total = int(repeticoes.sum())
+        # UF_EMIT e UF_DEST compartilham as categorias para continuarem comparáveis entre si
+        ufs = pd.CategoricalDtype(sorted(set(self.notas['UF_EMIT']) | set(self.notas['UF_DEST'])))
+
+        dados = {}
+        for c in COLUNAS_NOTA:
+            if c in COLUNAS_CATEGORIA:
+                codigos = pd.Categorical(self.notas[c], dtype=ufs).codes
+                dados[c] = pd.Categorical.from_codes(np.repeat(codigos, repeticoes), dtype=ufs)
+            else:
+                dados[c] = np.repeat(np.array(self.notas[c], dtype=object), repeticoes)
+        for c in COLUNAS_ITEM:
+            if c in COLUNAS_VALOR: dados[c] = np.frombuffer(self.itens[c], dtype=np.float64) if total else np.zeros(0)
+            elif c in COLUNAS_CATEGORIA: dados[c] = pd.Categorical(self.itens[c])
+            else: dados[c] = np.array(self.itens[c], dtype=object)
+        dados["Status"] = np.full(total, STATUS_INICIAL, dtype=object)
+        return pd.DataFrame(dados, columns=COLUNAS_XML)
+
 # --- MOTOR DE PROCESSAMENTO XML (ORDEM EXATA DAS 22 COLUNAS) ---
-def processar_conteudo_xml(content, dados_lista, cnpj_empresa_auditada):
+def extrair_nota(content, cnpj_empresa_auditada):
+    """Devolve (cabecalho, itens) da NF-e na ordem de COLUNAS_NOTA / COLUNAS_ITEM, ou None se não for NF-e."""
+    nota = _ler_nfe(content)
+    if nota is None: return None
+    chave, cab, itens = nota
+
+    ide = cab.get('ide', {}); emit = cab.get('emit', {}); dest = cab.get('dest', {})
+    cnpj_emit = re.sub(r'\D', '', emit.get('CNPJ', ""))
+    cnpj_alvo = re.sub(r'\D', '', str(cnpj_empresa_auditada))
+    tipo_nf = ide.get('tpNF', "")
+    tipo_operacao = "SAIDA" if (cnpj_emit == cnpj_alvo and tipo_nf == '1') else "ENTRADA"
+
+    cabecalho = (
+        tipo_operacao,                                      # 1  TIPO_SISTEMA
+        str(chave).strip(),                                 # 2  CHAVE_ACESSO
+        ide.get('nNF', ""),                                 # 3  NUM_NF
+        ide.get('dhEmi', "") or ide.get('dEmi', ""),        # 4  DATA_EMISSAO
+        cnpj_emit,                                          # 5  CNPJ_EMIT
+        emit.get('UF', ""),                                 # 6  UF_EMIT
+        re.sub(r'\D', '', dest.get('CNPJ', "")),            # 7  CNPJ_DEST
+        dest.get('IE', ""),                                 # 8  IE_DEST
+        dest.get('UF', ""),                                 # 9  UF_DEST
+    )
+
+    linhas = []
+    for item in itens:
+        prod = item.get('prod', {}); imp = item.get('imposto', {}); icms_no = item.get('ICMS', {})
+        linhas.append((
+            prod.get('CFOP', ""),                                                   # 10 CFOP
+            tratar_ncm_texto(prod.get('NCM', "")),                                  # 11 NCM
+            prod.get('vProd', ""),                                                  # 12 VPROD
+            icms_no.get('vBC', ""),                                                 # 13 BC-ICMS
+            icms_no.get('pICMS', ""),                                               # 14 ALQ-ICMS
+            icms_no.get('vICMS', ""),                                               # 15 VLR-ICMS
+            icms_no.get('orig', "") + (icms_no.get('CST', "") or icms_no.get('CSOSN', "")), # 16 CST-ICMS
+            icms_no.get('vICMSST', ""),                                             # 17 VAL-ICMS-ST
+            str(icms_no.get('IEST', "")).strip(),                                   # 18 IE_SUBST
+            imp.get('vICMSUFDest', ""),                                             # 19 VAL-DIFAL (+ vFCPUFDest na conversão)
+            imp.get('vFCPUFDest', ""),                                              # 20 VAL-FCP-DEST
+            icms_no.get('vFCPST', ""),                                              # 21 VAL-FCP-ST
+        ))
+    # 22 Status: preenchido com STATUS_INICIAL no DataFrame (placeholder para o merge)
+    return cabecalho, linhas
+
+def processar_conteudo_xml(content, dados, cnpj_empresa_auditada):
     try:
-        xml_str = content.decode('utf-8', errors='replace')
-        xml_str_limpa = re.sub(r'\sxmlns(:\w+)?="[^"]+"', '', xml_str) 
-        root = ET.fromstring(xml_str_limpa)
-        inf = root.find('.//infNFe')
-        if inf is None: return 
-        
-        ide = root.find('.//ide'); emit = root.find('.//emit'); dest = root.find('.//dest')
-        cnpj_emit = re.sub(r'\D', '', buscar_tag_recursiva('CNPJ', emit))
-        cnpj_alvo = re.sub(r'\D', '', str(cnpj_empresa_auditada))
-        tipo_nf = buscar_tag_recursiva('tpNF', ide)
-        tipo_operacao = "SAIDA" if (cnpj_emit == cnpj_alvo and tipo_nf == '1') else "ENTRADA"
-        chave = inf.attrib.get('Id', '')[3:]
-
-        for det in root.findall('.//det'):
-            prod = det.find('prod'); imp = det.find('imposto'); icms_no = det.find('.//ICMS')
-            
-            linha = {
-                "TIPO_SISTEMA": tipo_operacao,                 # 1
-                "CHAVE_ACESSO": str(chave).strip(),            # 2
-                "NUM_NF": buscar_tag_recursiva('nNF', ide),     # 3
-                "DATA_EMISSAO": buscar_tag_recursiva('dhEmi', ide) or buscar_tag_recursiva('dEmi', ide), # 4
-                "CNPJ_EMIT": cnpj_emit,                        # 5
-                "UF_EMIT": buscar_tag_recursiva('UF', emit),   # 6
-                "CNPJ_DEST": re.sub(r'\D', '', buscar_tag_recursiva('CNPJ', dest)), # 7
-                "IE_DEST": buscar_tag_recursiva('IE', dest),   # 8
-                "UF_DEST": buscar_tag_recursiva('UF', dest),   # 9
-                "CFOP": buscar_tag_recursiva('CFOP', prod),    # 10
-                "NCM": tratar_ncm_texto(buscar_tag_recursiva('NCM', prod)), # 11
-                "VPROD": safe_float(buscar_tag_recursiva('vProd', prod)), # 12
-                "BC-ICMS": safe_float(buscar_tag_recursiva('vBC', icms_no)), # 13
-                "ALQ-ICMS": safe_float(buscar_tag_recursiva('pICMS', icms_no)), # 14
-                "VLR-ICMS": safe_float(buscar_tag_recursiva('vICMS', icms_no)), # 15
-                "CST-ICMS": (buscar_tag_recursiva('orig', icms_no) + (buscar_tag_recursiva('CST', icms_no) or buscar_tag_recursiva('CSOSN', icms_no))), # 16
-                "VAL-ICMS-ST": safe_float(buscar_tag_recursiva('vICMSST', icms_no)), # 17
-                "IE_SUBST": str(buscar_tag_recursiva('IEST', icms_no)).strip(),      # 18
-                "VAL-DIFAL": safe_float(buscar_tag_recursiva('vICMSUFDest', imp)) + safe_float(buscar_tag_recursiva('vFCPUFDest', imp)), # 19
-                "VAL-FCP-DEST": safe_float(buscar_tag_recursiva('vFCPUFDest', imp)), # 20
-                "VAL-FCP-ST": safe_float(buscar_tag_recursiva('vFCPST', icms_no)),    # 21
-                "Status": "AGUARDANDO AUTENTICIDADE" # 22 (Placeholder para o merge)
-            }
-            dados_lista.append(linha)
-    except: pass
-
-def extrair_xml(files, cnpj_auditado):
-    dados = []
-    if not files: return pd.DataFrame(), pd.DataFrame()
+        nota = extrair_nota(content, cnpj_empresa_auditada)
+        if nota: dados.adicionar_nota(*nota)
+        return nota
+    except Exception:
+        dados.falhas += 1   # contado por lote: no modo paralelo a falha acontece em outro processo
+        return None
+
+# --- INGESTÃO EM LOTES (SERIAL OU EM PROCESSOS PARALELOS) ---
+LOTE_XML = 250           # XMLs por lote enviado a cada processo
+MIN_XML_PARALELO = 500   # abaixo disso o custo de subir o pool não compensa
+
+def _iterar_xmls(files):
     for f in files:
+        if isinstance(f, (str, os.PathLike)):   # caminho em disco (modo lote): abre só na hora de ler
+            with open(f, 'rb') as arq: yield from _iterar_xmls([arq])
+            continue
         f.seek(0)
-        if f.name.endswith('.xml'): processar_conteudo_xml(f.read(), dados, cnpj_auditado)
+        if f.name.endswith('.xml'):
+            content = f.read(); contar_bytes(len(content)); avancar(); yield content
         elif f.name.endswith('.zip'):
             with zipfile.ZipFile(f) as z:
                 for n in z.namelist():
                     if n.lower().endswith('.xml'):
-                        with z.open(n) as xml: processar_conteudo_xml(xml.read(), dados, cnpj_auditado)
-    df = pd.DataFrame(dados)
-    return df[df['TIPO_SISTEMA'] == "ENTRADA"].copy(), df[df['TIPO_SISTEMA'] == "SAIDA"].copy()
+                        with z.open(n) as xml: content = xml.read()
+                        contar_bytes(len(content)); avancar(); yield content
+
+def _contar_xmls(files):
+    total = 0
+    for f in files:
+        nome = str(f) if isinstance(f, (str, os.PathLike)) else f.name
+        if nome.endswith('.xml'): total += 1
+        elif nome.endswith('.zip'):
+            if not isinstance(f, (str, os.PathLike)): f.seek(0)
+            with zipfile.ZipFile(f) as z: total += sum(1 for n in z.namelist() if n.lower().endswith('.xml'))
+    return total
+
+def _consultar_cache(conteudos, cache):
+    # Cada entrada é (conteúdo, chave, hash, blob do cache); notas já vistas não passam de novo pelo parser
+    for content in conteudos:
+        chave = chave_rapida(content) if cache else None
+        if chave is None: yield (content, None, None, None); continue
+        h = hash_conteudo(content)
+        try: blob = cache.buscar(chave, h)
+        except sqlite3.Error: blob = None   # leitura com erro vale como nota nova
+        yield (None, None, None, blob) if blob is not None else (content, chave, h, None)
+
+def _agrupar_em_lotes(entradas, tamanho):
+    lote = []
+    for e in entradas:
+        lote.append(e)
+        if len(lote) == tamanho: yield lote; lote = []
+    if lote: yield lote
+
+def _processar_lote(entradas, cnpj_auditado):
+    """
+    Processa um lote e devolve (ColunasXML, novas): o resultado já colunar (menos overhead de pickle
+    entre processos) e as notas recém-extraídas, serializadas para o cache.
+    """
+    dados = ColunasXML(); novas = []
+    for content, chave, h, blob in entradas:
+        if blob is not None:
+            dados.adicionar_nota(*desserializar_nota(blob)); continue
+        nota = processar_conteudo_xml(content, dados, cnpj_auditado)
+        if nota is not None and chave: novas.append((chave, h, serializar_nota(nota)))
+    dados.converter_valores()   # no processo do lote: volta só arrays float64 pelo pickle
+    return dados, novas
+
+def _processar_em_paralelo(lotes, cnpj_auditado, workers):
+    # Mantém no máximo 2 lotes por processo em voo e devolve os resultados na ordem de envio
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pendentes = deque()
+        for lote in lotes:
+            pendentes.append(pool.submit(_processar_lote, lote, cnpj_auditado))
+            if len(pendentes) >= workers * 2: yield pendentes.popleft().result()
+        while pendentes: yield pendentes.popleft().result()
+
+def _abrir_cache(cnpj_auditado):
+    try: return CacheNotas(cnpj_auditado, ESQUEMA_XML)
+    except (sqlite3.Error, OSError): return None
+
+def extrair_xml(files, cnpj_auditado, workers=None, usar_cache=True):
+    if not files: return pd.DataFrame(), pd.DataFrame()
+    with etapa('extrair_xml') as medida:
+        workers = workers or os.cpu_count() or 1
+        cache = _abrir_cache(cnpj_auditado) if usar_cache else None
+        gravar_cache = cache is not None
+
+        try:
+            lotes = _agrupar_em_lotes(_consultar_cache(_iterar_xmls(files), cache), LOTE_XML)
+            if workers > 1 and _contar_xmls(files) >= MIN_XML_PARALELO:
+                blocos = _processar_em_paralelo(lotes, cnpj_auditado, workers)
+            else:
+                blocos = (_processar_lote(lote, cnpj_auditado) for lote in lotes)
+
+            dados = ColunasXML()
+            for bloco, novas in blocos:
+                dados.estender(bloco)
+                if gravar_cache and novas:
+                    # o cache é só um atalho: travado ou com erro, para de gravar e a extração segue
+                    try: cache.guardar(novas)
+                    except sqlite3.Error as e: registrar_excecao(e); gravar_cache = False
+        finally:
+            if cache:
+                try: cache.fechar() if gravar_cache else cache.con.close()
+                except sqlite3.Error as e: registrar_excecao(e)
+
+        registrar_excecao("XML ilegível ou fora do leiaute, ignorado", quantidade=dados.falhas)
+        df = dados.para_dataframe()
+        del dados
+        medida.linhas = len(df)
+        return df[df['TIPO_SISTEMA'] == "ENTRADA"].copy(), df[df['TIPO_SISTEMA'] == "SAIDA"].copy()
+
+# --- AUTENTICIDADE (STATUS DA NOTA NA SEFAZ) ---
+def aplicar_autenticidade(df_xs, ae=None, as_f=None, df_xe=None):
+    """Preenche a coluna Status (a 22ª) pelo índice de autenticidade, montado uma vez para entradas e saídas."""
+    with etapa('autenticidade', linhas=len(df_xs) + (len(df_xe) if df_xe is not None else 0)) as medida:
+        medida.bytes = tamanho_arquivos(ae, as_f)
+        indice = IndiceAutenticidade.de_arquivos(ae, as_f)
+        df_xs['Status'] = indice.situacao(df_xs['CHAVE_ACESSO'])
+        if df_xe is not None and not df_xe.empty:
+            df_xe['Status'] = indice.situacao(df_xe['CHAVE_ACESSO'])
+        return indice
 
 # --- GERAÇÃO DO EXCEL FINAL (CRUZANDO COM AUTENTICIDADE) ---
-def gerar_analise_xml(df_xe, df_xs, cod_cliente, writer, regime, is_ret, ae=None, as_f=None, ge=None, gs=None):
-    try: gerar_aba_resumo(writer)
-    except: pass
+def gerar_analise_xml(df_xe, df_xs, cod_cliente, writer, regime, is_ret, ae=None, as_f=None, ge=None, gs=None, incremental=False,
+                      exportacao=None):
+    with etapa('aba_resumo'):
+        try: gerar_aba_resumo(writer)
+        except Exception as e: registrar_excecao(e)
     
     if not df_xs.empty:
-        # MAPEAMENTO DO STATUS
-        st_map = {}
-        for f_auth in ([ae] if ae else []) + ([as_f] if as_f else []):
-            try:
-                f_auth.seek(0)
-                if f_auth.name.endswith('.xlsx'): df_a = pd.read_excel(f_auth, header=None)
-                else: df_a = pd.read_csv(f_auth, header=None, sep=None, engine='python')
-                df_a[0] = df_a[0].astype(str).str.replace('NFe', '').str.strip()
-                st_map.update(df_a.set_index(0)[5].to_dict())
-            except: continue
-        
-        # Preenche a coluna Status (que é a 22ª)
-        df_xs['Status'] = df_xs['CHAVE_ACESSO'].map(st_map).fillna('⚠️ N/Encontrada')
-        
-        # Agora chama as auditorias que vão colar as análises depois do Status
-        processar_icms(df_xs, writer, cod_cliente, df_xe)
-        processar_ipi(df_xs, writer, cod_cliente)
-        processar_pc(df_xs, writer, cod_cliente, regime)
-        processar_difal(df_xs, writer)
-        try: gerar_resumo_uf(df_xs, writer, df_xe)
-        except: pass
+        aplicar_autenticidade(df_xs, ae, as_f, df_xe)
+
+        if incremental:
+            # Só as competências com notas novas/alteradas desde a última rodada do cliente são auditadas
+            with etapa('apuracao_incremental', linhas=len(df_xs)):
+                processar_incremental(df_xs, writer, cod_cliente, regime, df_xe, exportacao=exportacao)
+        else:
+            # Agora chama as auditorias que vão colar as análises depois do Status
+            # (passe único: ICMS, IPI, PIS/COFINS e DIFAL sobre o mesmo df_xs, sem cópias da base)
+            with etapa('auditorias', linhas=len(df_xs)):
+                processar_auditorias(df_xs, writer, cod_cliente, regime, df_xe, exportacao)
+            try: gerar_resumo_uf(df_xs, writer, df_xe)
+            except Exception as e:
+                registrar_excecao(e, onde='apuracao_difal')
+                erro(f"Resumo DIFAL/ST/FCP por UF não gerado: {e}")
+        if exportacao is not None:
+            with etapa('colunar:DIFAL_ST_FECP'): exportacao.gravar_resumo_uf(df_xs, df_xe)
+
+    # Gerenciais: copiados para o relatório em chunks e cruzados com os itens dos XMLs
+    if ge or gs:
+        df_ge, df_gs = gerar_abas_gerenciais(writer, ge, gs)
+        with etapa('conciliacao', linhas=len(df_ge) + len(df_gs)):
+            gerar_abas_conciliacao(writer, df_xe, df_xs, df_ge, df_gs)
+
+# --- RELATÓRIO FINAL GRAVADO EM DISCO (STREAMING) ---
+def gerar_relatorio(df_xe, df_xs, cod_cliente, regime, is_ret, ae=None, as_f=None, ge=None, gs=None, caminho=None,
+                    pasta_colunar=None, formato_colunar="parquet", incremental=False):
+    """
+    Monta o relatório final num .xlsx em disco (xlsxwriter constant_memory) e devolve o caminho do arquivo.
+    Com `pasta_colunar`, as mesmas abas de auditoria também saem em Parquet/Arrow ao lado do Excel, com as
+    análises calculadas uma vez só para os dois. Com `incremental`, reaproveita as competências já apuradas
+    que não mudaram (Apuracoes/incremental.py).
+    """
+    # sem pyarrow a exportação falha aqui, antes de qualquer cálculo ou arquivo
+    exportacao = ExportacaoColunar(cod_cliente, pasta_colunar, formato_colunar) if pasta_colunar and not df_xs.empty else None
+    temporario = caminho is None
+    writer, caminho = abrir_relatorio(caminho)
+    with etapa('relatorio', linhas=len(df_xs)):
+        try:
+            # a exportação colunar corre dentro de gerar_analise_xml: fechamento e exportação na mesma limpeza
+            gerar_analise_xml(df_xe, df_xs, cod_cliente, writer, regime, is_ret, ae, as_f, ge, gs, incremental, exportacao)
+            with etapa('excel:fechar'): writer.close()
+        except BaseException:
+            # erro ou cancelamento (também no fechamento): o .xlsx temporário pela metade não fica para trás
+            try: writer.close()
+            except Exception as e: registrar_excecao(e)
+            if temporario and os.path.exists(caminho): os.remove(caminho)
+            raise
+    return caminho
+
+# --- ANÁLISE COMPLETA COM PROGRESSO E MEMOIZAÇÃO (APP) ---
+PESO_EXTRACAO = 0.15   # fração da barra de progresso dada à leitura dos XMLs; o resto é o relatório (Excel domina)
+
+def chaves_analise(files, cnpj_auditado, cod_cliente, regime, is_ret, ae=None, as_f=None, ge=None, gs=None,
+                   pasta_colunar=None, incremental=False):
+    """(chave da extração, chave do relatório) no cache de resultados: o conteúdo e o contexto que os produzem."""
+    chave_xml = chave_resultado('xml', versao_codigo(), re.sub(r'\D', '', str(cnpj_auditado)), hash_arquivos(files))
+    chave_relatorio = chave_resultado('relatorio', chave_xml, cod_cliente, regime, bool(is_ret), hash_arquivos(ae, as_f, ge, gs),
+                                      assinatura_arquivo(caminho_gabarito(cod_cliente)), assinatura_arquivo(caminho_tipi()),
+                                      pasta_colunar, bool(incremental))
+    return chave_xml, chave_relatorio
+
+def executar_analise(files, cnpj_auditado, cod_cliente, regime, is_ret, ae=None, as_f=None, ge=None, gs=None,
+                     caminho=None, pasta_colunar=None, incremental=False, cache=None):
+    """
+    Extração + relatório, em fases para a barra de progresso (progresso.py): XMLs lidos na extração e linhas
+    gravadas no Excel. Cancelada, levanta progresso.AnaliseCancelada no próximo ponto de verificação.
+    Com `cache` (cache_resultados.py), a mesma submissão devolve o relatório guardado e os mesmos XMLs
+    (ex.: só o regime mudou) pulam a extração; o relatório só é guardado de rodadas limpas e sem exportação
+    colunar. Devolve (caminho do relatório, origem), com origem
+    'relatorio' (nada refeito), 'xml' (extração reaproveitada) ou None.
+    """
+    chave_xml = chave_relatorio = None
+    if cache is not None:
+        chave_xml, chave_relatorio = chaves_analise(files, cnpj_auditado, cod_cliente, regime, is_ret, ae, as_f, ge, gs,
+                                                    pasta_colunar, incremental)
+        # com exportação Parquet/Arrow o relatório não vem do cache: a exportação precisa rodar de novo
+        if not pasta_colunar:
+            destino = caminho
+            if destino is None: fd, destino = tempfile.mkstemp(prefix="Sentinela_", suffix=".xlsx"); os.close(fd)
+            if cache.buscar_arquivo(chave_relatorio, destino):
+                fase("Relatório reaproveitado do cache", 1.0)
+                return destino, 'relatorio'
+            if caminho is None: os.remove(destino)
+
+    origem = None
+    frames = cache.buscar_objeto(chave_xml) if cache is not None else None
+    if frames is not None:
+        df_xe, df_xs = frames; origem = 'xml'
+    else:
+        fase("Lendo XMLs", PESO_EXTRACAO, _contar_xmls(files) if files else 0)
+        df_xe, df_xs = extrair_xml(files, cnpj_auditado)
+        # guardado antes do relatório, que preenche o Status e as análises nos próprios frames
+        if cache is not None: cache.guardar_objeto(chave_xml, (df_xe, df_xs))
+    # linhas previstas: as 4 auditorias ~ uma linha por item de saída; gerencial + conciliação por lado informado
+    fase("Gerando relatório", 1 - PESO_EXTRACAO if origem is None else 1.0, len(df_xs) * (4 + (2 if ge or gs else 0)))
+    with contar_excecoes() as excecoes:
+        caminho = gerar_relatorio(df_xe, df_xs, cod_cliente, regime, is_ret, ae, as_f, ge, gs, caminho=caminho,
+                                  pasta_colunar=pasta_colunar, incremental=incremental)
+    # só vai para o cache o relatório de uma rodada limpa: nada cancelado nem engolido por um `except` no caminho
+    progresso = progresso_atual()
+    limpa = not excecoes.total and not (progresso is not None and progresso.cancelado)
+    if cache is not None and limpa and not pasta_colunar:
+        cache.guardar_arquivo(chave_relatorio, caminho)
+    return caminho, origem
+
+# --- EXPORTAÇÃO SÓ COLUNAR (SEM EXCEL) ---
+def gerar_exportacao_colunar(df_xe, df_xs, cod_cliente, regime, ae=None, as_f=None, pasta=None, formato="parquet"):
+    """Mesmas auditorias do relatório, gravadas só em Parquet/Arrow particionado. Devolve {aba: linhas}."""
+    if df_xs.empty: return {}
+    aplicar_autenticidade(df_xs, ae, as_f, df_xe)
+    return exportar_auditorias(df_xs, cod_cliente, regime, df_xe, pasta or PASTA_EXPORTACAO, formato)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos do Sentinela são importados da raiz do repositório (como no app e no lote)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+import re
+import random
+import xml.etree.ElementTree as ET
+import pandas as pd
+import pytest
+
+from sentinela_core import ColunasXML, COLUNAS_XML, processar_conteudo_xml
+from Benchmark.corpus_nfe import gerar_nota, CNPJ_AUDITADO
+
+# --- PARIDADE DO EXTRATOR COM O LEGADO ---
+# `_extrair_legado` é o processar_conteudo_xml anterior à leitura em passada única (decodifica, tira os
+# xmlns com regex e busca cada campo com um laço Python), copiado aqui como referência. Para notas com
+# namespace padrão ou sem namespace as 22 colunas têm de ser as mesmas. Com prefixo (nfe:NFe) o legado
+# falhava no parse (prefixo sem declaração) e descartava a nota; o extrator atual a lê igual às demais.
+
+def _safe_float(v):
+    if v is None or pd.isna(v): return 0.0
+    txt = str(v).strip().upper()
+    if txt in ['NT', '', 'N/A', 'ISENTO', 'NULL', 'ZERO', '-', ' ']: return 0.0
+    try:
+        txt = txt.replace('R$', '').replace(' ', '').replace('%', '').strip()
+        if ',' in txt and '.' in txt: txt = txt.replace('.', '').replace(',', '.')
+        elif ',' in txt: txt = txt.replace(',', '.')
+        return round(float(txt), 4)
+    except: return 0.0
+
+def _buscar(tag_alvo, no):
+    if no is None: return ""
+    for elemento in no.iter():
+        if elemento.tag.split('}')[-1] == tag_alvo: return elemento.text if elemento.text else ""
+    return ""
+
+def _extrair_legado(content, cnpj_empresa_auditada):
+    linhas = []
+    try:
+        root = ET.fromstring(re.sub(r'\sxmlns(:\w+)?="[^"]+"', '', content.decode('utf-8', errors='replace')))
+        inf = root.find('.//infNFe')
+        if inf is None: return linhas
+        ide = root.find('.//ide'); emit = root.find('.//emit'); dest = root.find('.//dest')
+        cnpj_emit = re.sub(r'\D', '', _buscar('CNPJ', emit))
+        tipo = "SAIDA" if (cnpj_emit == re.sub(r'\D', '', str(cnpj_empresa_auditada)) and _buscar('tpNF', ide) == '1') else "ENTRADA"
+        for det in root.findall('.//det'):
+            prod = det.find('prod'); imp = det.find('imposto'); icms_no = det.find('.//ICMS')
+            linhas.append([
+                tipo, str(inf.attrib.get('Id', '')[3:]).strip(), _buscar('nNF', ide), _buscar('dhEmi', ide) or _buscar('dEmi', ide),
+                cnpj_emit, _buscar('UF', emit), re.sub(r'\D', '', _buscar('CNPJ', dest)), _buscar('IE', dest), _buscar('UF', dest),
+                _buscar('CFOP', prod), re.sub(r'\D', '', _buscar('NCM', prod)), _safe_float(_buscar('vProd', prod)),
+                _safe_float(_buscar('vBC', icms_no)), _safe_float(_buscar('pICMS', icms_no)), _safe_float(_buscar('vICMS', icms_no)),
+                _buscar('orig', icms_no) + (_buscar('CST', icms_no) or _buscar('CSOSN', icms_no)),
+                _safe_float(_buscar('vICMSST', icms_no)), str(_buscar('IEST', icms_no)).strip(),
+                _safe_float(_buscar('vICMSUFDest', imp)) + _safe_float(_buscar('vFCPUFDest', imp)),
+                _safe_float(_buscar('vFCPUFDest', imp)), _safe_float(_buscar('vFCPST', icms_no)), "AGUARDANDO AUTENTICIDADE",
+            ])
+    except Exception:
+        pass
+    return linhas
+
+def _extrair_atual(conteudos):
+    dados = ColunasXML()
+    for content in conteudos: processar_conteudo_xml(content, dados, CNPJ_AUDITADO)
+    return dados.para_dataframe().astype(object).reset_index(drop=True)
+
+@pytest.fixture(scope="module")
+def corpus():
+    rnd = random.Random(7)
+    notas = [gerar_nota(rnd, n, rnd.randint(1, 6), rnd.random() < 0.7)[0] for n in range(1, 301)]
+    return [c for c in notas if b'nfe:NFe' not in c], [c for c in notas if b'nfe:NFe' in c]
+
+def test_paridade_com_o_extrator_legado(corpus):
+    sem_prefixo, _ = corpus
+    legado = pd.DataFrame([l for c in sem_prefixo for l in _extrair_legado(c, CNPJ_AUDITADO)], columns=COLUNAS_XML, dtype=object)
+    assert len(legado) > 0
+    pd.testing.assert_frame_equal(_extrair_atual(sem_prefixo), legado)
+
+def test_namespace_prefixado_agora_e_lido(corpus):
+    _, prefixadas = corpus
+    assert prefixadas, "o corpus sintético deveria trazer notas com prefixo nfe:"
+    assert all(_extrair_legado(c, CNPJ_AUDITADO) == [] for c in prefixadas)
+    # sem o prefixo (namespace padrão) o legado lê a mesma nota: o extrator atual tem de dar as mesmas linhas
+    padrao = [re.sub(rb'<(/?)nfe:', rb'<\1', c).replace(b'xmlns:nfe=', b'xmlns=') for c in prefixadas]
+    legado = pd.DataFrame([l for c in padrao for l in _extrair_legado(c, CNPJ_AUDITADO)], columns=COLUNAS_XML, dtype=object)
+    assert len(legado) > 0
+    pd.testing.assert_frame_equal(_extrair_atual(prefixadas), legado)